@@ -0,0 +1,306 @@
+"""
+Bulk post generation through the OpenAI Batch API.
+
+Prepares a JSONL file of structured post requests for upcoming slots, for the
+default account or every configured account, submits it, polls the batch
+until it finishes and ingests the results into the quote history and the
+post queue. Batch requests are billed at batch pricing and do not count
+against the synchronous rate limits.
+
+Usage:
+    python -m batch_generator run --slots 14 [--accounts]
+    python -m batch_generator prepare --slots 14 --output batch.jsonl
+    python -m batch_generator submit batch.jsonl
+    python -m batch_generator poll BATCH_ID
+    python -m batch_generator ingest BATCH_ID
+"""
+
+import argparse
+import json
+import time
+import httpx
+from config import get_config, get_int
+from content_generator import ContentGenerator, get_client, parse_post
+from instrumentation import span
+from mongo_manager import (
+    HISTORY_SIZE,
+    account_scope,
+    get_batch_ingestion,
+    get_quote_index,
+    get_recent_quotes,
+    insert_quote,
+    mark_batch_ingested,
+    save_batch,
+    save_batch_outcome,
+)
+from quote_bot import QuoteBot
+from quote_scoring import DOMAIN_KEYWORDS
+from scheduler import load_accounts
+
+DEFAULT_ACCOUNT = "default"
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+# Rotating domains keeps requests written against the same history from
+# converging on the same quote.
+DOMAINS = tuple(DOMAIN_KEYWORDS)
+
+
+def prepare_requests(config, slots, accounts=None):
+    """
+    Build one structured post request per slot and account.
+
+    Returns:
+        A list of Batch API request dictionaries, whose custom_id is
+        "{account}/{slot}".
+    """
+    requests = []
+    for account in accounts or [None]:
+        account_id = account["id"] if account else None
+        account_config = dict(config, **account["config"]) if account else config
+        with account_scope(account_id):
+            recent_quotes = get_recent_quotes(
+                get_int(account_config, "QUOTE_DIGEST_SIZE", 5),
+                history_size=get_int(
+                    account_config, "QUOTE_HISTORY_SIZE", HISTORY_SIZE
+                ),
+            )
+        content_generator = ContentGenerator(account_config)
+        for slot in range(slots):
+            requests.append(
+                {
+                    "custom_id": f"{account_id or DEFAULT_ACCOUNT}/{slot}",
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": content_generator.post_request(
+                        recent_quotes, DOMAINS[slot % len(DOMAINS)]
+                    ),
+                }
+            )
+    return requests
+
+
+def slot_domain(result_id):
+    """
+    The domain the request of a result was steered towards, from the slot in
+    its result ID.
+    """
+    slot = int(result_id.rsplit("/", 2)[-2])
+    return DOMAINS[slot % len(DOMAINS)]
+
+
+def to_jsonl(requests):
+    return "\n".join(json.dumps(request) for request in requests).encode("utf-8")
+
+
+def submit_batch(data):
+    """
+    Upload a JSONL input file and create a batch of chat completions from it.
+
+    Returns:
+        The batch object, also recorded in the batches collection.
+    """
+    client = get_client()
+    with span("openai.batch_submit", bytes=len(data)):
+        input_file = client.files.create(file=("batch.jsonl", data), purpose="batch")
+        batch = api_request(
+            "post",
+            "/batches",
+            body={
+                "input_file_id": input_file.id,
+                "endpoint": "/v1/chat/completions",
+                "completion_window": "24h",
+            },
+        ).json()
+    save_batch(batch)
+    return batch
+
+
+def api_request(method, path, **kwargs):
+    """
+    Call a Batch API endpoint through the OpenAI client, which handles the
+    base URL, authentication and retries. The pinned SDK has no typed batch
+    resource, so the raw response is returned.
+    """
+    return getattr(get_client(), method)(path, cast_to=httpx.Response, **kwargs)
+
+
+def get_batch(batch_id):
+    return api_request("get", f"/batches/{batch_id}").json()
+
+
+def wait_for_batch(batch_id, interval=60, deadline=24 * 60 * 60):
+    """
+    Poll a batch until it reaches a terminal status, checking quickly at
+    first and then every interval seconds.
+    """
+    started = time.monotonic()
+    delay = 1
+    with span("openai.batch_wait", batch=batch_id) as s:
+        while True:
+            batch = get_batch(batch_id)
+            if batch["status"] in TERMINAL_STATUSES:
+                break
+            if time.monotonic() - started >= deadline:
+                raise Exception(
+                    f"Batch {batch_id} is still {batch['status']} after {deadline}s"
+                )
+            time.sleep(delay)
+            delay = min(interval, delay * 2)
+        s.set(status=batch["status"], waited_ms=(time.monotonic() - started) * 1000)
+    save_batch(batch)
+    return batch
+
+
+def read_results(batch):
+    """
+    Download the output file of a batch.
+
+    Returns:
+        A dictionary mapping each account to a dictionary of the message
+        contents of its successful requests, keyed by result ID (the
+        custom_id and the choice index), and the number of failed requests.
+    """
+    if not batch.get("output_file_id"):
+        return {}, batch.get("request_counts", {}).get("failed", 0)
+
+    content = api_request("get", f"/files/{batch['output_file_id']}/content")
+    results = {}
+    failed = 0
+    for line in content.text.splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        response = item.get("response") or {}
+        if item.get("error") or response.get("status_code") != 200:
+            failed += 1
+            continue
+        account_id = item["custom_id"].rsplit("/", 1)[0]
+        for i, choice in enumerate(response["body"].get("choices", [])):
+            results.setdefault(account_id, {})[f"{item['custom_id']}/{i}"] = choice[
+                "message"
+            ]["content"]
+    return results, failed
+
+
+def ingest_batch(config, batch, accounts=None):
+    """
+    Add the posts of a completed batch to the quote history and the post
+    queue, generating their images. Invalid and near-duplicate posts are
+    dropped.
+
+    The outcome of every result is recorded as it is ingested, so a run that
+    stops halfway, or a post whose image could not be generated, is picked
+    up by the next run without ingesting any result twice. The batch is
+    marked ingested once every result was.
+
+    Returns:
+        A dictionary counting the posts "queued", the "duplicates" and
+        "invalid" responses dropped, the "failed" requests and the posts
+        left "pending" for the next run.
+    """
+    if batch.get("status") != "completed":
+        raise Exception(
+            f"Batch {batch['id']} is {batch.get('status')}, only completed batches are ingested"
+        )
+    summary = {"queued": 0, "duplicates": 0, "invalid": 0, "failed": 0, "pending": 0}
+    outcomes, ingested_at = get_batch_ingestion(batch["id"])
+    if ingested_at:
+        print(f"Batch {batch['id']} was already ingested, skipping.")
+        return summary
+
+    results, summary["failed"] = read_results(batch)
+    account_configs = {account["id"]: account["config"] for account in accounts or []}
+
+    for account_id, contents in results.items():
+        scope = None if account_id == DEFAULT_ACCOUNT else account_id
+        quote_bot = QuoteBot(dict(config, **account_configs.get(account_id, {})))
+        with account_scope(scope), span("batch.ingest", account=account_id):
+            quote_index = get_quote_index()
+            for result_id, content in contents.items():
+                outcome = outcomes.get(result_id)
+                if outcome in ("queued", "duplicate", "invalid"):
+                    continue
+                try:
+                    post = parse_post(content)
+                except ValueError as e:
+                    print(f"Discarded invalid batch response: {e}")
+                    save_batch_outcome(batch["id"], result_id, "invalid")
+                    summary["invalid"] += 1
+                    continue
+                # A result whose quote was accepted by an earlier run only
+                # needs its post prepared.
+                if outcome != "accepted":
+                    if quote_index.is_duplicate(post["quote_text"]) or not insert_quote(
+                        post["quote_text"],
+                        history_size=get_int(
+                            quote_bot.config, "QUOTE_HISTORY_SIZE", HISTORY_SIZE
+                        ),
+                        domain=slot_domain(result_id),
+                    ):
+                        print(f"Rejected near-duplicate quote: {post['quote_text']}")
+                        save_batch_outcome(batch["id"], result_id, "duplicate")
+                        summary["duplicates"] += 1
+                        continue
+                    save_batch_outcome(batch["id"], result_id, "accepted")
+                try:
+                    quote_bot.prepare_post(
+                        {
+                            field: post[field]
+                            for field in ("quote", "quote_text", "image_description")
+                        }
+                    )
+                except Exception as e:
+                    print(f"Could not queue {result_id}, it will be retried: {e}")
+                    summary["pending"] += 1
+                    continue
+                save_batch_outcome(batch["id"], result_id, "queued")
+                summary["queued"] += 1
+
+    if not summary["pending"]:
+        mark_batch_ingested(batch["id"])
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    for name in ("run", "prepare"):
+        command = commands.add_parser(name)
+        command.add_argument("--slots", type=int, default=7)
+        command.add_argument(
+            "--accounts",
+            action="store_true",
+            help="Generate for every configured account (see ACCOUNTS_FILE)",
+        )
+    commands.choices["prepare"].add_argument("--output", default="batch.jsonl")
+    commands.add_parser("submit").add_argument("path")
+    for name in ("poll", "ingest"):
+        command = commands.add_parser(name)
+        command.add_argument("batch_id")
+        command.add_argument("--accounts", action="store_true")
+    for name in ("run", "poll"):
+        commands.choices[name].add_argument("--interval", type=float, default=60)
+
+    args = parser.parse_args(argv)
+    config = get_config()
+    accounts = load_accounts(config) if getattr(args, "accounts", False) else None
+
+    if args.command == "prepare":
+        with open(args.output, "wb") as f:
+            f.write(to_jsonl(prepare_requests(config, args.slots, accounts)))
+        print(f"Wrote {args.output}")
+    elif args.command == "submit":
+        with open(args.path, "rb") as f:
+            print(submit_batch(f.read())["id"])
+    elif args.command == "poll":
+        print(wait_for_batch(args.batch_id, args.interval)["status"])
+    elif args.command == "ingest":
+        print(ingest_batch(config, get_batch(args.batch_id), accounts))
+    else:
+        batch = submit_batch(to_jsonl(prepare_requests(config, args.slots, accounts)))
+        batch = wait_for_batch(batch["id"], args.interval)
+        print(ingest_batch(config, batch, accounts))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Micro-benchmark of the per-platform image variants.
+
+Reports the decode time, and the encode time and output size of every
+variant, for a synthetic DALL-E sized PNG, next to the previous approach of
+decoding the image again for Instagram. With --worker, also times producing
+every variant in the worker process.
+
+Usage:
+    python -m benchmarks.image_variants --size 1024 --repeat 5 --pattern smooth
+"""
+
+import argparse
+import io
+import json
+import time
+from PIL import Image
+import image_processing
+from benchmarks.fake_servers import make_png
+from benchmarks.run_benchmark import percentile
+from image_artifact import ImageArtifact
+from image_processing import (
+    PLATFORM_VARIANTS,
+    ImageVariants,
+    decode,
+    encode_variant,
+    fits,
+)
+
+
+def make_image(size=1024, pattern="noise"):
+    """
+    A noisy PNG is the worst case for encoders; a smooth one compresses more
+    like a real illustration.
+    """
+    if pattern == "noise":
+        return make_png(size)
+    gradient = Image.radial_gradient("L").resize((size, size))
+    img = Image.merge(
+        "RGB",
+        (
+            gradient,
+            gradient.rotate(90),
+            Image.linear_gradient("L").resize((size, size)),
+        ),
+    )
+    buffer = io.BytesIO()
+    img.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def timed(run):
+    started = time.perf_counter()
+    result = run()
+    return result, time.perf_counter() - started
+
+
+def p50_ms(values):
+    return round(percentile(values, 50) * 1000, 2)
+
+
+def legacy_instagram_jpeg(data):
+    """The previous Instagram path: decode, convert and save at default quality."""
+    buffer = io.BytesIO()
+    with Image.open(io.BytesIO(data)) as img:
+        img.convert("RGB").save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+def run_image_benchmark(size=1024, repeat=5, pattern="noise", worker=False):
+    """
+    Returns:
+        A report dictionary with the source size, the decode time, one entry
+        per variant with its format, output bytes and encode time, and the
+        time to produce every variant in one pass.
+    """
+    data = make_image(size, pattern)
+    source = ImageArtifact(data)
+    decodes = []
+    encodes = {platform: [] for platform in PLATFORM_VARIANTS}
+    outputs = {}
+    totals = []
+    legacy = []
+
+    for _ in range(repeat):
+        img, elapsed = timed(lambda: decode(data))
+        decodes.append(elapsed)
+        for platform, spec in PLATFORM_VARIANTS.items():
+            if fits(source, spec):
+                outputs[platform] = (data, source.content_type, True)
+                encodes[platform].append(0.0)
+                continue
+            (encoded, content_type), elapsed = timed(lambda: encode_variant(img, spec))
+            outputs[platform] = (encoded, content_type, False)
+            encodes[platform].append(elapsed)
+
+        variants = ImageVariants(source)
+        _, elapsed = timed(
+            lambda: [variants.get(platform) for platform in PLATFORM_VARIANTS]
+        )
+        totals.append(elapsed)
+
+        legacy_jpeg, elapsed = timed(lambda: legacy_instagram_jpeg(data))
+        legacy.append(elapsed)
+
+    report = {
+        "source_bytes": len(data),
+        "pattern": pattern,
+        "decode_ms": p50_ms(decodes),
+        "variants": {
+            platform: {
+                "content_type": outputs[platform][1],
+                "bytes": len(outputs[platform][0]),
+                "passthrough": outputs[platform][2],
+                "encode_ms": p50_ms(encodes[platform]),
+            }
+            for platform in PLATFORM_VARIANTS
+        },
+        "all_variants_ms": p50_ms(totals),
+        "legacy_instagram": {"bytes": len(legacy_jpeg), "ms": p50_ms(legacy)},
+    }
+
+    if worker:
+        executor = image_processing.get_worker()
+        # The first submission pays for spawning the worker.
+        _, report["worker_startup_ms"] = timed(
+            lambda: ImageVariants(source, executor=executor).get("instagram")
+        )
+        report["worker_startup_ms"] = round(report["worker_startup_ms"] * 1000, 2)
+        worker_totals = []
+        for _ in range(repeat):
+            variants = ImageVariants(source, executor=executor)
+            _, elapsed = timed(
+                lambda: [variants.get(platform) for platform in PLATFORM_VARIANTS]
+            )
+            worker_totals.append(elapsed)
+        report["worker_all_variants_ms"] = p50_ms(worker_totals)
+
+    return report
+
+
+def format_report(report):
+    lines = [
+        f"source: {report['source_bytes']} bytes ({report['pattern']}), "
+        f"decode p50 {report['decode_ms']} ms",
+        f"{'variant':<12}{'type':<12}{'bytes':>10}{'encode ms':>11}",
+    ]
+    for platform, variant in report["variants"].items():
+        content_type = "source" if variant["passthrough"] else variant["content_type"]
+        lines.append(
+            f"{platform:<12}{content_type:<12}{variant['bytes']:>10}"
+            f"{variant['encode_ms']:>11}"
+        )
+    lines.append(
+        f"all variants in-process: {report['all_variants_ms']} ms, "
+        f"legacy Instagram JPEG: {report['legacy_instagram']['ms']} ms "
+        f"({report['legacy_instagram']['bytes']} bytes)"
+    )
+    if "worker_all_variants_ms" in report:
+        lines.append(
+            f"all variants in worker: {report['worker_all_variants_ms']} ms "
+            f"(startup {report['worker_startup_ms']} ms)"
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--pattern", choices=("noise", "smooth"), default="noise")
+    parser.add_argument(
+        "--worker", action="store_true", help="Also time the worker process"
+    )
+    parser.add_argument("--json", action="store_true", help="Print the raw report")
+    args = parser.parse_args(argv)
+
+    report = run_image_benchmark(args.size, args.repeat, args.pattern, args.worker)
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+
+
+if __name__ == "__main__":
+    main()
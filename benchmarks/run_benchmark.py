@@ -0,0 +1,239 @@
+"""
+Offline end-to-end benchmark of QuoteBot.generate_and_post.
+
+Runs the real ContentGenerator, TwitterManager, InstagramManager and
+mongo_manager code against local stand-ins (see fake_servers.FakeServer) and
+mongomock, and reports per-stage and total p50/p95 latency and peak memory.
+
+Usage:
+    python -m benchmarks.run_benchmark --iterations 20 \
+        --latency openai.chat=0.8 --latency graph.media=1.5 \
+        --error-rate twitter.tweet=0.1
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import tracemalloc
+from collections import defaultdict
+from unittest.mock import patch
+import mongomock
+import content_generator
+import http_session
+import instrumentation
+import mongo_manager
+import storage_manager
+from benchmarks.fake_servers import ROUTES, FakeServer
+from quote_bot import QuoteBot
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+    }
+
+
+@contextlib.contextmanager
+def offline_environment(server):
+    """
+    Point every client at the fake server and an in-memory MongoDB.
+    """
+    mongo = mongomock.MongoClient()
+    with patch.dict(os.environ, server.environ()), patch(
+        "mongo_manager.MongoClient", lambda *args, **kwargs: mongo
+    ):
+        mongo_manager._client = None
+        mongo_manager._quote_indexes.clear()
+        mongo_manager._recent_windows.clear()
+        content_generator._client = None
+        storage_manager.reset_client()
+        try:
+            yield
+        finally:
+            storage_manager.wait_for_pending_deletes()
+            storage_manager.reset_client()
+            mongo_manager._client = None
+            mongo_manager._quote_indexes.clear()
+            mongo_manager._recent_windows.clear()
+            content_generator._client = None
+
+
+def run_benchmark(
+    iterations=10,
+    latency=None,
+    error_rate=None,
+    config=None,
+    seed=None,
+    cold_sessions=False,
+    container_polls=0,
+):
+    """
+    Run generate_and_post repeatedly against the fake server.
+
+    Returns:
+        A report dictionary with total and per-stage latency percentiles, the
+        peak traced memory, failure counts, the number of runs whose platforms
+        were published to concurrently, and the number of requests and TCP
+        connections the fake server received per route.
+
+        With cold_sessions, every HTTP session and the OpenAI client are
+        dropped before each run, as if nothing was reused between
+        invocations, so the connection counts show what pooling saves.
+
+        container_polls makes every Instagram media container report
+        IN_PROGRESS for that many status checks before it is FINISHED.
+    """
+    stages = defaultdict(list)
+    totals = []
+    peaks = []
+    failed_runs = 0
+    failed_platforms = defaultdict(int)
+    connections = []
+    concurrent_publishes = 0
+
+    with FakeServer(
+        latency, error_rate, seed=seed, container_polls=container_polls
+    ) as server, offline_environment(server):
+        bot_config = dict(server.config(), **(config or {}))
+
+        for _ in range(iterations):
+            if cold_sessions:
+                http_session.close_sessions()
+                storage_manager.reset_client()
+                content_generator._client = None
+            opened = server.connections
+            tracemalloc.start()
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    with instrumentation.run("benchmark") as record:
+                        results = QuoteBot(bot_config).generate_and_post()
+                for platform, result in results.items():
+                    if not result["ok"]:
+                        failed_platforms[platform] += 1
+            except Exception:
+                failed_runs += 1
+            finally:
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+            connections.append(server.connections - opened)
+            peaks.append(peak)
+            totals.append(record.duration)
+            for span in record.spans:
+                stages[span.name].append(span.duration)
+            publishes = [
+                span for span in record.spans if span.name.startswith("publish.")
+            ]
+            if len(publishes) > 1 and max(span.offset for span in publishes) < min(
+                span.offset + span.duration for span in publishes
+            ):
+                concurrent_publishes += 1
+
+        return {
+            "iterations": iterations,
+            "failed_runs": failed_runs,
+            "failed_platforms": dict(failed_platforms),
+            "total": summarize(totals),
+            "stages": {
+                name: summarize(values) for name, values in sorted(stages.items())
+            },
+            "peak_memory_bytes": max(peaks),
+            "concurrent_publishes": concurrent_publishes,
+            "requests": dict(server.requests),
+            "connections": server.connections,
+            "connections_per_run": connections,
+        }
+
+
+def format_report(report):
+    lines = [
+        f"iterations: {report['iterations']}, failed runs: {report['failed_runs']}, "
+        f"failed platforms: {report['failed_platforms'] or 'none'}",
+        f"peak memory: {report['peak_memory_bytes'] / 1024 / 1024:.1f} MiB, "
+        f"connections: {report['connections']} "
+        f"(per run: {', '.join(map(str, report['connections_per_run']))})",
+        f"{'stage':<28}{'count':>7}{'p50 ms':>11}{'p95 ms':>11}",
+        f"{'total':<28}{report['total']['count']:>7}"
+        f"{report['total']['p50_ms']:>11}{report['total']['p95_ms']:>11}",
+    ]
+    for name, stats in report["stages"].items():
+        lines.append(
+            f"{name:<28}{stats['count']:>7}{stats['p50_ms']:>11}{stats['p95_ms']:>11}"
+        )
+    return "\n".join(lines)
+
+
+def parse_route_values(values, option):
+    parsed = {}
+    for value in values or []:
+        route, _, number = value.partition("=")
+        if route not in ROUTES:
+            raise argparse.ArgumentTypeError(
+                f"{option}: unknown route {route!r}, expected one of {', '.join(ROUTES)}"
+            )
+        parsed[route] = float(number)
+    return parsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument(
+        "--latency",
+        action="append",
+        metavar="ROUTE=SECONDS",
+        help="Inject a fixed latency into a route, e.g. openai.chat=0.5",
+    )
+    parser.add_argument(
+        "--error-rate",
+        action="append",
+        metavar="ROUTE=PROBABILITY",
+        help="Make a route answer 503 with the given probability",
+    )
+    parser.add_argument(
+        "--structured",
+        action="store_true",
+        help="Use the single structured OpenAI call (STRUCTURED_GENERATION)",
+    )
+    parser.add_argument(
+        "--cold-sessions",
+        action="store_true",
+        help="Drop pooled HTTP sessions between runs to measure what pooling saves",
+    )
+    parser.add_argument(
+        "--container-polls",
+        type=int,
+        default=0,
+        help="Status checks for which Instagram media containers stay IN_PROGRESS",
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", action="store_true", help="Print the raw report")
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(
+        iterations=args.iterations,
+        latency=parse_route_values(args.latency, "--latency"),
+        error_rate=parse_route_values(args.error_rate, "--error-rate"),
+        config={"STRUCTURED_GENERATION": "true"} if args.structured else None,
+        seed=args.seed,
+        cold_sessions=args.cold_sessions,
+        container_polls=args.container_polls,
+    )
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+
+
+if __name__ == "__main__":
+    main()
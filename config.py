@@ -22,6 +22,88 @@ def get_config():
         "MONGODB_PASSWORD": os.getenv("MONGODB_PASSWORD"),
         "FACEBOOK_ACCESS_TOKEN": os.getenv("FACEBOOK_ACCESS_TOKEN"),
         "INSTAGRAM_USER_ID": os.getenv("INSTAGRAM_USER_ID"),
+        "INSTAGRAM_USERNAME": os.getenv("INSTAGRAM_USERNAME"),
+        "INSTAGRAM_PASSWORD": os.getenv("INSTAGRAM_PASSWORD"),
+        "THREADS_ENABLED": os.getenv("THREADS_ENABLED"),
+        "THREADS_SESSION_KEY": os.getenv("THREADS_SESSION_KEY"),
+        "TWITTER_API_URL": os.getenv("TWITTER_API_URL"),
+        "TWITTER_UPLOAD_URL": os.getenv("TWITTER_UPLOAD_URL"),
+        "TWITTER_CHUNKED_UPLOAD_THRESHOLD": os.getenv(
+            "TWITTER_CHUNKED_UPLOAD_THRESHOLD"
+        ),
+        "TWITTER_CHUNK_SIZE": os.getenv("TWITTER_CHUNK_SIZE"),
+        "TWITTER_PROCESSING_DEADLINE": os.getenv("TWITTER_PROCESSING_DEADLINE"),
+        "GRAPH_API_URL": os.getenv("GRAPH_API_URL"),
+        "INSTAGRAM_POLL_INTERVAL": os.getenv("INSTAGRAM_POLL_INTERVAL"),
+        "INSTAGRAM_POLL_MAX_INTERVAL": os.getenv("INSTAGRAM_POLL_MAX_INTERVAL"),
+        "INSTAGRAM_POLL_DEADLINE": os.getenv("INSTAGRAM_POLL_DEADLINE"),
+        "RATE_LIMIT_ATTEMPTS": os.getenv("RATE_LIMIT_ATTEMPTS"),
+        "RATE_LIMIT_BACKOFF": os.getenv("RATE_LIMIT_BACKOFF"),
+        "RATE_LIMIT_MAX_WAIT": os.getenv("RATE_LIMIT_MAX_WAIT"),
+        "RATE_LIMIT_LOW_WATER": os.getenv("RATE_LIMIT_LOW_WATER"),
+        "PUBLISH_TIMEOUT": os.getenv("PUBLISH_TIMEOUT"),
+        "PUBLISH_MAX_WORKERS": os.getenv("PUBLISH_MAX_WORKERS"),
+        "PUBLISH_MAX_ATTEMPTS": os.getenv("PUBLISH_MAX_ATTEMPTS"),
+        "QUOTE_HISTORY_SIZE": os.getenv("QUOTE_HISTORY_SIZE"),
+        "QUOTE_DIGEST_SIZE": os.getenv("QUOTE_DIGEST_SIZE"),
+        "QUOTE_ATTEMPTS": os.getenv("QUOTE_ATTEMPTS"),
+        "QUOTE_CANDIDATES": os.getenv("QUOTE_CANDIDATES"),
+        "DOMAIN_BALANCE_WEIGHT": os.getenv("DOMAIN_BALANCE_WEIGHT"),
+        "DOMAIN_WEIGHTING": os.getenv("DOMAIN_WEIGHTING"),
+        "METRICS_WINDOW_DAYS": os.getenv("METRICS_WINDOW_DAYS"),
+        "DOMAIN_STATS_WINDOW_DAYS": os.getenv("DOMAIN_STATS_WINDOW_DAYS"),
+        "STRUCTURED_GENERATION": os.getenv("STRUCTURED_GENERATION"),
+        "STREAM_COMPLETIONS": os.getenv("STREAM_COMPLETIONS"),
+        "POST_QUEUE_ENABLED": os.getenv("POST_QUEUE_ENABLED"),
+        "POST_QUEUE_SIZE": os.getenv("POST_QUEUE_SIZE"),
+        "POST_QUEUE_LOW_WATER": os.getenv("POST_QUEUE_LOW_WATER"),
+        "POST_QUEUE_LEASE": os.getenv("POST_QUEUE_LEASE"),
+        "INSTRUMENTATION_ENABLED": os.getenv("INSTRUMENTATION_ENABLED"),
+        "IMAGE_WORKER_PROCESS": os.getenv("IMAGE_WORKER_PROCESS"),
+        "QUOTE_PROMPT": os.getenv("QUOTE_PROMPT"),
+        "ACCOUNTS_SOURCE": os.getenv("ACCOUNTS_SOURCE"),
+        "ACCOUNTS_FILE": os.getenv("ACCOUNTS_FILE"),
+        "ACCOUNT_MAX_WORKERS": os.getenv("ACCOUNT_MAX_WORKERS"),
+        "PLATFORM_CONCURRENCY": os.getenv("PLATFORM_CONCURRENCY"),
+        "WORKER_SLOTS": os.getenv("WORKER_SLOTS"),
+        "WORKER_INTERVAL_MINUTES": os.getenv("WORKER_INTERVAL_MINUTES"),
+        "WORKER_ACCOUNTS": os.getenv("WORKER_ACCOUNTS"),
+        "WORKER_RETRY_ATTEMPTS": os.getenv("WORKER_RETRY_ATTEMPTS"),
+        "WORKER_RETRY_DELAY": os.getenv("WORKER_RETRY_DELAY"),
+        "WORKER_DRAIN_TIMEOUT": os.getenv("WORKER_DRAIN_TIMEOUT"),
+        "PORT": os.getenv("PORT"),
     }
 
     return config
+
+
+def get_int(config, key, default):
+    """
+    Read an integer setting from the configuration, falling back to a default.
+    """
+    value = config.get(key)
+    if value in (None, ""):
+        return default
+    return int(value)
+
+
+def get_float(config, key, default):
+    """
+    Read a float setting from the configuration, falling back to a default.
+    """
+    value = config.get(key)
+    if value in (None, ""):
+        return default
+    return float(value)
+
+
+def get_bool(config, key, default=False):
+    """
+    Read a boolean flag from the configuration, falling back to a default.
+    """
+    value = config.get(key)
+    if value in (None, ""):
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
@@ -1,45 +1,314 @@
+import json
+import os
+import random
 import re
+import threading
+import time
+from types import SimpleNamespace
 from openai import OpenAI
-from mongo_manager import insert_quote, get_last_50_quotes
+from config import get_bool, get_float, get_int
+from instrumentation import span
+from mongo_manager import (
+    HISTORY_SIZE,
+    get_domain_stats,
+    get_quote_index,
+    get_recent_quotes,
+    insert_quote,
+)
+from quote_scoring import domain_weights, ranked_candidates, score_candidates
 
-client = OpenAI()
+QUOTE_PROMPT = "Share a thought-provoking and concise quote that captures the spirit of a specific domain within the tech industry, such as artificial intelligence, web3 development, software development, game development, cybersecurity, or data science. The quote should come from a respected figure in the specified domain and resonate within the tech community."
+
+POST_FIELDS_PROMPT = 'Respond with a JSON object with the keys "quote" (the quote text without quotation marks), "author" (the individual\'s name), "emojis" (1-3 relevant emojis), "hashtags" (a list of 1-2 relevant hashtags) and "image_description" (a vivid and intricate description of an image deeply inspired by the quote, rich in detail, with adjectives, locations or artistic styles and surreal or fantastical elements, in at most 120 words).'
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Return the process-wide OpenAI client, creating it on first use.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OpenAI(base_url=os.getenv("OPENAI_BASE_URL"))
+    return _client
+
+
+def chat_completion(stage, **kwargs):
+    """
+    Create a chat completion, recording its latency and token usage.
+    """
+    with span("openai.chat", stage=stage, model=kwargs.get("model")) as s:
+        response = get_client().chat.completions.create(**kwargs)
+        s.record_usage(getattr(response, "usage", None))
+    return response
+
+
+def stream_completion(stage, complete=None, on_text=None, **kwargs):
+    """
+    Stream a single-choice chat completion.
+
+    Args:
+        complete: Called with the text received so far after every chunk.
+            Returns the text to keep once the reply holds everything needed,
+            which stops reading the stream, or None to keep reading.
+        on_text: Called with the text received so far after every chunk.
+
+    Returns:
+        A response shaped like a non-streamed one, with one choice.
+    """
+    with span("openai.chat", stage=stage, model=kwargs.get("model"), stream=True) as s:
+        started = time.perf_counter()
+        stream = get_client().chat.completions.create(stream=True, **kwargs)
+        text = ""
+        finish_reason = None
+        chunks = 0
+        try:
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                if choice.finish_reason:
+                    finish_reason = choice.finish_reason
+                if not choice.delta.content:
+                    continue
+                if not text:
+                    s.set(first_token_ms=(time.perf_counter() - started) * 1000)
+                text += choice.delta.content
+                chunks += 1
+                if on_text:
+                    on_text(text)
+                kept = complete(text) if complete else None
+                if kept is not None:
+                    text = kept
+                    finish_reason = "stop"
+                    s.set(stopped_early=True)
+                    break
+        finally:
+            # Closing the response drops the tail of an early-stopped reply.
+            stream.response.close()
+        s.set(chunks=chunks)
+
+    return SimpleNamespace(
+        choices=[
+            SimpleNamespace(
+                message=SimpleNamespace(content=text), finish_reason=finish_reason
+            )
+        ]
+    )
 
 
 class ContentGenerator:
     def __init__(self, config):
         self.config = config
 
-    def generate_quote(self):
-        previous_quotes = get_last_50_quotes()
-        chat_messages = [
-            {
-                "role": "assistant",
-                "content": "Here are the last 50 quotes that have been generated: "
-                + "\n".join(previous_quotes)
-                + ". Please generate a new quote that is different from these previous ones, and ensure equal representation of all domains.",
-            },
-            {
-                "role": "user",
-                "content": "Share a thought-provoking and concise quote that captures the spirit of a specific domain within the tech industry, such as artificial intelligence, web3 development, software development, game development, cybersecurity, or data science. The quote should come from a respected figure in the specified domain and resonate within the tech community. Use 1-2 relevant hashtags and emojis to enhance engagement. Present the quote first, followed by the individual's name and emojis, and end with the appropriate hashtags.",
-            },
-        ]
+    def generate_quote(self, on_quote_text=None):
+        """
+        Generate a quote caption, asking for QUOTE_CANDIDATES replies in one
+        completion and keeping the best one, so a truncated, unparsable or
+        repeated reply rarely costs another round trip.
+
+        With STREAM_COMPLETIONS and a single candidate, the reply is streamed
+        instead: on_quote_text is called as soon as the quoted text is known
+        and is not a near-duplicate, while the author and hashtags are still
+        arriving, and reading stops at the end of the hashtag line that
+        follows the quote.
 
-        response = client.chat.completions.create(
-            model="gpt-4-1106-preview",
-            messages=chat_messages,
-            n=1,
-            stop=None,
-            temperature=0.7,
-            max_tokens=60,
+        With DOMAIN_WEIGHTING, the quote is steered towards a domain chosen by
+        its past engagement.
+
+        Returns:
+            A tuple of the caption and the quote text.
+        """
+        quote_index = get_quote_index()
+        recent_quotes = get_recent_quotes(
+            get_int(self.config, "QUOTE_DIGEST_SIZE", 5),
+            history_size=get_int(self.config, "QUOTE_HISTORY_SIZE", HISTORY_SIZE),
         )
+        domain = self.choose_domain()
+        rejected_quotes = []
+
+        for _ in range(get_int(self.config, "QUOTE_ATTEMPTS", 3)):
+            chat_messages = [
+                self.history_message(recent_quotes + rejected_quotes),
+                {
+                    "role": "user",
+                    "content": self.quote_prompt(domain)
+                    + " Use 1-2 relevant hashtags and emojis to enhance engagement. Present the quote first, followed by the individual's name and emojis, and end with the appropriate hashtags.",
+                },
+            ]
+
+            request = {
+                "model": "gpt-4-1106-preview",
+                "messages": chat_messages,
+                "n": get_int(self.config, "QUOTE_CANDIDATES", 1),
+                "stop": None,
+                "temperature": 0.7,
+                "max_tokens": 60,
+            }
+            if self.streaming(request):
+                response = stream_completion(
+                    "quote",
+                    complete=caption_end,
+                    on_text=self.quote_watcher(quote_index, on_quote_text),
+                    **request,
+                )
+            else:
+                response = chat_completion("quote", **request)
+
+            if not response.choices:
+                return "", ""
+
+            candidates = [parse_quote_choice(choice) for choice in response.choices]
+            candidate = self.select_candidate(candidates, quote_index, domain)
+            if candidate:
+                return candidate["quote"], candidate["quote_text"]
+            rejected_quotes += [c["quote_text"] for c in candidates if c]
+
+        raise Exception("Failed to generate a quote that is not a near-duplicate")
+
+    def generate_post(self):
+        """
+        Generate the quote, author, hashtags and image description in a single
+        JSON-structured chat completion, keeping the best of QUOTE_CANDIDATES
+        replies and steering it like generate_quote.
+
+        Returns:
+            A dictionary with the keys "quote" (the full caption), "quote_text",
+            "author", "emojis", "hashtags" and "image_description".
+        """
+        quote_index = get_quote_index()
+        recent_quotes = get_recent_quotes(
+            get_int(self.config, "QUOTE_DIGEST_SIZE", 5),
+            history_size=get_int(self.config, "QUOTE_HISTORY_SIZE", HISTORY_SIZE),
+        )
+        domain = self.choose_domain()
+        rejected_quotes = []
+
+        for _ in range(get_int(self.config, "QUOTE_ATTEMPTS", 3)):
+            request = self.post_request(
+                recent_quotes + rejected_quotes,
+                domain=domain,
+                n=get_int(self.config, "QUOTE_CANDIDATES", 1),
+            )
+            if self.streaming(request):
+                response = stream_completion("post", complete=json_object, **request)
+            else:
+                response = chat_completion("post", **request)
+
+            if not response.choices:
+                continue
 
-        if response.choices:
-            quote = response.choices[0].message.content.strip()
-            quote_text = re.search(r'"(.*?)"', quote).group(1)
-            insert_quote(quote_text)
-            return quote, quote_text
+            candidates = [parse_post_choice(choice) for choice in response.choices]
+            candidate = self.select_candidate(candidates, quote_index, domain)
+            if candidate:
+                return {
+                    key: value for key, value in candidate.items() if key != "truncated"
+                }
+            rejected_quotes += [c["quote_text"] for c in candidates if c]
 
-        return "", ""
+        raise Exception("Failed to generate a valid post that is not a near-duplicate")
+
+    def streaming(self, request):
+        return request["n"] == 1 and get_bool(self.config, "STREAM_COMPLETIONS")
+
+    def quote_watcher(self, quote_index, on_quote_text):
+        """
+        Build the on_text callback that reports the quoted text once, as soon
+        as its closing quotation mark arrives.
+        """
+        if on_quote_text is None:
+            return None
+        reported = []
+
+        def watch(text):
+            match = None if reported else re.search(r'"(.*?)"', text)
+            if match:
+                reported.append(match.group(1))
+                if not quote_index.is_duplicate(match.group(1)):
+                    on_quote_text(match.group(1))
+
+        return watch
+
+    def select_candidate(self, candidates, quote_index, domain=None):
+        """
+        Archive and return the best feasible candidate, or None if every
+        candidate was rejected. The candidate is archived with the domain
+        the prompt was steered towards, if any.
+        """
+        with span("quote.score_candidates", candidates=len(candidates)):
+            scores = score_candidates(
+                candidates,
+                quote_index,
+                balance_weight=get_float(self.config, "DOMAIN_BALANCE_WEIGHT", 0.5),
+            )
+        for candidate in ranked_candidates(candidates, scores):
+            if insert_quote(
+                candidate["quote_text"],
+                history_size=get_int(self.config, "QUOTE_HISTORY_SIZE", HISTORY_SIZE),
+                domain=domain,
+            ):
+                return candidate
+
+        for candidate in candidates:
+            if candidate:
+                print(f"Rejected candidate quote: {candidate['quote_text']}")
+        return None
+
+    def post_request(self, previous_quotes, domain=None, n=1):
+        """
+        The chat completion parameters of n JSON-structured post candidates,
+        optionally steered towards a domain.
+        """
+        prompt = self.quote_prompt(domain)
+        return {
+            "model": "gpt-4-1106-preview",
+            "messages": [
+                self.history_message(previous_quotes),
+                {"role": "user", "content": prompt + " " + POST_FIELDS_PROMPT},
+            ],
+            "n": n,
+            "stop": None,
+            "temperature": 0.7,
+            "max_tokens": 400,
+            "response_format": {"type": "json_object"},
+        }
+
+    def quote_prompt(self, domain=None):
+        """
+        The quote prompt, which an account can override with its own theme,
+        optionally steered towards a domain.
+        """
+        prompt = self.config.get("QUOTE_PROMPT") or QUOTE_PROMPT
+        if domain:
+            prompt += f" This time, pick a quote about {domain}."
+        return prompt
+
+    def choose_domain(self):
+        """
+        With DOMAIN_WEIGHTING, draw the domain of the next quote weighted by
+        the engagement aggregates of the account, read in one query.
+
+        Returns:
+            The domain, or None to leave the choice to the model.
+        """
+        if not get_bool(self.config, "DOMAIN_WEIGHTING"):
+            return None
+        weights = domain_weights(get_domain_stats())
+        if not weights:
+            return None
+        return random.choices(list(weights), weights=list(weights.values()))[0]
+
+    def history_message(self, previous_quotes):
+        return {
+            "role": "assistant",
+            "content": "Here are the most recent quotes that have been generated: "
+            + "\n".join(previous_quotes)
+            + ". Please generate a new quote that is different from these previous ones, and ensure equal representation of all domains.",
+        }
 
     def generate_detailed_description(self, quote_text):
         chat_messages = [
@@ -49,26 +318,150 @@ class ContentGenerator:
             },
         ]
 
-        response = client.chat.completions.create(
-            model="gpt-4-1106-preview",
-            messages=chat_messages,
-            n=1,
-            stop=None,
-            temperature=0.8,
-            max_tokens=150,
-        )
+        request = {
+            "model": "gpt-4-1106-preview",
+            "messages": chat_messages,
+            "n": 1,
+            "stop": None,
+            "temperature": 0.8,
+            "max_tokens": 150,
+        }
+        if self.streaming(request):
+            response = stream_completion("description", **request)
+        else:
+            response = chat_completion("description", **request)
 
         detailed_description = response.choices[0].message.content.strip()
         return detailed_description
 
     def generate_image(self, prompt):
-        response = client.images.generate(
-            model="dall-e-3",
-            prompt=prompt,
-            size="1024x1024",
-            quality="standard",
-            n=1,
-        )
+        with span("openai.image", model="dall-e-3"):
+            response = get_client().images.generate(
+                model="dall-e-3",
+                prompt=prompt,
+                size="1024x1024",
+                quality="standard",
+                n=1,
+            )
 
         image_url = response.data[0].url
         return image_url
+
+
+def caption_end(text):
+    """
+    The caption of a streamed quote reply, once the line holding the hashtags
+    after the quoted text has ended, or None while it may still be arriving.
+    """
+    match = re.search(r'"(.*?)"', text)
+    hashtag = match and re.search(r"#\w", text[match.end() :])
+    if not hashtag:
+        return None
+    newline = text.find("\n", match.end() + hashtag.end())
+    return text[:newline] if newline >= 0 else None
+
+
+def json_object(text):
+    """
+    The JSON object of a streamed structured reply, once it is closed, or
+    None while it may still be arriving.
+    """
+    start = text.find("{")
+    if start < 0 or not text.rstrip().endswith("}"):
+        return None
+    try:
+        _, end = json.JSONDecoder().raw_decode(text, start)
+    except json.JSONDecodeError:
+        return None
+    return text[start:end]
+
+
+def parse_quote_choice(choice):
+    """
+    Extract the quoted text of a plain-text quote reply.
+
+    Returns:
+        A candidate dictionary with the keys "quote", "quote_text" and
+        "truncated", or None if the reply has no quoted text.
+    """
+    quote = (choice.message.content or "").strip()
+    match = re.search(r'"(.*?)"', quote)
+    if not match:
+        print(f"Could not find a quoted text in: {quote}")
+        return None
+    return {
+        "quote": quote,
+        "quote_text": match.group(1),
+        "truncated": choice.finish_reason == "length",
+    }
+
+
+def parse_post_choice(choice):
+    """
+    Parse a JSON-structured post reply into a candidate, or None if it is
+    invalid.
+    """
+    try:
+        post = parse_post(choice.message.content)
+    except ValueError as e:
+        print(f"Discarded invalid structured response: {e}")
+        return None
+    post["truncated"] = choice.finish_reason == "length"
+    return post
+
+
+def parse_post(content):
+    """
+    Validate a JSON-structured post and build its caption.
+
+    Raises:
+        ValueError: If the content is not valid JSON or a required field is
+            missing or malformed.
+    """
+    try:
+        data = json.loads(content)
+    except (TypeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Response is not valid JSON: {e}")
+    if not isinstance(data, dict):
+        raise ValueError("Response is not a JSON object")
+
+    fields = {}
+    for key in ("quote", "author", "image_description"):
+        value = data.get(key)
+        if not isinstance(value, str) or not value.strip():
+            raise ValueError(f'Field "{key}" is missing or empty')
+        fields[key] = value.strip()
+
+    quote_text = fields["quote"].strip('"“” ')
+    if not quote_text:
+        raise ValueError('Field "quote" is empty')
+
+    hashtags = data.get("hashtags")
+    if isinstance(hashtags, str):
+        hashtags = hashtags.split()
+    if not isinstance(hashtags, list) or not hashtags:
+        raise ValueError('Field "hashtags" is missing or empty')
+    hashtags = [
+        "#" + str(tag).strip().lstrip("#").replace(" ", "")
+        for tag in hashtags
+        if str(tag).strip().lstrip("#")
+    ]
+
+    emojis = data.get("emojis") or ""
+    if not isinstance(emojis, str):
+        emojis = "".join(str(emoji) for emoji in emojis)
+
+    caption = f'"{quote_text}" - {fields["author"]}'
+    if emojis.strip():
+        caption += f" {emojis.strip()}"
+    if hashtags:
+        caption += " " + " ".join(hashtags)
+
+    return {
+        "quote": caption,
+        "quote_text": quote_text,
+        "author": fields["author"],
+        "emojis": emojis.strip(),
+        "hashtags": hashtags,
+        "image_description": fields["image_description"],
+    }
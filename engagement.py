@@ -0,0 +1,154 @@
+"""
+Engagement metrics ingestion.
+
+Fetches the likes, replies, shares and impressions of the posts published in
+the last METRICS_WINDOW_DAYS days, for the default account or every
+configured account. Metrics are read in bulk, one Twitter tweet lookup per
+100 tweets and one Graph API request per 50 Instagram media, and stored with
+the archived quotes in one bulk write per page. The per-domain aggregates the
+content generator weights the next domain with (DOMAIN_WEIGHTING) are then
+recomputed from the posts published in the last DOMAIN_STATS_WINDOW_DAYS
+days, so a run that crashed or overlapped another one leaves nothing to
+correct.
+
+Usage:
+    python -m engagement [--accounts]
+"""
+
+import argparse
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from config import get_config, get_float
+from instagram_manager import InstagramManager
+from instrumentation import span
+from mongo_manager import (
+    account_scope,
+    iter_archived_quotes,
+    save_domain_stats,
+    save_engagement,
+)
+from quote_scoring import classify_domain
+from scheduler import load_accounts
+from twitter_manager import TWEET_LOOKUP_MAX_IDS, TwitterManager
+
+DEFAULT_ACCOUNT = "default"
+ENGAGEMENT_METRICS = ("likes", "replies", "shares", "saves")
+
+
+def collect_engagement(config, accounts=None):
+    """
+    Refresh the metrics of the recent posts of each account and recompute its
+    domain aggregates.
+
+    Returns:
+        A dictionary mapping each account to the number of quotes updated.
+    """
+    now = datetime.now(timezone.utc)
+    since = now - timedelta(days=get_float(config, "METRICS_WINDOW_DAYS", 7))
+    stats_since = now - timedelta(
+        days=get_float(config, "DOMAIN_STATS_WINDOW_DAYS", 90)
+    )
+    summary = {}
+    for account in accounts or [None]:
+        account_id = account["id"] if account else DEFAULT_ACCOUNT
+        account_config = dict(config, **account["config"]) if account else config
+        fetchers = {
+            "twitter": TwitterManager(account_config).get_tweet_metrics,
+            "instagram": InstagramManager(account_config).get_media_metrics,
+        }
+        with account_scope(account["id"] if account else None), span(
+            "engagement.collect", account=account_id
+        ):
+            updated = 0
+            quotes = iter_archived_quotes(
+                batch_size=TWEET_LOOKUP_MAX_IDS, published_since=since
+            )
+            while page := list(islice(quotes, TWEET_LOOKUP_MAX_IDS)):
+                metrics = fetch_metrics(page, fetchers)
+                save_engagement(metrics)
+                updated += len(metrics)
+            save_domain_stats(
+                aggregate_engagement(iter_archived_quotes(published_since=stats_since))
+            )
+        summary[account_id] = updated
+    return summary
+
+
+def fetch_metrics(quotes, fetchers):
+    """
+    Fetch the metrics of a page of archived quotes from every platform they
+    were posted to. A platform that fails is skipped until the next run.
+
+    Returns:
+        A dictionary mapping archive entry IDs to dictionaries of metrics per
+        platform.
+    """
+    metrics = {}
+    for platform, fetch in fetchers.items():
+        quote_ids = {
+            quote["posts"][platform]: quote["_id"]
+            for quote in quotes
+            if quote.get("posts", {}).get(platform)
+        }
+        if not quote_ids:
+            continue
+        try:
+            platform_metrics = fetch(list(quote_ids))
+        except Exception as e:
+            print(f"Could not fetch the {platform} metrics: {e}")
+            continue
+        for post_id, values in platform_metrics.items():
+            if post_id in quote_ids:
+                metrics.setdefault(quote_ids[post_id], {})[platform] = values
+    return metrics
+
+
+def aggregate_engagement(quotes):
+    """
+    Sum the posts, engagements and impressions of the measured quotes per
+    domain. Quotes recorded without a domain are classified from their text.
+    """
+    stats = {}
+    for quote in quotes:
+        if not quote.get("metrics"):
+            continue
+        domain = quote.get("domain") or classify_domain(quote["text"])
+        if domain is None:
+            continue
+        totals = stats.setdefault(
+            domain, {"posts": 0, "engagements": 0, "impressions": 0}
+        )
+        totals["posts"] += 1
+        for key, value in engagement_totals(quote["metrics"]).items():
+            totals[key] += value
+    return stats
+
+
+def engagement_totals(platforms):
+    """
+    Sum the engagements and impressions of a quote over its platforms.
+    """
+    totals = {"engagements": 0, "impressions": 0}
+    for values in platforms.values():
+        totals["engagements"] += sum(
+            values.get(metric, 0) for metric in ENGAGEMENT_METRICS
+        )
+        totals["impressions"] += values.get("impressions", 0)
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--accounts",
+        action="store_true",
+        help="Collect for every configured account (see ACCOUNTS_FILE)",
+    )
+    args = parser.parse_args(argv)
+    config = get_config()
+    accounts = load_accounts(config) if args.accounts else None
+    print(collect_engagement(config, accounts))
+
+
+if __name__ == "__main__":
+    main()
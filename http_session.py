@@ -0,0 +1,123 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from requests_oauthlib import OAuth1Session
+
+DEFAULT_TIMEOUT = (5, 60)
+POOL_CONNECTIONS = 8
+POOL_MAXSIZE = 16
+
+_session = None
+_adapter = None
+_oauth1_sessions = {}
+_lock = threading.Lock()
+
+
+class _TimeoutMixin:
+    """
+    Applies a default (connect, read) timeout to every request that does not
+    set one explicitly.
+    """
+
+    timeout = DEFAULT_TIMEOUT
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+class PooledSession(_TimeoutMixin, requests.Session):
+    pass
+
+
+class PooledOAuth1Session(_TimeoutMixin, OAuth1Session):
+    pass
+
+
+def mount_pool(
+    session, pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, adapter=None
+):
+    """
+    Give a session a keep-alive connection pool per host. pool_connections is
+    the number of hosts kept, pool_maxsize the connections kept per host.
+    An existing adapter can be passed to share its pool between sessions.
+    """
+    if adapter is None:
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections, pool_maxsize=pool_maxsize
+        )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_adapter():
+    """
+    Return the process-wide adapter whose connection pool every cached
+    session shares, so accounts with different OAuth credentials still reuse
+    the same connections to each host.
+    """
+    global _adapter
+    if _adapter is None:
+        with _lock:
+            if _adapter is None:
+                _adapter = HTTPAdapter(
+                    pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE
+                )
+    return _adapter
+
+
+def get_session():
+    """
+    Return the process-wide pooled session used for plain HTTP calls, so warm
+    invocations reuse open connections instead of repeating DNS, TCP and TLS
+    setup.
+    """
+    global _session
+    if _session is None:
+        adapter = get_adapter()
+        with _lock:
+            if _session is None:
+                _session = mount_pool(PooledSession(), adapter=adapter)
+    return _session
+
+
+def get_oauth1_session(api_key, api_secret, access_token, access_token_secret):
+    """
+    Return a pooled OAuth1 session, cached per set of credentials.
+    """
+    key = (api_key, api_secret, access_token, access_token_secret)
+    session = _oauth1_sessions.get(key)
+    if session is None:
+        adapter = get_adapter()
+        with _lock:
+            session = _oauth1_sessions.get(key)
+            if session is None:
+                session = mount_pool(
+                    PooledOAuth1Session(
+                        api_key,
+                        api_secret,
+                        resource_owner_key=access_token,
+                        resource_owner_secret=access_token_secret,
+                    ),
+                    adapter=adapter,
+                )
+                _oauth1_sessions[key] = session
+    return session
+
+
+def close_sessions():
+    """
+    Close every cached session and its pooled connections.
+    """
+    global _session, _adapter
+    with _lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+        for session in _oauth1_sessions.values():
+            session.close()
+        _oauth1_sessions.clear()
+        if _adapter is not None:
+            _adapter.close()
+            _adapter = None
@@ -0,0 +1,44 @@
+import io
+from PIL import Image
+from instrumentation import span
+from http_session import get_session
+
+
+class ImageArtifact:
+    """
+    An image downloaded once and shared by every publisher in a run.
+    """
+
+    def __init__(self, data, url=None, content_type=None):
+        self.data = data
+        self.url = url
+        with Image.open(io.BytesIO(data)) as img:
+            self.format = img.format
+            self.mode = img.mode
+            self.width, self.height = img.size
+        self.content_type = content_type or Image.MIME.get(self.format)
+
+    @classmethod
+    def from_url(cls, url, timeout=60):
+        with span("http.download_image") as s:
+            response = get_session().get(url, timeout=timeout)
+            s.record_response(response)
+        response.raise_for_status()
+        return cls(
+            response.content,
+            url=url,
+            content_type=response.headers.get("Content-Type"),
+        )
+
+    @property
+    def size(self):
+        return len(self.data)
+
+    @property
+    def extension(self):
+        return (self.format or "png").lower()
+
+    def open(self):
+        buffer = io.BytesIO(self.data)
+        buffer.name = f"image.{self.extension}"
+        return buffer
@@ -0,0 +1,242 @@
+import io
+import json
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+from image_artifact import ImageArtifact
+from instrumentation import span
+
+MB = 1024 * 1024
+
+# Per-platform constraints. max_side bounds the longest side in pixels, the
+# aspect ratio (width / height) is center-cropped into [min_aspect, max_aspect]
+# and JPEG quality is lowered towards min_quality until the output fits in
+# max_bytes. A PNG over max_bytes falls back to JPEG.
+PLATFORM_VARIANTS = {
+    "instagram": {
+        "format": "JPEG",
+        "quality": 90,
+        "min_quality": 60,
+        "progressive": True,
+        "max_side": 1440,
+        "min_aspect": 4 / 5,
+        "max_aspect": 1.91,
+        "max_bytes": 8 * MB,
+    },
+    "twitter": {
+        "format": "PNG",
+        "quality": 90,
+        "min_quality": 60,
+        "max_side": 4096,
+        "max_bytes": 5 * MB,
+    },
+}
+# Threads accepts anything Instagram does, so both share one encoded variant.
+PLATFORM_VARIANTS["threads"] = PLATFORM_VARIANTS["instagram"]
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_worker():
+    """
+    Return the process-wide single-worker process pool used to encode
+    variants off the publishing threads, creating it on first use.
+    """
+    global _worker
+    if _worker is None:
+        with _worker_lock:
+            if _worker is None:
+                _worker = ProcessPoolExecutor(
+                    max_workers=1, mp_context=multiprocessing.get_context("spawn")
+                )
+    return _worker
+
+
+def decode(data):
+    with span("image.decode", bytes=len(data)):
+        img = Image.open(io.BytesIO(data))
+        img.load()
+    return img
+
+
+def fits(image, spec):
+    """
+    Whether an encoded image already satisfies a spec and can be sent as is.
+    """
+    aspect = image.width / image.height
+    return (
+        image.format == spec["format"]
+        and image.size <= spec.get("max_bytes", float("inf"))
+        and max(image.width, image.height) <= spec.get("max_side", float("inf"))
+        and spec.get("min_aspect", 0) <= aspect <= spec.get("max_aspect", float("inf"))
+    )
+
+
+def resize(img, spec):
+    """
+    Center-crop an image into the spec's aspect ratio range and scale it down
+    to its maximum side.
+    """
+    width, height = img.size
+    aspect = width / height
+    if aspect > spec.get("max_aspect", float("inf")):
+        new_width = round(height * spec["max_aspect"])
+        left = (width - new_width) // 2
+        img = img.crop((left, 0, left + new_width, height))
+    elif aspect < spec.get("min_aspect", 0):
+        new_height = round(width / spec["min_aspect"])
+        top = (height - new_height) // 2
+        img = img.crop((0, top, width, top + new_height))
+
+    max_side = spec.get("max_side")
+    if max_side and max(img.size) > max_side:
+        scale = max_side / max(img.size)
+        img = img.resize(
+            (round(img.width * scale), round(img.height * scale)), Image.LANCZOS
+        )
+    return img
+
+
+def save_jpeg(img, quality, progressive):
+    buffer = io.BytesIO()
+    img.save(
+        buffer, "JPEG", quality=quality, progressive=progressive, optimize=progressive
+    )
+    return buffer.getvalue()
+
+
+def encode_jpeg(img, spec):
+    """
+    Encode as JPEG at the spec's quality, searching down to min_quality for
+    the highest quality that fits in max_bytes.
+    """
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    quality = spec.get("quality", 90)
+    progressive = spec.get("progressive", False)
+    max_bytes = spec.get("max_bytes", float("inf"))
+
+    data = save_jpeg(img, quality, progressive)
+    if len(data) <= max_bytes:
+        return data
+
+    best, smallest = None, data
+    low, high = spec.get("min_quality", quality), quality - 1
+    while low <= high:
+        middle = (low + high) // 2
+        data = save_jpeg(img, middle, progressive)
+        if len(data) <= max_bytes:
+            best = data
+            low = middle + 1
+        else:
+            smallest = data
+            high = middle - 1
+    return best or smallest
+
+
+def encode_variant(img, spec):
+    """
+    Encode a decoded image to match a spec.
+
+    Returns:
+        A tuple of the encoded bytes and their content type.
+    """
+    img = resize(img, spec)
+    if spec["format"] == "PNG":
+        buffer = io.BytesIO()
+        img.save(buffer, "PNG")
+        if buffer.tell() <= spec.get("max_bytes", float("inf")):
+            return buffer.getvalue(), "image/png"
+    return encode_jpeg(img, spec), "image/jpeg"
+
+
+def encode_variants(data, specs):
+    """
+    Decode an image once and encode every variant it needs.
+
+    Runs in the worker process, so it takes and returns plain bytes.
+
+    Returns:
+        A dictionary mapping each platform to a tuple of the encoded bytes and
+        their content type, or None when the source can be sent as is.
+    """
+    source = ImageArtifact(data)
+    img = None
+    encoded = {}
+    variants = {}
+    for platform, spec in specs.items():
+        if fits(source, spec):
+            variants[platform] = None
+            continue
+        key = spec_key(spec)
+        if key not in encoded:
+            if img is None:
+                img = decode(data)
+            encoded[key] = encode_variant(img, spec)
+        variants[platform] = encoded[key]
+    return variants
+
+
+def spec_key(spec):
+    return json.dumps(spec, sort_keys=True)
+
+
+class ImageVariants:
+    """
+    The per-platform variants of one image.
+
+    The source is decoded at most once and each distinct variant is encoded at
+    most once, on first use, by the publishing thread that asks for it, so
+    platforms encode in parallel. With an executor, every variant is encoded
+    in one pass in a worker process instead, as soon as the object is built.
+    """
+
+    def __init__(self, image, specs=None, executor=None):
+        self.image = image
+        self.specs = specs or PLATFORM_VARIANTS
+        self._decoded = None
+        self._decode_lock = threading.Lock()
+        self._variants = {}
+        self._locks = {spec_key(spec): threading.Lock() for spec in self.specs.values()}
+        self._future = None
+        if executor is not None:
+            self._future = executor.submit(encode_variants, image.data, self.specs)
+
+    def get(self, platform):
+        """
+        Return the variant for a platform as an ImageArtifact, or the source
+        image when it already satisfies the platform's constraints or the
+        platform has none.
+        """
+        spec = self.specs.get(platform)
+        if spec is None:
+            return self.image
+
+        if self._future is not None:
+            with span("image.wait_for_worker", platform=platform):
+                encoded = self._future.result()[platform]
+            if encoded is None:
+                return self.image
+            return ImageArtifact(encoded[0], content_type=encoded[1])
+
+        if fits(self.image, spec):
+            return self.image
+
+        key = spec_key(spec)
+        with self._locks[key]:
+            if key not in self._variants:
+                img = self.decoded()
+                with span("image.encode_variant", platform=platform) as s:
+                    data, content_type = encode_variant(img, spec)
+                    s.set(bytes=len(data), content_type=content_type)
+                self._variants[key] = ImageArtifact(data, content_type=content_type)
+        return self._variants[key]
+
+    def decoded(self):
+        if self._decoded is None:
+            with self._decode_lock:
+                if self._decoded is None:
+                    self._decoded = decode(self.image.data)
+        return self._decoded
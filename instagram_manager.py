@@ -1,8 +1,16 @@
-import os
-import tempfile
-import requests
-from google.cloud import storage
+import io
+import random
+import time
 from PIL import Image
+from config import get_float
+from instrumentation import span
+from http_session import get_session
+from rate_limiter import RateLimiter
+from storage_manager import delete_image_later, staging_name, upload_image
+
+# The Graph API reads up to 50 objects per request with the ids parameter.
+GRAPH_MAX_IDS = 50
+MEDIA_METRIC_FIELDS = "like_count,comments_count,insights.metric(impressions,saved)"
 
 
 class InstagramManager:
@@ -10,39 +18,37 @@ class InstagramManager:
         self.config = config
         self.access_token = config.get("FACEBOOK_ACCESS_TOKEN")
         self.ig_user_id = config.get("INSTAGRAM_USER_ID")
-        self.graph_url = "https://graph.facebook.com/v18.0/"
+        self.container_wait = None
+        self.rate_limiter = RateLimiter(config)
+        self.graph_url = (
+            config.get("GRAPH_API_URL") or "https://graph.facebook.com/v18.0/"
+        )
 
-    def post_on_instagram(self, quote, image_url):
+    def post_on_instagram(self, quote, image):
         try:
-            response = requests.get(image_url, stream=True)
-            response.raise_for_status()
-            with Image.open(response.raw) as img:
-                with tempfile.NamedTemporaryFile(
-                    suffix=".jpeg", delete=False
-                ) as temp_file:
-                    img.convert("RGB").save(temp_file, "JPEG")
-                    temp_filename = temp_file.name
-
-            gcs_filename = self.upload_to_gcs(temp_filename)
+            jpeg = image.open() if image.format == "JPEG" else self.encode_jpeg(image)
+            gcs_filename = self.upload_to_gcs(jpeg, staging_name("jpeg"))
             media = self.publish_to_instagram(gcs_filename, quote)
 
             if media:
                 self.delete_image_from_gcs(gcs_filename)
 
-            os.remove(temp_filename)
-
             return media
         except Exception as e:
             print(f"An error occurred while posting on Instagram: {e}")
             return None
 
-    def upload_to_gcs(self, file_path):
-        storage_client = storage.Client()
-        bucket = storage_client.bucket("devwisdomdaily-image")
-        filename = os.path.basename(file_path)
-        blob = bucket.blob(filename)
-        blob.upload_from_filename(file_path)
-        return f"https://storage.googleapis.com/devwisdomdaily-image/{filename}"
+    def encode_jpeg(self, image):
+        with span("image.encode_jpeg") as s:
+            buffer = io.BytesIO()
+            with Image.open(image.open()) as img:
+                img.convert("RGB").save(buffer, "JPEG")
+            s.set(bytes=buffer.tell())
+        buffer.seek(0)
+        return buffer
+
+    def upload_to_gcs(self, file_obj, filename):
+        return upload_image(file_obj.getvalue(), filename, "image/jpeg")
 
     def publish_to_instagram(self, image_url, caption):
         url = self.graph_url + self.ig_user_id + "/media"
@@ -51,27 +57,128 @@ class InstagramManager:
             "caption": caption,
             "image_url": image_url,
         }
-        response = requests.post(url, params=params)
+        with span("graph.media") as s:
+            response = self.rate_limiter.request(
+                get_session(), "post", url, "graph.media", params=params
+            )
+            s.record_response(response)
         if response.ok:
             media_id = response.json().get("id")
+            if not self.wait_for_container(media_id):
+                return None
             return self.publish(media_id)
         else:
             print(f"Failed to upload image: {response.text}")
             return None
 
+    def wait_for_container(self, container_id):
+        """
+        Poll the media container until Instagram has finished processing it,
+        backing off exponentially with jitter until a deadline.
+
+        Returns:
+            True once the container status is FINISHED, False if it failed,
+            expired or did not finish before the deadline.
+        """
+        initial_interval = get_float(self.config, "INSTAGRAM_POLL_INTERVAL", 0.5)
+        max_interval = get_float(self.config, "INSTAGRAM_POLL_MAX_INTERVAL", 5)
+        deadline = get_float(self.config, "INSTAGRAM_POLL_DEADLINE", 60)
+        url = self.graph_url + container_id
+        params = {"access_token": self.access_token, "fields": "status_code,status"}
+
+        started = time.monotonic()
+        attempt = 0
+        with span("graph.container_status") as s:
+            while True:
+                response = self.rate_limiter.request(
+                    get_session(), "get", url, "graph.container_status", params=params
+                )
+                status_code = (
+                    response.json().get("status_code") if response.ok else None
+                )
+                attempt += 1
+                waited = time.monotonic() - started
+                s.set(polls=attempt, waited_ms=round(waited * 1000, 2))
+                self.container_wait = waited
+
+                if status_code == "FINISHED":
+                    print(
+                        f"Media container ready after {waited:.2f}s ({attempt} polls)"
+                    )
+                    return True
+                if status_code in ("ERROR", "EXPIRED"):
+                    print(
+                        f"Media container {container_id} failed with status {status_code}: {response.text}"
+                    )
+                    return False
+
+                remaining = deadline - waited
+                if remaining <= 0:
+                    print(
+                        f"Media container {container_id} was not ready after {waited:.2f}s"
+                    )
+                    return False
+
+                interval = min(max_interval, initial_interval * 2 ** (attempt - 1))
+                time.sleep(min(remaining, random.uniform(interval / 2, interval)))
+
     def publish(self, media_id):
         url = self.graph_url + self.ig_user_id + "/media_publish"
         params = {"access_token": self.access_token, "creation_id": media_id}
-        response = requests.post(url, params=params)
+        with span("graph.media_publish") as s:
+            response = self.rate_limiter.request(
+                get_session(), "post", url, "graph.media_publish", params=params
+            )
+            s.record_response(response)
         if response.ok:
             return response.json()
         else:
             print(f"Failed to publish image: {response.text}")
             return None
 
+    def get_media_metrics(self, media_ids):
+        """
+        Read the like and comment counts and the insights of published media,
+        GRAPH_MAX_IDS per request.
+
+        Returns:
+            A dictionary mapping each media ID found to its "likes",
+            "replies", "saves" and "impressions".
+        """
+        metrics = {}
+        for start in range(0, len(media_ids), GRAPH_MAX_IDS):
+            ids = media_ids[start : start + GRAPH_MAX_IDS]
+            params = {
+                "access_token": self.access_token,
+                "ids": ",".join(ids),
+                "fields": MEDIA_METRIC_FIELDS,
+            }
+            with span("graph.insights", media=len(ids)) as s:
+                response = self.rate_limiter.request(
+                    get_session(),
+                    "get",
+                    self.graph_url,
+                    "graph.insights",
+                    params=params,
+                )
+                s.record_response(response)
+
+            if not response.ok:
+                raise Exception(f"Failed to read media insights: {response.text}")
+
+            for media_id, media in response.json().items():
+                insights = {
+                    insight["name"]: insight["values"][0]["value"]
+                    for insight in media.get("insights", {}).get("data", [])
+                    if insight.get("values")
+                }
+                metrics[media_id] = {
+                    "likes": media.get("like_count", 0),
+                    "replies": media.get("comments_count", 0),
+                    "saves": insights.get("saved", 0),
+                    "impressions": insights.get("impressions", 0),
+                }
+        return metrics
+
     def delete_image_from_gcs(self, url):
-        file_name = url.split("/")[-1]
-        storage_client = storage.Client()
-        bucket = storage_client.bucket("devwisdomdaily-image")
-        blob = bucket.blob(file_name)
-        blob.delete()
+        delete_image_later(url)
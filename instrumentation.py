@@ -0,0 +1,151 @@
+import contextvars
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+_current_run = contextvars.ContextVar("instrumentation_run", default=None)
+
+
+class RunRecord:
+    """
+    Collects the timing spans and token usage of one run.
+    """
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+        self.spans = []
+        self.usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        self.error = None
+        self.started = time.perf_counter()
+        self.duration = None
+        self._lock = threading.Lock()
+
+    def add_span(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def add_usage(self, usage):
+        with self._lock:
+            for key in self.usage:
+                self.usage[key] += int(getattr(usage, key, 0) or 0)
+
+    def to_dict(self):
+        return {
+            "severity": "ERROR" if self.error else "INFO",
+            "message": f"{self.name} run summary",
+            "run": self.name,
+            **self.attributes,
+            "duration_ms": round((self.duration or 0) * 1000, 2),
+            "error": self.error,
+            "usage": self.usage,
+            "spans": [span.to_dict() for span in self.spans],
+        }
+
+
+class Span:
+    def __init__(self, record, name, attributes):
+        self.record = record
+        self.name = name
+        self.attributes = attributes
+        self.offset = None
+        self.duration = None
+        self.error = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self.offset = self.started - self.record.started
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.started
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        self.record.add_span(self)
+        return False
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def record_usage(self, usage):
+        if usage is None:
+            return
+        self.set(
+            prompt_tokens=int(getattr(usage, "prompt_tokens", 0) or 0),
+            completion_tokens=int(getattr(usage, "completion_tokens", 0) or 0),
+        )
+        self.record.add_usage(usage)
+
+    def record_response(self, response):
+        self.set(
+            status=response.status_code,
+            bytes=len(response.content or b""),
+        )
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "start_ms": round(self.offset * 1000, 2),
+            "duration_ms": round(self.duration * 1000, 2),
+            "error": self.error,
+            **self.attributes,
+        }
+
+
+class _NullSpan:
+    """
+    Shared no-op span returned when no run is being recorded.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+    def record_usage(self, usage):
+        pass
+
+    def record_response(self, response):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name, **attributes):
+    """
+    Time a block as part of the current run. Costs a single context variable
+    lookup when instrumentation is disabled.
+    """
+    record = _current_run.get()
+    if record is None:
+        return _NULL_SPAN
+    return Span(record, name, attributes)
+
+
+@contextmanager
+def run(name, enabled=True, **attributes):
+    """
+    Record every span opened inside the block and print one structured JSON
+    line for Cloud Logging when it exits.
+    """
+    if not enabled:
+        yield None
+        return
+
+    record = RunRecord(name, attributes)
+    token = _current_run.set(record)
+    try:
+        yield record
+    except Exception as e:
+        record.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_run.reset(token)
+        record.duration = time.perf_counter() - record.started
+        print(json.dumps(record.to_dict(), default=str))
@@ -1,18 +1,93 @@
-from config import get_config
+import sys
+import engagement
+import instrumentation
+import storage_manager
+import worker
+from config import get_bool, get_config
 from quote_bot import QuoteBot
+from scheduler import AccountScheduler, load_accounts
 
 
 def trigger_tweet(event, context):
     config = get_config()
-    quote_bot = QuoteBot(config)
-    quote_bot.generate_and_post()
+    run_id = getattr(context, "event_id", None)
+    try:
+        with instrumentation.run(
+            "trigger_tweet",
+            enabled=get_bool(config, "INSTRUMENTATION_ENABLED"),
+            run_id=run_id,
+        ):
+            quote_bot = QuoteBot(config)
+            if get_bool(config, "POST_QUEUE_ENABLED"):
+                quote_bot.publish_next(run_id)
+                quote_bot.top_up_queue()
+            else:
+                quote_bot.generate_and_post(run_id)
+    finally:
+        storage_manager.wait_for_pending_deletes()
+
+
+def trigger_accounts(event, context):
+    """
+    Multi-account entry point: run every due account from the account
+    definitions, and raise if any failed so Pub/Sub redelivers the event.
+    """
+    config = get_config()
+    run_id = getattr(context, "event_id", None)
+    try:
+        with instrumentation.run(
+            "trigger_accounts",
+            enabled=get_bool(config, "INSTRUMENTATION_ENABLED"),
+            run_id=run_id,
+        ):
+            results = AccountScheduler(config, load_accounts(config)).run(run_id)
+    finally:
+        storage_manager.wait_for_pending_deletes()
+
+    failed = [account for account, result in results.items() if not result["ok"]]
+    if failed:
+        raise Exception(f"Accounts failed: {', '.join(failed)}")
+    return results
+
+
+def fill_queue(event, context):
+    config = get_config()
+    try:
+        with instrumentation.run(
+            "fill_queue", enabled=get_bool(config, "INSTRUMENTATION_ENABLED")
+        ):
+            quote_bot = QuoteBot(config)
+            quote_bot.fill_queue()
+    finally:
+        storage_manager.wait_for_pending_deletes()
+
+
+def collect_metrics(event, context):
+    """
+    Engagement entry point: refresh the metrics of the recent posts and the
+    per-domain aggregates the next quotes are weighted with.
+    """
+    config = get_config()
+    with instrumentation.run(
+        "collect_metrics", enabled=get_bool(config, "INSTRUMENTATION_ENABLED")
+    ):
+        return engagement.collect_engagement(config)
 
 
 def main():
     config = get_config()
-    quote_bot = QuoteBot(config)
-    quote_bot.generate_and_post()
+    try:
+        with instrumentation.run(
+            "main", enabled=get_bool(config, "INSTRUMENTATION_ENABLED")
+        ):
+            quote_bot = QuoteBot(config)
+            quote_bot.generate_and_post()
+    finally:
+        storage_manager.wait_for_pending_deletes()
 
 
 if __name__ == "__main__":
-    main()
+    if sys.argv[1:] == ["worker"]:
+        worker.main()
+    else:
+        main()
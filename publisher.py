@@ -0,0 +1,120 @@
+import contextlib
+import contextvars
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from instrumentation import span
+
+
+class PlatformUnavailable(Exception):
+    """
+    Raised by a publisher whose platform cannot be used at all, such as one
+    that is not set up, so the platform is skipped rather than retried.
+    """
+
+
+def publish_all(publishers, timeout=120, max_workers=4, timeouts=None, limits=None):
+    """
+    Run every publisher concurrently and collect one result per platform.
+
+    A publisher is considered successful when it returns something other than
+    None without raising, and skipped when it raises PlatformUnavailable.
+    Publishers that are still running once their timeout expires are reported
+    as timed out and left to finish in the background.
+
+    Args:
+        publishers: A dictionary mapping a platform name to a zero-argument callable.
+        timeout: Default number of seconds each publisher is allowed to run.
+        max_workers: Maximum number of publishers running at the same time.
+        timeouts: Optional dictionary of per-platform timeouts overriding the default.
+        limits: Optional dictionary of per-platform semaphores, shared between
+            concurrent calls to bound how many publish to a platform at once.
+
+    Returns:
+        A dictionary mapping each platform name to a dictionary with the keys
+        "ok", "skipped", "result", "error" and "elapsed". Timed out platforms
+        also have a "future", which resolves to their late result.
+    """
+    timeouts = timeouts or {}
+    limits = limits or {}
+    results = {}
+    if not publishers:
+        return results
+
+    executor = ThreadPoolExecutor(
+        max_workers=max(1, min(max_workers, len(publishers))),
+        thread_name_prefix="publisher",
+    )
+    started = time.monotonic()
+    futures = {
+        executor.submit(
+            contextvars.copy_context().run,
+            _run_publisher,
+            name,
+            publish,
+            limits.get(name),
+        ): name
+        for name, publish in publishers.items()
+    }
+    deadlines = {name: started + timeouts.get(name, timeout) for name in publishers}
+    pending = set(futures)
+
+    try:
+        while pending:
+            next_deadline = min(deadlines[futures[future]] for future in pending)
+            done, pending = wait(
+                pending,
+                timeout=max(0, next_deadline - time.monotonic()),
+                return_when=FIRST_COMPLETED,
+            )
+            for future in done:
+                results[futures[future]] = future.result()
+
+            now = time.monotonic()
+            for future in [f for f in pending if deadlines[futures[f]] <= now]:
+                pending.discard(future)
+                name = futures[future]
+                results[name] = {
+                    "ok": False,
+                    "skipped": False,
+                    "result": None,
+                    "error": f"Timed out after {timeouts.get(name, timeout)} seconds",
+                    "elapsed": now - started,
+                }
+                if not future.cancel():
+                    results[name]["future"] = future
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return results
+
+
+def _run_publisher(name, publish, limit=None):
+    started = time.monotonic()
+    try:
+        with limit or contextlib.nullcontext():
+            with span(f"publish.{name}"):
+                result = publish()
+    except PlatformUnavailable as e:
+        return {
+            "ok": False,
+            "skipped": True,
+            "result": None,
+            "error": str(e),
+            "elapsed": time.monotonic() - started,
+        }
+    except Exception as e:
+        return {
+            "ok": False,
+            "skipped": False,
+            "result": None,
+            "error": str(e),
+            "elapsed": time.monotonic() - started,
+        }
+
+    return {
+        "ok": result is not None,
+        "skipped": False,
+        "result": result,
+        "error": None if result is not None else "Publisher returned no result",
+        "elapsed": time.monotonic() - started,
+    }
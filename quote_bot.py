@@ -1,21 +1,441 @@
+import contextvars
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from config import get_bool, get_float, get_int
+from publisher import publish_all
+from rate_limiter import throttled_platforms
+from instrumentation import span
+from image_artifact import ImageArtifact
+from image_processing import ImageVariants, get_worker
+from mongo_manager import (
+    QUEUE_LEASE,
+    count_ready_posts,
+    enqueue_post,
+    get_checkpoint,
+    hold_post,
+    mark_post_published,
+    pop_ready_post,
+    record_publication,
+    release_post,
+    save_checkpoint,
+    scoped_id,
+)
+from storage_manager import (
+    QUEUE_PREFIX,
+    RUNS_PREFIX,
+    delete_image_later,
+    upload_image,
+)
 from twitter_manager import TwitterManager
 from instagram_manager import InstagramManager
+from threads_manager import ThreadsManager
 from content_generator import ContentGenerator
 
+POST_FIELDS = ("quote", "quote_text", "image_description", "image_url")
+
+# Publishers that timed out and are still running, by scoped run ID and
+# platform, so a retry in this process can wait for their late result.
+_late_posts = {}
+
 
 class QuoteBot:
-    def __init__(self, config):
+    def __init__(self, config, platform_limits=None):
+        self.config = config
+        self.platform_limits = platform_limits
         self.twitter_manager = TwitterManager(config)
         self.instagram_manager = InstagramManager(config)
         self.content_generator = ContentGenerator(config)
+        self.threads_manager = None
+        if (
+            get_bool(config, "THREADS_ENABLED")
+            and config.get("INSTAGRAM_USERNAME")
+            and config.get("INSTAGRAM_PASSWORD")
+        ):
+            self.threads_manager = ThreadsManager(config)
+
+    def generate_and_post(self, run_id=None):
+        """
+        Generate a post and publish it everywhere.
+
+        When a run ID (the Pub/Sub event ID) is given, the output of every
+        stage is checkpointed under it, so a redelivered event resumes at the
+        first incomplete stage instead of starting over.
+        """
+        checkpoint = get_checkpoint(run_id) if run_id else {}
+        if checkpoint.get("completed_at"):
+            print(f"Run {run_id} was already completed, skipping.")
+            return {}
+
+        post = self.create_post(run_id, checkpoint)
+        image = post.get("image")
+        if image is None:
+            with span("stage.download_image"):
+                image = ImageArtifact.from_url(post["image_url"])
+
+        results = self.publish_post(post, image, run_id)
+        if run_id:
+            delete_image_later(post["image_url"])
+        return results
+
+    def create_post(self, run_id=None, checkpoint=None):
+        post = dict(checkpoint or {})
+
+        executor = self.description_executor()
+        try:
+            descriptions = {}
+            if "quote" not in post:
+                with span("stage.quote"):
+                    self.generate_quote_stage(run_id, post, executor, descriptions)
+
+            if "image_description" not in post:
+                with span("stage.description"):
+                    if post["quote_text"] in descriptions:
+                        detailed_description = descriptions[post["quote_text"]].result()
+                    else:
+                        detailed_description = (
+                            self.content_generator.generate_detailed_description(
+                                post["quote_text"]
+                            )
+                        )
+                self.save_stage(run_id, post, image_description=detailed_description)
+        finally:
+            if executor is not None:
+                # The descriptions of rejected quotes are not waited for.
+                executor.shutdown(wait=False, cancel_futures=True)
+
+        if "image_url" not in post:
+            with span("stage.image"):
+                image_url = self.content_generator.generate_image(
+                    post["image_description"]
+                )
+                post["image"] = ImageArtifact.from_url(image_url)
+                if run_id:
+                    # DALL-E URLs expire, so keep a copy a retry can still fetch.
+                    image_url = upload_image(
+                        post["image"].data,
+                        f"{RUNS_PREFIX}{run_id}.{post['image'].extension}",
+                        post["image"].content_type,
+                    )
+            self.save_stage(run_id, post, image_url=image_url)
+
+        return post
+
+    def description_executor(self):
+        """
+        With streamed completions, the description of a quote is requested on
+        this executor as soon as the quote text streams in, while the rest of
+        the caption is still arriving, or None without streaming.
+        """
+        if get_bool(self.config, "STREAM_COMPLETIONS") and not get_bool(
+            self.config, "STRUCTURED_GENERATION"
+        ):
+            return ThreadPoolExecutor(
+                max_workers=get_int(self.config, "QUOTE_ATTEMPTS", 3),
+                thread_name_prefix="description",
+            )
+        return None
+
+    def generate_quote_stage(self, run_id, post, executor=None, descriptions=None):
+        if get_bool(self.config, "STRUCTURED_GENERATION"):
+            generated = self.content_generator.generate_post()
+            self.save_stage(
+                run_id,
+                post,
+                quote=generated["quote"],
+                quote_text=generated["quote_text"],
+                image_description=generated["image_description"],
+            )
+        else:
+            quote, quote_text = self.content_generator.generate_quote(
+                self.description_starter(executor, descriptions)
+            )
+            self.save_stage(run_id, post, quote=quote, quote_text=quote_text)
+
+    def description_starter(self, executor, descriptions):
+        """
+        Build the callback that requests the description of a streamed quote
+        text on executor, or None without an executor.
+        """
+        if executor is None:
+            return None
+
+        def start_description(quote_text):
+            descriptions[quote_text] = executor.submit(
+                contextvars.copy_context().run,
+                self.content_generator.generate_detailed_description,
+                quote_text,
+            )
+
+        return start_description
+
+    def save_stage(self, run_id, post, **fields):
+        post.update(fields)
+        if run_id:
+            save_checkpoint(run_id, fields)
+
+    def prepare_post(self, post=None):
+        """
+        Generate a post and park it in the ready queue with its image in GCS,
+        since the DALL-E URL expires long before the post is published.
+
+        Stages already present in post, such as a quote and description
+        generated in bulk, are not generated again.
+        """
+        post = self.create_post(checkpoint=post)
+        image = post["image"]
+        post["image_url"] = upload_image(
+            image.data,
+            f"{QUEUE_PREFIX}{uuid.uuid4().hex}.{image.extension}",
+            image.content_type,
+        )
+        return enqueue_post({field: post[field] for field in POST_FIELDS})
+
+    def fill_queue(self, size=None):
+        """
+        Generate posts until the ready queue holds the configured number of posts.
+
+        Returns:
+            The number of posts that were generated.
+        """
+        size = size or get_int(self.config, "POST_QUEUE_SIZE", 5)
+        missing = max(0, size - count_ready_posts())
+        for _ in range(missing):
+            self.prepare_post()
+        return missing
+
+    def top_up_queue(self):
+        """
+        Refill the ready queue once it runs low, after a post was published.
 
-    def generate_and_post(self):
-        quote, quote_text = self.content_generator.generate_quote()
-        detailed_description = self.content_generator.generate_detailed_description(
-            quote_text
+        A failure is logged rather than raised, since the post is already out
+        and a redelivered event must not look like a failed publish. The
+        scheduled fill_queue job catches up.
+
+        Returns:
+            The number of posts that were generated.
+        """
+        try:
+            if count_ready_posts() < get_int(self.config, "POST_QUEUE_LOW_WATER", 2):
+                return self.fill_queue()
+        except Exception as e:
+            print(f"An error occurred while topping up the post queue: {e}")
+        return 0
+
+    def publish_next(self, run_id=None):
+        """
+        Publish the next ready post from the queue, generating one inline if
+        the queue is empty.
+
+        The post is claimed for POST_QUEUE_LEASE seconds, and held for the run
+        once it is checkpointed. It is marked published once any platform
+        published it, and returned to the queue if none did. A run that fell
+        back to inline generation resumes it on retry instead of claiming a
+        queued post.
+        """
+        checkpoint = get_checkpoint(run_id) if run_id else {}
+        if checkpoint.get("completed_at"):
+            print(f"Run {run_id} was already completed, skipping.")
+            return {}
+
+        if "queue_id" in checkpoint:
+            post = checkpoint
+        elif "quote" in checkpoint or "posts" in checkpoint:
+            return self.generate_and_post(run_id)
+        else:
+            queued_post = pop_ready_post(
+                get_int(self.config, "POST_QUEUE_LEASE", QUEUE_LEASE)
+            )
+            if queued_post is None:
+                print("The post queue is empty, generating a post inline.")
+                return self.generate_and_post(run_id)
+            post = {}
+            self.save_stage(
+                run_id,
+                post,
+                queue_id=queued_post["_id"],
+                **{field: queued_post[field] for field in POST_FIELDS},
+            )
+            if run_id:
+                hold_post(queued_post["_id"])
+
+        with span("stage.download_image"):
+            image = ImageArtifact.from_url(post["image_url"])
+        results = self.publish_post(post, image, run_id)
+        if any(result["ok"] for result in results.values()) or post.get("posts"):
+            mark_post_published(post["queue_id"], results)
+            delete_image_later(post["image_url"])
+        else:
+            release_post(post["queue_id"])
+        return results
+
+    def publish_post(self, post, image, run_id=None):
+        """
+        Publish to every platform that does not already have a checkpointed
+        post, and raise if any platform failed so the event is redelivered.
+
+        Skipped platforms, rate limited or unavailable, do not fail the run, and
+        after PUBLISH_MAX_ATTEMPTS attempts the run completes with whatever
+        was published. A platform that timed out on an earlier attempt in this
+        process is waited for, and its late post recorded, before it is
+        retried.
+        """
+        if run_id:
+            self.collect_late_posts(run_id, post)
+            self.save_stage(
+                run_id, post, publish_attempts=post.get("publish_attempts", 0) + 1
+            )
+        published = post.get("posts", {})
+        with span("stage.publish"):
+            results = self.publish(
+                post["quote"], post["quote_text"], image, skip=published
+            )
+        self.record_post_ids(post, results)
+
+        if not run_id:
+            return results
+
+        for platform, result in results.items():
+            if result["ok"]:
+                self.save_post_id(run_id, post, platform, result)
+            elif result.get("future") is not None:
+                self.watch_late_post(run_id, post, platform, result["future"])
+
+        failed = [
+            platform
+            for platform, result in results.items()
+            if not result["ok"] and not result.get("skipped")
+        ]
+        if failed:
+            attempts = post["publish_attempts"]
+            if attempts < get_int(self.config, "PUBLISH_MAX_ATTEMPTS", 5):
+                raise Exception(
+                    f"Publishing failed on {', '.join(failed)}, run {run_id} will resume on retry"
+                )
+            print(
+                f"Giving up on {', '.join(failed)} after {attempts} attempts of run {run_id}."
+            )
+
+        save_checkpoint(run_id, {"completed_at": datetime.now(timezone.utc)})
+        return results
+
+    def save_post_id(self, run_id, post, platform, result):
+        post.setdefault("posts", {})[platform] = {"id": post_id(result["result"])}
+        save_checkpoint(run_id, {f"posts.{platform}": post["posts"][platform]})
+
+    def watch_late_post(self, run_id, post, platform, future):
+        """
+        Checkpoint the post of a timed out publisher if it still succeeds, so
+        a retry does not publish it twice.
+        """
+        key = (scoped_id(run_id), platform)
+        context = contextvars.copy_context()
+
+        def on_done(future):
+            result = None if future.cancelled() else future.result()
+            if result and result["ok"]:
+                try:
+                    context.run(self.save_post_id, run_id, post, platform, result)
+                    context.run(self.record_post_ids, post, {platform: result})
+                except Exception as e:
+                    print(f"Could not record the late {platform} post: {e}")
+            _late_posts.pop(key, None)
+
+        _late_posts[key] = future
+        future.add_done_callback(on_done)
+
+    def collect_late_posts(self, run_id, post):
+        """
+        Wait for the publishers of this run that timed out on an earlier
+        attempt, and take the posts they recorded into account.
+        """
+        late = {
+            platform: future
+            for (key, platform), future in list(_late_posts.items())
+            if key == scoped_id(run_id)
+        }
+        if not late:
+            return
+        with span("stage.wait_late_posts", platforms=len(late)):
+            wait(late.values(), timeout=get_float(self.config, "PUBLISH_TIMEOUT", 120))
+        for platform, future in late.items():
+            if future.done() and not future.cancelled() and future.result()["ok"]:
+                self.save_post_id(run_id, post, platform, future.result())
+
+    def record_post_ids(self, post, results):
+        """
+        Store the IDs of the new posts with the archived quote, so the
+        engagement job can fetch their metrics.
+        """
+        posts = {
+            platform: post_id(result["result"])
+            for platform, result in results.items()
+            if result["ok"]
+        }
+        if not posts:
+            return
+        try:
+            record_publication(post["quote_text"], posts)
+        except Exception as e:
+            print(f"Could not record the post IDs: {e}")
+
+    def publish(self, quote, quote_text, image, skip=()):
+        variants = ImageVariants(
+            image,
+            executor=(
+                get_worker() if get_bool(self.config, "IMAGE_WORKER_PROCESS") else None
+            ),
         )
-        image_url = self.content_generator.generate_image(detailed_description)
+        publishers = {
+            "instagram": lambda: self.instagram_manager.post_on_instagram(
+                quote, variants.get("instagram")
+            ),
+            "twitter": lambda: self.twitter_manager.tweet_quote_and_image(
+                quote, variants.get("twitter")
+            ),
+        }
+        if self.threads_manager:
+            publishers["threads"] = lambda: self.threads_manager.thread_quote_and_image(
+                quote_text, variants.get("threads")
+            )
+        for platform in skip:
+            publishers.pop(platform, None)
+
+        # Platforms out of quota are skipped for this post instead of burning
+        # calls that will fail. A retry does not publish to them either.
+        throttled = throttled_platforms(publishers)
+        for platform in throttled:
+            publishers.pop(platform)
+
+        results = publish_all(
+            publishers,
+            timeout=get_float(self.config, "PUBLISH_TIMEOUT", 120),
+            max_workers=get_int(self.config, "PUBLISH_MAX_WORKERS", 4),
+            limits=self.platform_limits,
+        )
+        for platform, reset_at in throttled.items():
+            reset = datetime.fromtimestamp(reset_at, timezone.utc).isoformat()
+            results[platform] = {
+                "ok": False,
+                "skipped": True,
+                "result": None,
+                "error": f"rate limited until {reset}",
+                "elapsed": 0.0,
+            }
+
+        for platform, result in results.items():
+            if result.get("skipped"):
+                print(f"Skipped publishing to {platform}: {result['error']}")
+            elif not result["ok"]:
+                print(f"Publishing to {platform} failed: {result['error']}")
+
+        return results
 
-        self.instagram_manager.post_on_instagram(quote, image_url)
 
-        self.twitter_manager.tweet_quote_and_image(quote, image_url)
+def post_id(result):
+    """
+    Extract the platform post ID from a publisher result.
+    """
+    if isinstance(result, dict):
+        return str(result.get("id", ""))
+    return str(result)
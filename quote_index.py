@@ -0,0 +1,144 @@
+import hashlib
+import re
+import unicodedata
+import zlib
+import numpy as np
+
+# The Mersenne prime 2**31 - 1: with hashes and coefficients reduced below it,
+# a * hash + b stays below 2**63 and never wraps around in uint64.
+_PRIME = np.uint64(2**31 - 1)
+
+
+def normalize_quote(text):
+    """
+    Lowercase a quote, strip accents and punctuation, and collapse whitespace.
+    """
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    text = re.sub(r"[^\w\s]", " ", text.casefold())
+    return " ".join(text.split())
+
+
+def quote_hash(text):
+    return hashlib.sha1(normalize_quote(text).encode("utf-8")).hexdigest()
+
+
+class QuoteIndex:
+    """
+    In-memory near-duplicate index over quote history.
+
+    Exact repeats are caught with a hash of the normalized text. Near repeats
+    are caught by comparing character n-gram MinHash signatures, which gives
+    an estimate of the Jaccard similarity against every indexed quote in one
+    vectorized NumPy pass.
+    """
+
+    def __init__(self, num_perm=128, ngram=4, threshold=0.6, seed=1):
+        rng = np.random.default_rng(seed)
+        self.ngram = ngram
+        self.threshold = threshold
+        self._a = rng.integers(1, _PRIME, size=(num_perm, 1), dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, size=(num_perm, 1), dtype=np.uint64)
+        self._signatures = np.empty((64, num_perm), dtype=np.uint64)
+        self._quotes = []
+        self._hashes = {}
+
+    @classmethod
+    def from_quotes(cls, quotes, **kwargs):
+        index = cls(**kwargs)
+        for quote in quotes:
+            index.add(quote)
+        return index
+
+    def __len__(self):
+        return len(self._quotes)
+
+    def latest(self, count):
+        """
+        The most recently indexed quotes, oldest first.
+        """
+        return self._quotes[-count:]
+
+    def __contains__(self, text):
+        return quote_hash(text) in self._hashes
+
+    def signature(self, text):
+        normalized = normalize_quote(text)
+        if len(normalized) <= self.ngram:
+            shingles = {normalized}
+        else:
+            shingles = {
+                normalized[i : i + self.ngram]
+                for i in range(len(normalized) - self.ngram + 1)
+            }
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) for shingle in shingles),
+            dtype=np.uint64,
+            count=len(shingles),
+        )
+        return ((self._a * (hashes % _PRIME) + self._b) % _PRIME).min(axis=1)
+
+    def add(self, text):
+        """
+        Index a quote. Returns False if the exact same quote was already indexed.
+        """
+        digest = quote_hash(text)
+        if digest in self._hashes:
+            return False
+
+        if len(self._quotes) == len(self._signatures):
+            self._signatures = np.concatenate(
+                [self._signatures, np.empty_like(self._signatures)]
+            )
+        self._signatures[len(self._quotes)] = self.signature(text)
+        self._quotes.append(text)
+        self._hashes[digest] = text
+        return True
+
+    def similarities(self, text):
+        """
+        Estimated Jaccard similarity of the text to every indexed quote.
+        """
+        count = len(self._quotes)
+        if not count:
+            return np.empty(0)
+        return (self._signatures[:count] == self.signature(text)).mean(axis=1)
+
+    def max_similarities(self, texts):
+        """
+        Highest estimated similarity of each text to the indexed quotes, with
+        every text compared against every quote in one vectorized pass.
+        Exact repeats score 1.
+        """
+        texts = list(texts)
+        count = len(self._quotes)
+        if not texts or not count:
+            return np.zeros(len(texts))
+        signatures = np.stack([self.signature(text) for text in texts])
+        scores = (
+            (signatures[:, None, :] == self._signatures[None, :count, :])
+            .mean(axis=2)
+            .max(axis=1)
+        )
+        exact = np.fromiter(
+            (quote_hash(text) in self._hashes for text in texts),
+            dtype=bool,
+            count=len(texts),
+        )
+        return np.where(exact, 1.0, scores)
+
+    def most_similar(self, text):
+        """
+        Return the closest indexed quote and its estimated similarity.
+        """
+        digest = quote_hash(text)
+        if digest in self._hashes:
+            return self._hashes[digest], 1.0
+        scores = self.similarities(text)
+        if not len(scores):
+            return None, 0.0
+        best = int(scores.argmax())
+        return self._quotes[best], float(scores[best])
+
+    def is_duplicate(self, text):
+        return self.most_similar(text)[1] >= self.threshold
@@ -0,0 +1,180 @@
+import re
+from collections import Counter
+import numpy as np
+
+# The character limit of a caption on each platform. Twitter is the tightest,
+# and every post goes to Twitter.
+CAPTION_LIMITS = {"twitter": 280, "threads": 500, "instagram": 2200}
+
+# The number of recent quotes domains are balanced against.
+BALANCE_WINDOW = 50
+
+# Keywords that place a quote or caption in one of the domains the prompt
+# asks to represent equally.
+DOMAIN_KEYWORDS = {
+    "artificial intelligence": (
+        "ai",
+        "artificial intelligence",
+        "machine learning",
+        "ml",
+        "neural",
+        "intelligence",
+        "machines",
+        "deep learning",
+    ),
+    "web3 development": (
+        "web3",
+        "blockchain",
+        "crypto",
+        "decentralized",
+        "decentralization",
+        "ethereum",
+        "bitcoin",
+        "smart contract",
+    ),
+    "software development": (
+        "code",
+        "coding",
+        "programming",
+        "programmer",
+        "software",
+        "developer",
+        "debugging",
+        "bugs",
+    ),
+    "game development": (
+        "game",
+        "games",
+        "gaming",
+        "gamedev",
+        "play",
+        "player",
+        "players",
+    ),
+    "cybersecurity": (
+        "security",
+        "cybersecurity",
+        "infosec",
+        "hacker",
+        "hackers",
+        "privacy",
+        "encryption",
+        "password",
+    ),
+    "data science": (
+        "data",
+        "datascience",
+        "statistics",
+        "analytics",
+        "bigdata",
+        "insight",
+        "insights",
+    ),
+}
+
+
+def classify_domain(text):
+    """
+    Return the domain whose keywords appear most often in a text, or None.
+    """
+    words = " " + " ".join(re.findall(r"\w+", text.casefold())) + " "
+    counts = {
+        domain: sum(words.count(f" {keyword} ") for keyword in keywords)
+        for domain, keywords in DOMAIN_KEYWORDS.items()
+    }
+    domain, count = max(counts.items(), key=lambda item: item[1])
+    return domain if count else None
+
+
+def domain_shares(quotes):
+    """
+    The share of each domain among the classified quotes.
+    """
+    domains = Counter(
+        domain for domain in map(classify_domain, quotes) if domain is not None
+    )
+    total = sum(domains.values())
+    return {domain: count / total for domain, count in domains.items()}
+
+
+def score_candidates(
+    candidates, quote_index, recent_quotes=None, max_length=None, balance_weight=0.5
+):
+    """
+    Score candidate posts from one multi-choice completion.
+
+    A candidate that failed to parse, was cut off at the token limit, has a
+    caption over max_length or is a near-duplicate of the history is
+    infeasible. The others score higher the further they are from the
+    history and the less their domain is represented in recent_quotes.
+
+    Args:
+        candidates: Dictionaries with the keys "quote" (the caption),
+            "quote_text" and "truncated", or None for an unparsable reply.
+        quote_index: The QuoteIndex of the history.
+        recent_quotes: The quotes to balance domains against, by default the
+            latest indexed quotes.
+        max_length: The longest caption every platform accepts.
+
+    Returns:
+        A NumPy array of scores, -inf for infeasible candidates.
+    """
+    max_length = max_length or min(CAPTION_LIMITS.values())
+    valid = np.array(
+        [
+            candidate is not None and not candidate.get("truncated")
+            for candidate in candidates
+        ],
+        dtype=bool,
+    )
+    texts = [candidate["quote_text"] if candidate else "" for candidate in candidates]
+    captions = [candidate["quote"] if candidate else "" for candidate in candidates]
+    lengths = np.array([len(caption) for caption in captions])
+    similarities = quote_index.max_similarities(texts)
+    if recent_quotes is None:
+        recent_quotes = quote_index.latest(BALANCE_WINDOW)
+    shares = domain_shares(recent_quotes)
+    balance = np.array(
+        [shares.get(classify_domain(caption), 0.0) for caption in captions]
+    )
+
+    feasible = valid & (lengths <= max_length) & (similarities < quote_index.threshold)
+    return np.where(feasible, (1 - similarities) - balance_weight * balance, -np.inf)
+
+
+def ranked_candidates(candidates, scores):
+    """
+    The feasible candidates, best first.
+    """
+    order = np.argsort(-scores, kind="stable")
+    return [candidates[i] for i in order if np.isfinite(scores[i])]
+
+
+def domain_weights(stats, min_posts=3, floor=0.05):
+    """
+    Weight each domain by its engagements per post, for choosing the domain of
+    the next quote.
+
+    Domains with fewer than min_posts measured posts get the mean rate, so a
+    new domain is still explored, and no domain falls below a floor share.
+
+    Args:
+        stats: The per-domain aggregates, see mongo_manager.get_domain_stats.
+
+    Returns:
+        A dictionary mapping every domain to its weight, summing to 1, or an
+        empty dictionary when no domain has enough posts yet.
+    """
+    rates = {
+        domain: values["engagements"] / values["posts"]
+        for domain, values in stats.items()
+        if domain in DOMAIN_KEYWORDS and values.get("posts", 0) >= min_posts
+    }
+    if not rates:
+        return {}
+    mean = sum(rates.values()) / len(rates)
+    scores = np.array([rates.get(domain, mean) for domain in DOMAIN_KEYWORDS])
+    if scores.sum() <= 0:
+        scores = np.ones(len(scores))
+    weights = np.maximum(scores / scores.sum(), floor)
+    return dict(zip(DOMAIN_KEYWORDS, (weights / weights.sum()).tolist()))
@@ -0,0 +1,179 @@
+import json
+import random
+import time
+import requests
+from config import get_float, get_int
+from instrumentation import span
+from mongo_manager import get_rate_limits, save_rate_limit
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# A POST that failed with a 5xx may still have created the post, so only a
+# rejected one is retried.
+POST_RETRY_STATUSES = (429,)
+# The Graph API reports usage as a percentage of a rolling one-hour window.
+GRAPH_USAGE_WINDOW = 3600
+
+PLATFORM_ENDPOINTS = {
+    "twitter": ("twitter.upload", "twitter.tweet"),
+    "instagram": ("graph.media", "graph.container_status", "graph.media_publish"),
+}
+
+
+def parse_rate_limit(response, now=None):
+    """
+    Read the quota reported by a response, from the Twitter x-rate-limit-*
+    headers or the Graph API X-App-Usage header.
+
+    Returns:
+        A dictionary with the keys "remaining", "limit" and "reset_at" (a Unix
+        timestamp, or None when unknown), or None if the response reports no
+        quota.
+    """
+    now = time.time() if now is None else now
+    headers = response.headers
+
+    remaining = headers.get("x-rate-limit-remaining")
+    if isinstance(remaining, str):
+        limit = headers.get("x-rate-limit-limit")
+        reset = headers.get("x-rate-limit-reset")
+        return {
+            "remaining": int(remaining),
+            "limit": int(limit) if isinstance(limit, str) else None,
+            "reset_at": float(reset) if isinstance(reset, str) else None,
+        }
+
+    usage = headers.get("x-app-usage")
+    if isinstance(usage, str):
+        try:
+            used = max(float(value) for value in json.loads(usage).values())
+        except (ValueError, TypeError, AttributeError):
+            return None
+        remaining = max(0, 100 - int(used))
+        return {
+            "remaining": remaining,
+            "limit": 100,
+            "reset_at": now + GRAPH_USAGE_WINDOW if remaining == 0 else None,
+        }
+
+    return None
+
+
+def retry_delay(response, attempt, backoff, now=None):
+    """
+    Seconds to wait before retrying a failed response, or a request that got
+    no response: what Retry-After or the rate-limit reset asks for, or
+    exponential backoff with jitter otherwise.
+    """
+    now = time.time() if now is None else now
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if isinstance(retry_after, str) and retry_after.isdigit():
+        return float(retry_after)
+    if response is not None and response.status_code == 429:
+        quota = parse_rate_limit(response, now)
+        if quota and quota["reset_at"]:
+            return max(0.0, quota["reset_at"] - now)
+    interval = backoff * 2**attempt
+    return random.uniform(interval / 2, interval)
+
+
+def throttled_platforms(platforms, now=None):
+    """
+    Find the platforms whose persisted quota is used up.
+
+    Returns:
+        A dictionary mapping each throttled platform to the Unix timestamp at
+        which its quota resets.
+    """
+    now = time.time() if now is None else now
+    endpoints = [
+        endpoint
+        for platform in platforms
+        for endpoint in PLATFORM_ENDPOINTS.get(platform, ())
+    ]
+    if not endpoints:
+        return {}
+
+    quotas = get_rate_limits(endpoints)
+    throttled = {}
+    for platform in platforms:
+        for endpoint in PLATFORM_ENDPOINTS.get(platform, ()):
+            quota = quotas.get(endpoint, {})
+            reset_at = quota.get("reset_at")
+            if quota.get("remaining") == 0 and reset_at and reset_at > now:
+                throttled[platform] = max(reset_at, throttled.get(platform, 0))
+    return throttled
+
+
+class RateLimiter:
+    def __init__(self, config):
+        self.attempts = max(1, get_int(config, "RATE_LIMIT_ATTEMPTS", 3))
+        self.backoff = get_float(config, "RATE_LIMIT_BACKOFF", 1)
+        self.max_wait = get_float(config, "RATE_LIMIT_MAX_WAIT", 30)
+        self.low_water = get_float(config, "RATE_LIMIT_LOW_WATER", 0.1)
+        self._saved_quotas = {}
+
+    def request(self, session, method, url, endpoint, idempotent=None, **kwargs):
+        """
+        Send a request through a session, retrying 429 and 5xx responses, and
+        persist the quota the endpoint reports.
+
+        A POST is only retried on 429, unless it is marked idempotent. An
+        idempotent request is also retried when the connection fails.
+
+        Retries stop when the attempts are exhausted or when the next one
+        would have to wait longer than max_wait, for example until a rate
+        limit resets later in the day. The last response is returned either way.
+        """
+        send = getattr(session, method)
+        if idempotent is None:
+            idempotent = method != "post"
+        retry_statuses = RETRY_STATUSES if idempotent else POST_RETRY_STATUSES
+        for attempt in range(self.attempts):
+            try:
+                response = send(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if not idempotent or attempt + 1 == self.attempts:
+                    raise
+                response, error = None, e
+            else:
+                error = response.status_code
+                now = time.time()
+                quota = parse_rate_limit(response, now)
+                if quota:
+                    self.save_quota(endpoint, quota)
+
+                if response.status_code not in retry_statuses:
+                    return response
+                if attempt + 1 == self.attempts:
+                    break
+
+            delay = retry_delay(response, attempt, self.backoff)
+            if delay > self.max_wait:
+                print(f"{endpoint} is rate limited for {delay:.0f}s, not retrying")
+                break
+
+            print(f"{endpoint} returned {error}, retrying in {delay:.2f}s")
+            with span("rate_limit.wait", endpoint=endpoint, delay=round(delay, 3)):
+                time.sleep(delay)
+
+        return response
+
+    def save_quota(self, endpoint, quota):
+        """
+        Persist a quota the first time an endpoint reports it, when its window
+        or limit changes, and whenever it changes once below the low-water
+        fraction of the limit, rather than on every request.
+        """
+        saved = self._saved_quotas.get(endpoint)
+        low = quota["remaining"] <= max(1, (quota["limit"] or 0) * self.low_water)
+        if saved is not None and (
+            saved == quota
+            or (
+                not low
+                and saved["limit"] == quota["limit"]
+                and saved["reset_at"] == quota["reset_at"]
+            )
+        ):
+            return
+        save_rate_limit(endpoint, quota)
+        self._saved_quotas[endpoint] = quota
@@ -0,0 +1,131 @@
+import contextvars
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import get_bool, get_int
+from instrumentation import span
+from mongo_manager import account_scope, claim_account, get_accounts, release_account
+from quote_bot import QuoteBot
+
+DEFAULT_INTERVAL_MINUTES = 24 * 60
+
+
+def load_accounts(config):
+    """
+    Load the account definitions from the JSON file at ACCOUNTS_FILE, or from
+    the accounts collection in MongoDB when ACCOUNTS_SOURCE is "mongo".
+
+    An account is a dictionary with an "id" (or "_id"), an optional
+    "interval_minutes" between two posts, an optional "enabled" flag and a
+    "config" dictionary overriding the base configuration, typically with the
+    account's own Twitter, Instagram and Threads credentials and QUOTE_PROMPT.
+
+    Returns:
+        A list of dictionaries with the keys "id", "interval" (in seconds) and
+        "config".
+    """
+    if config.get("ACCOUNTS_SOURCE") == "mongo":
+        accounts = get_accounts()
+    else:
+        with open(config.get("ACCOUNTS_FILE") or "accounts.json") as f:
+            accounts = json.load(f)
+
+    loaded = []
+    for account in accounts:
+        if not account.get("enabled", True):
+            continue
+        account_id = account.get("id") or account.get("_id")
+        if not account_id:
+            raise Exception(f"Account definition without an id: {account}")
+        loaded.append(
+            {
+                "id": str(account_id),
+                "interval": 60
+                * float(account.get("interval_minutes") or DEFAULT_INTERVAL_MINUTES),
+                "config": account.get("config") or {},
+            }
+        )
+    return loaded
+
+
+def parse_limits(value):
+    """
+    Parse a "platform=limit,platform=limit" setting into a dictionary.
+    """
+    limits = {}
+    for item in (value or "").split(","):
+        platform, _, limit = item.partition("=")
+        if platform.strip():
+            limits[platform.strip()] = int(limit)
+    return limits
+
+
+class AccountScheduler:
+    """
+    Runs every due account of a multi-account deployment in one process.
+
+    Accounts run on a bounded thread pool (ACCOUNT_MAX_WORKERS), each inside
+    its own account scope so their quote history, queue, checkpoints and rate
+    limits stay apart, while the OpenAI client, the HTTP connection pool and
+    the MongoDB client are shared. An account runs at most once at a time:
+    claiming it moves its next run forward atomically. PLATFORM_CONCURRENCY
+    bounds how many accounts publish to the same platform at once.
+    """
+
+    def __init__(self, config, accounts):
+        self.config = config
+        self.accounts = accounts
+        self.max_workers = get_int(config, "ACCOUNT_MAX_WORKERS", 4)
+        self.platform_limits = {
+            platform: threading.BoundedSemaphore(limit)
+            for platform, limit in parse_limits(
+                config.get("PLATFORM_CONCURRENCY")
+            ).items()
+        }
+
+    def run(self, run_id=None):
+        """
+        Claim and run every due account.
+
+        Returns:
+            A dictionary mapping each account that ran to a dictionary with
+            the keys "ok", "error" and "results".
+        """
+        due = [
+            account
+            for account in self.accounts
+            if claim_account(account["id"], account["interval"])
+        ]
+        if not due:
+            return {}
+
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(self.max_workers, len(due))),
+            thread_name_prefix="account",
+        ) as executor:
+            futures = {
+                account["id"]: executor.submit(
+                    contextvars.copy_context().run, self.run_account, account, run_id
+                )
+                for account in due
+            }
+            return {
+                account_id: future.result() for account_id, future in futures.items()
+            }
+
+    def run_account(self, account, run_id=None):
+        with account_scope(account["id"]), span("account", account=account["id"]):
+            try:
+                config = dict(self.config, **account["config"])
+                quote_bot = QuoteBot(config, platform_limits=self.platform_limits)
+                if get_bool(config, "POST_QUEUE_ENABLED"):
+                    results = quote_bot.publish_next(run_id)
+                    quote_bot.top_up_queue()
+                else:
+                    results = quote_bot.generate_and_post(run_id)
+            except Exception as e:
+                print(f"Account {account['id']} failed: {e}")
+                release_account(account["id"])
+                return {"ok": False, "error": str(e), "results": None}
+
+        return {"ok": True, "error": None, "results": results}
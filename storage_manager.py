@@ -0,0 +1,141 @@
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from google.cloud import storage
+from instrumentation import span
+
+BUCKET_NAME = "devwisdomdaily-image"
+STAGING_PREFIX = "staging/"
+RUNS_PREFIX = "runs/"
+QUEUE_PREFIX = "queue/"
+# Days after which the lifecycle rules delete the objects left under each
+# prefix: staged Instagram images are deleted once published, run images are
+# only needed while Pub/Sub still redelivers the run, and queued images wait
+# for the queue to drain.
+LIFECYCLE_AGE_DAYS = {STAGING_PREFIX: 1, RUNS_PREFIX: 7, QUEUE_PREFIX: 30}
+
+_client = None
+_bucket = None
+_lock = threading.Lock()
+_cleanup_executor = None
+_pending_deletes = set()
+
+
+def get_storage_client():
+    """
+    Return the process-wide storage client, so credential discovery and token
+    fetching happen once per instance rather than once per upload.
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = storage.Client()
+    return _client
+
+
+def get_bucket():
+    global _bucket
+    if _bucket is None:
+        bucket = get_storage_client().bucket(BUCKET_NAME)
+        with _lock:
+            if _bucket is None:
+                _bucket = bucket
+    return _bucket
+
+
+def reset_client():
+    global _client, _bucket
+    with _lock:
+        _client = None
+        _bucket = None
+
+
+def public_url(filename):
+    return f"https://storage.googleapis.com/{BUCKET_NAME}/{filename}"
+
+
+def staging_name(extension):
+    """
+    A unique object name under the staging prefix, so concurrent runs never
+    collide and the lifecycle rule can clean up anything left behind.
+    """
+    return f"{STAGING_PREFIX}{uuid.uuid4().hex}.{extension}"
+
+
+def upload_image(data, filename, content_type):
+    """
+    Upload image bytes to the public image bucket in a single request.
+
+    Returns:
+        The public URL of the uploaded object.
+    """
+    blob = get_bucket().blob(filename)
+    with span("gcs.upload", bytes=len(data)):
+        blob.upload_from_string(data, content_type=content_type)
+    return public_url(filename)
+
+
+def delete_image(url):
+    filename = url.split(f"/{BUCKET_NAME}/", 1)[-1]
+    with span("gcs.delete"):
+        get_bucket().blob(filename).delete()
+
+
+def delete_image_later(url):
+    """
+    Delete an object on a background thread, off the publishing critical path.
+    """
+    global _cleanup_executor
+    with _lock:
+        if _cleanup_executor is None:
+            _cleanup_executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="gcs-cleanup"
+            )
+        future = _cleanup_executor.submit(_delete_quietly, url)
+        _pending_deletes.add(future)
+    future.add_done_callback(_pending_deletes.discard)
+    return future
+
+
+def wait_for_pending_deletes(timeout=10):
+    """
+    Give background deletes a chance to finish before the instance is frozen.
+    Anything that does not finish is removed by the staging lifecycle rule.
+    """
+    with _lock:
+        pending = set(_pending_deletes)
+    if pending:
+        wait(pending, timeout=timeout)
+
+
+def ensure_staging_lifecycle_rule(age_days=LIFECYCLE_AGE_DAYS):
+    """
+    Add a bucket lifecycle rule per prefix deleting its objects after the
+    given number of days, as a safety net for deletes that never ran. Safe to
+    call repeatedly.
+
+    Returns:
+        True if a rule was added.
+    """
+    bucket = get_storage_client().get_bucket(BUCKET_NAME)
+    covered = {
+        tuple(rule.get("condition", {}).get("matchesPrefix", []))
+        for rule in bucket.lifecycle_rules
+        if rule.get("action", {}).get("type") == "Delete"
+    }
+    missing = {
+        prefix: age for prefix, age in age_days.items() if (prefix,) not in covered
+    }
+    for prefix, age in missing.items():
+        bucket.add_lifecycle_delete_rule(age=age, matches_prefix=[prefix])
+    if missing:
+        bucket.patch()
+    return bool(missing)
+
+
+def _delete_quietly(url):
+    try:
+        delete_image(url)
+    except Exception as e:
+        print(f"An error occurred while deleting {url} from GCS: {e}")
@@ -0,0 +1,38 @@
+from unittest.mock import patch
+import mongomock
+import pytest
+import content_generator
+import http_session
+import mongo_manager
+import quote_bot
+import storage_manager
+import threads_manager
+
+
+def reset_process_state():
+    """
+    Drop the clients, sessions and caches modules keep for the life of the
+    process, so every test starts cold.
+    """
+    mongo_manager._client = None
+    mongo_manager._archive_client = None
+    mongo_manager._quote_indexes.clear()
+    mongo_manager._recent_windows.clear()
+    content_generator._client = None
+    storage_manager.reset_client()
+    http_session.close_sessions()
+    threads_manager._clients.clear()
+    quote_bot._late_posts.clear()
+
+
+@pytest.fixture(autouse=True)
+def process_state():
+    """
+    Run every test against a fresh in-memory MongoDB and empty process caches.
+    """
+    reset_process_state()
+    with patch(
+        "mongo_manager.MongoClient", lambda *args, **kwargs: mongomock.MongoClient()
+    ):
+        yield
+    reset_process_state()
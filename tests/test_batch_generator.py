@@ -0,0 +1,215 @@
+import json
+from unittest.mock import MagicMock, patch
+import pytest
+from batch_generator import (
+    DOMAINS,
+    ingest_batch,
+    prepare_requests,
+    read_results,
+    submit_batch,
+    to_jsonl,
+    wait_for_batch,
+)
+from benchmarks.fake_servers import FakeServer
+from benchmarks.run_benchmark import offline_environment
+from mongo_manager import (
+    account_scope,
+    count_ready_posts,
+    get_batches_collection,
+    get_recent_quotes,
+    insert_quote,
+    iter_archived_quotes,
+)
+from quote_bot import QuoteBot
+
+ACCOUNTS = [{"id": "ai", "interval": 3600, "config": {"QUOTE_PROMPT": "AI quotes"}}]
+COMPLETED_BATCH = {"id": "batch_1", "status": "completed"}
+
+
+def post_content(quote):
+    return json.dumps(
+        {
+            "quote": quote,
+            "author": "Ada Lovelace",
+            "emojis": "🤖",
+            "hashtags": ["#AI"],
+            "image_description": "A brass analytical engine in a nebula.",
+        }
+    )
+
+
+@pytest.fixture
+def server():
+    with FakeServer(seed=1) as server, offline_environment(server):
+        yield server
+
+
+def test_prepare_requests_builds_one_request_per_slot_and_account():
+    config = {"QUOTE_PROMPT": "Base quotes"}
+    with patch("batch_generator.get_recent_quotes", return_value=["Old quote"]):
+        requests = prepare_requests(config, 2, ACCOUNTS)
+        default_requests = prepare_requests(config, 2)
+
+    assert [request["custom_id"] for request in requests] == ["ai/0", "ai/1"]
+    assert [request["custom_id"] for request in default_requests] == [
+        "default/0",
+        "default/1",
+    ]
+    body = requests[0]["body"]
+    assert body["response_format"] == {"type": "json_object"}
+    assert "AI quotes" in body["messages"][-1]["content"]
+    assert "Old quote" in body["messages"][0]["content"]
+    # Consecutive slots are steered towards different domains.
+    assert (
+        requests[0]["body"]["messages"][-1]["content"]
+        != requests[1]["body"]["messages"][-1]["content"]
+    )
+    assert len(to_jsonl(requests).splitlines()) == 2
+
+
+def test_batch_round_trip_queues_every_post(server):
+    config = server.config()
+
+    batch = submit_batch(to_jsonl(prepare_requests(config, 3)))
+    assert batch["status"] == "validating"
+    with patch("batch_generator.time.sleep"):
+        batch = wait_for_batch(batch["id"])
+    assert batch["status"] == "completed"
+
+    summary = ingest_batch(config, batch)
+
+    assert summary == {
+        "queued": 3,
+        "duplicates": 0,
+        "invalid": 0,
+        "failed": 0,
+        "pending": 0,
+    }
+    assert count_ready_posts() == 3
+    assert len(get_recent_quotes()) == 3
+    # Each quote is archived with the domain its slot was steered towards.
+    assert [quote["domain"] for quote in iter_archived_quotes()] == list(DOMAINS[:3])
+    assert server.requests["openai.chat"] == 0
+    assert server.requests["openai.image"] == 3
+    stored = get_batches_collection().find_one({"_id": batch["id"]})
+    assert stored["status"] == "completed"
+    assert stored["ingested_at"] is not None
+
+
+def test_ingest_batch_runs_once(server):
+    config = server.config()
+    batch = submit_batch(to_jsonl(prepare_requests(config, 1)))
+    with patch("batch_generator.time.sleep"):
+        batch = wait_for_batch(batch["id"])
+
+    ingest_batch(config, batch)
+    summary = ingest_batch(config, batch)
+
+    assert summary["queued"] == 0
+    assert count_ready_posts() == 1
+    assert server.requests["openai.image"] == 1
+
+
+def test_ingest_batch_drops_invalid_and_duplicate_posts(server):
+    insert_quote("Talk is cheap, show me the code.")
+    results = {
+        "default": {
+            "default/0/0": post_content("Talk is cheap, show me the code."),
+            "default/1/0": "not json",
+            "default/2/0": post_content("Simplicity is prerequisite for reliability."),
+        }
+    }
+
+    with patch("batch_generator.read_results", return_value=(results, 2)):
+        summary = ingest_batch(server.config(), COMPLETED_BATCH)
+
+    assert summary == {
+        "queued": 1,
+        "duplicates": 1,
+        "invalid": 1,
+        "failed": 2,
+        "pending": 0,
+    }
+    assert count_ready_posts() == 1
+
+
+def test_ingest_batch_keeps_accounts_apart(server):
+    results = {"ai": {"ai/0/0": post_content("Machines take me by surprise.")}}
+
+    with patch("batch_generator.read_results", return_value=(results, 0)):
+        ingest_batch(server.config(), COMPLETED_BATCH, ACCOUNTS)
+
+    assert count_ready_posts() == 0
+    with account_scope("ai"):
+        assert count_ready_posts() == 1
+        assert get_recent_quotes() == ["Machines take me by surprise."]
+
+
+def test_ingest_batch_refuses_unfinished_batches(server):
+    with patch("batch_generator.read_results") as mock_read_results:
+        with pytest.raises(Exception, match="only completed batches"):
+            ingest_batch(server.config(), {"id": "batch_1", "status": "expired"})
+
+    mock_read_results.assert_not_called()
+
+
+def test_ingest_batch_resumes_after_a_failed_post(server):
+    results = {
+        "default": {
+            "default/0/0": post_content("Talk is cheap, show me the code."),
+            "default/1/0": post_content("Simplicity is prerequisite for reliability."),
+        }
+    }
+    prepare_post = QuoteBot.prepare_post
+    failures = [Exception("image generation failed")]
+
+    def flaky_prepare_post(self, post):
+        if post["quote_text"].startswith("Talk") and failures:
+            raise failures.pop()
+        return prepare_post(self, post)
+
+    with patch("batch_generator.read_results", return_value=(results, 0)), patch(
+        "batch_generator.QuoteBot.prepare_post", flaky_prepare_post
+    ):
+        first = ingest_batch(server.config(), COMPLETED_BATCH)
+        second = ingest_batch(server.config(), COMPLETED_BATCH)
+        third = ingest_batch(server.config(), COMPLETED_BATCH)
+
+    assert (first["queued"], first["pending"]) == (1, 1)
+    assert (second["queued"], second["pending"], second["duplicates"]) == (1, 0, 0)
+    assert third["queued"] == 0
+    assert count_ready_posts() == 2
+    assert get_batches_collection().find_one({"_id": "batch_1"})["ingested_at"]
+
+
+def test_read_results_counts_failed_requests():
+    lines = [
+        {
+            "custom_id": "ai/0",
+            "response": {
+                "status_code": 200,
+                "body": {"choices": [{"message": {"content": "post"}}]},
+            },
+            "error": None,
+        },
+        {"custom_id": "ai/1", "response": {"status_code": 500}, "error": None},
+        {"custom_id": "ai/2", "response": None, "error": {"code": "expired"}},
+    ]
+    content = MagicMock(text="\n".join(json.dumps(line) for line in lines))
+
+    with patch("batch_generator.api_request", return_value=content) as api_request:
+        results, failed = read_results({"output_file_id": "file-1"})
+
+    api_request.assert_called_once_with("get", "/files/file-1/content")
+    assert results == {"ai": {"ai/0/0": "post"}}
+    assert failed == 2
+
+
+def test_wait_for_batch_gives_up_at_the_deadline():
+    with patch(
+        "batch_generator.get_batch", return_value={"status": "in_progress"}
+    ), patch("batch_generator.save_batch"), patch("batch_generator.time.sleep"), patch(
+        "batch_generator.time.monotonic", side_effect=[0, 5, 11]
+    ):
+        with pytest.raises(Exception, match="still in_progress"):
+            wait_for_batch("batch_1", interval=1, deadline=10)
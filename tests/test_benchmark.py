@@ -0,0 +1,110 @@
+from benchmarks.image_variants import format_report as format_image_report
+from benchmarks.image_variants import run_image_benchmark
+from benchmarks.run_benchmark import format_report, percentile, run_benchmark
+
+
+def test_percentile():
+    values = [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0]
+
+    assert percentile(values, 50) == 0.5
+    assert percentile(values, 95) == 1.0
+    assert percentile([], 50) is None
+
+
+def test_benchmark_runs_real_pipeline_offline():
+    report = run_benchmark(
+        iterations=2,
+        latency={"graph.media": 0.3, "twitter.tweet": 0.3},
+        seed=1,
+    )
+
+    assert report["failed_runs"] == 0
+    assert report["failed_platforms"] == {}
+    assert report["total"]["count"] == 2
+    for stage in (
+        "stage.quote",
+        "stage.description",
+        "stage.image",
+        "stage.publish",
+        "openai.chat",
+        "graph.media",
+        "twitter.upload",
+        "gcs.upload",
+        "mongo.insert_quote",
+    ):
+        assert stage in report["stages"]
+    assert report["requests"]["openai.chat"] == 4
+    assert report["requests"]["graph.media_publish"] == 2
+    assert report["peak_memory_bytes"] > 0
+    # Both 300 ms platforms publish concurrently in every run.
+    assert report["concurrent_publishes"] == 2
+    assert "stage.publish" in format_report(report)
+
+
+def test_benchmark_reports_injected_errors():
+    report = run_benchmark(
+        iterations=2,
+        error_rate={"twitter.tweet": 1.0},
+        config={"RATE_LIMIT_BACKOFF": "0.01"},
+    )
+
+    assert report["failed_runs"] == 0
+    assert report["failed_platforms"] == {"twitter": 2}
+    # A tweet that failed with a 5xx may still have been posted, so it is not
+    # retried.
+    assert report["requests"]["twitter.tweet"] == 2
+    assert "rate_limit.wait" not in report["stages"]
+    assert "mongo.save_rate_limit" in report["stages"]
+
+
+def test_pooled_sessions_reuse_connections_across_runs():
+    warm = run_benchmark(iterations=3)
+    cold = run_benchmark(iterations=3, cold_sessions=True)
+
+    assert sum(warm["connections_per_run"][1:]) < sum(cold["connections_per_run"][1:])
+
+
+def test_instagram_publish_waits_for_container():
+    report = run_benchmark(
+        iterations=2,
+        config={"INSTAGRAM_POLL_INTERVAL": "0.01"},
+        seed=1,
+        container_polls=2,
+    )
+
+    assert report["failed_platforms"] == {}
+    assert report["requests"]["graph.container_status"] == 6
+    assert report["requests"]["graph.media_publish"] == 2
+    assert "graph.container_status" in report["stages"]
+
+
+def test_chunked_twitter_upload():
+    report = run_benchmark(
+        iterations=2,
+        config={"TWITTER_CHUNKED_UPLOAD_THRESHOLD": "0"},
+        seed=1,
+    )
+
+    assert report["failed_platforms"] == {}
+    assert report["requests"]["twitter.upload"] == 0
+    assert report["requests"]["twitter.upload_init"] == 2
+    assert report["requests"]["twitter.upload_append"] >= 4
+    assert report["requests"]["twitter.upload_finalize"] == 2
+
+
+def test_image_variants_benchmark():
+    report = run_image_benchmark(size=256, repeat=2, pattern="smooth")
+
+    assert report["variants"]["twitter"]["passthrough"] is True
+    assert report["variants"]["instagram"]["content_type"] == "image/jpeg"
+    assert report["variants"]["instagram"]["bytes"] > 0
+    assert "instagram" in format_image_report(report)
+
+
+def test_benchmark_streams_completions():
+    report = run_benchmark(iterations=2, config={"STREAM_COMPLETIONS": "true"})
+
+    assert report["failed_runs"] == 0
+    assert report["requests"]["openai.chat"] == 4
+    assert report["stages"]["openai.chat"]["count"] == 4
+    assert "stage.description" in report["stages"]
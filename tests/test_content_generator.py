@@ -1,19 +1,29 @@
+import json
 import pytest
 from unittest.mock import patch, MagicMock
-from content_generator import ContentGenerator
+import content_generator
+from content_generator import ContentGenerator, parse_post
+from quote_index import QuoteIndex
 
 test_config = {}
 
 
+def chat_response(content):
+    return MagicMock(choices=[MagicMock(message=MagicMock(content=content))])
+
+
 def test_generate_quote():
-    with patch("content_generator.openai.ChatCompletion.create") as mock_openai, patch(
-        "content_generator.get_last_50_quotes"
-    ) as mock_get_quotes, patch("content_generator.insert_quote") as mock_insert_quote:
+    with patch("content_generator.get_client") as mock_get_client, patch(
+        "content_generator.get_recent_quotes"
+    ) as mock_get_quotes, patch(
+        "content_generator.get_quote_index"
+    ) as mock_get_quote_index, patch(
+        "content_generator.insert_quote"
+    ) as mock_insert_quote:
         mock_get_quotes.return_value = ["quote1", "quote2", "quote3"]
-        mock_openai.return_value = MagicMock(
-            choices=[
-                MagicMock(message={"content": '"Test quote" by Test Author #AI #ML'})
-            ]
+        mock_get_quote_index.return_value = QuoteIndex()
+        mock_get_client.return_value.chat.completions.create.return_value = (
+            chat_response('"Test quote" by Test Author #AI #ML')
         )
 
         generator = ContentGenerator(test_config)
@@ -23,16 +33,51 @@ def test_generate_quote():
         assert quote == '"Test quote" by Test Author #AI #ML'
         assert quote_text == "Test quote"
 
-        mock_get_quotes.assert_called_once()
-        mock_insert_quote.assert_called_once_with("Test quote")
+        mock_get_quotes.assert_called_once_with(5, history_size=50)
+        mock_insert_quote.assert_called_once_with(
+            "Test quote", history_size=50, domain=None
+        )
+
+
+def test_generate_quote_rejects_near_duplicates():
+    with patch("content_generator.get_client") as mock_get_client, patch(
+        "content_generator.get_recent_quotes"
+    ) as mock_get_quotes, patch(
+        "content_generator.get_quote_index"
+    ) as mock_get_quote_index, patch(
+        "content_generator.insert_quote"
+    ) as mock_insert_quote:
+        mock_get_quotes.return_value = []
+        mock_get_quote_index.return_value = QuoteIndex.from_quotes(
+            ["Talk is cheap. Show me the code."]
+        )
+        create = mock_get_client.return_value.chat.completions.create
+        create.side_effect = [
+            chat_response('"Talk is cheap, show me the code!" - Linus Torvalds'),
+            chat_response('"Simplicity is prerequisite for reliability." - Dijkstra'),
+        ]
+
+        generator = ContentGenerator(test_config)
+        quote, quote_text = generator.generate_quote()
+
+        assert quote_text == "Simplicity is prerequisite for reliability."
+        assert create.call_count == 2
+        retry_prompt = create.call_args.kwargs["messages"][0]["content"]
+        assert "Talk is cheap, show me the code!" in retry_prompt
+        mock_insert_quote.assert_called_once_with(
+            quote_text, history_size=50, domain=None
+        )
+
+        create.side_effect = None
+        create.return_value = chat_response('"Talk is cheap. Show me the code."')
+        with pytest.raises(Exception):
+            generator.generate_quote()
 
 
 def test_generate_detailed_description():
-    with patch("content_generator.openai.ChatCompletion.create") as mock_openai:
-        mock_openai.return_value = MagicMock(
-            choices=[
-                MagicMock(message={"content": "Detailed description of the quote"})
-            ]
+    with patch("content_generator.get_client") as mock_get_client:
+        mock_get_client.return_value.chat.completions.create.return_value = (
+            chat_response("Detailed description of the quote")
         )
 
         generator = ContentGenerator(test_config)
@@ -42,12 +87,367 @@ def test_generate_detailed_description():
 
 
 def test_generate_image():
-    with patch("content_generator.openai.Image.create") as mock_openai:
-        mock_openai.return_value = MagicMock(
-            data=[{"url": "https://example.com/image.png"}]
+    with patch("content_generator.get_client") as mock_get_client:
+        mock_get_client.return_value.images.generate.return_value = MagicMock(
+            data=[MagicMock(url="https://example.com/image.png")]
         )
 
         generator = ContentGenerator(test_config)
         image_url = generator.generate_image("Test quote")
 
         assert image_url == "https://example.com/image.png"
+
+
+def test_get_client_is_created_once():
+    with patch("content_generator.OpenAI") as mock_openai, patch(
+        "content_generator._client", None
+    ):
+        assert content_generator.get_client() is content_generator.get_client()
+
+    mock_openai.assert_called_once_with(base_url=None)
+
+
+def test_generate_quote_skips_unquoted_replies():
+    with patch("content_generator.get_client") as mock_get_client, patch(
+        "content_generator.get_recent_quotes", return_value=[]
+    ), patch("content_generator.get_quote_index", return_value=QuoteIndex()), patch(
+        "content_generator.insert_quote"
+    ):
+        create = mock_get_client.return_value.chat.completions.create
+        create.side_effect = [
+            chat_response("Talk is cheap. Show me the code. - Linus Torvalds"),
+            chat_response('"Talk is cheap. Show me the code." - Linus Torvalds'),
+        ]
+
+        quote, quote_text = ContentGenerator(test_config).generate_quote()
+
+        assert quote_text == "Talk is cheap. Show me the code."
+        assert create.call_count == 2
+
+
+def test_parse_post():
+    post = parse_post(
+        json.dumps(
+            {
+                "quote": '"Talk is cheap. Show me the code."',
+                "author": "Linus Torvalds",
+                "emojis": "💻🐧",
+                "hashtags": ["OpenSource", "#Linux"],
+                "image_description": "A penguin typing on a glowing keyboard.",
+            }
+        )
+    )
+
+    assert post["quote_text"] == "Talk is cheap. Show me the code."
+    assert post["hashtags"] == ["#OpenSource", "#Linux"]
+    assert post["quote"] == (
+        '"Talk is cheap. Show me the code." - Linus Torvalds 💻🐧 #OpenSource #Linux'
+    )
+    assert post["image_description"] == "A penguin typing on a glowing keyboard."
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        "not json",
+        "[]",
+        json.dumps({"quote": "Quote", "author": "Author", "hashtags": ["#AI"]}),
+        json.dumps(
+            {
+                "quote": "",
+                "author": "Author",
+                "hashtags": ["#AI"],
+                "image_description": "Description",
+            }
+        ),
+        json.dumps(
+            {
+                "quote": "Quote",
+                "author": "Author",
+                "hashtags": [],
+                "image_description": "Description",
+            }
+        ),
+    ],
+)
+def test_parse_post_rejects_invalid_responses(content):
+    with pytest.raises(ValueError):
+        parse_post(content)
+
+
+def test_generate_post_uses_one_structured_call():
+    valid_post = json.dumps(
+        {
+            "quote": "Simplicity is prerequisite for reliability.",
+            "author": "Edsger W. Dijkstra",
+            "emojis": "🧠",
+            "hashtags": ["#SoftwareEngineering"],
+            "image_description": "A minimalist bridge over a chaotic sea of code.",
+        }
+    )
+    with patch("content_generator.get_client") as mock_get_client, patch(
+        "content_generator.get_recent_quotes", return_value=[]
+    ), patch("content_generator.get_quote_index", return_value=QuoteIndex()), patch(
+        "content_generator.insert_quote"
+    ) as mock_insert_quote:
+        create = mock_get_client.return_value.chat.completions.create
+        create.side_effect = [chat_response('{"quote": '), chat_response(valid_post)]
+
+        post = ContentGenerator(test_config).generate_post()
+
+        assert post["quote_text"] == "Simplicity is prerequisite for reliability."
+        assert post["image_description"].startswith("A minimalist bridge")
+        assert create.call_count == 2
+        assert create.call_args.kwargs["response_format"] == {"type": "json_object"}
+        mock_insert_quote.assert_called_once_with(
+            post["quote_text"], history_size=50, domain=None
+        )
+
+
+def choices_response(*replies):
+    return MagicMock(
+        choices=[
+            MagicMock(message=MagicMock(content=content), finish_reason=finish_reason)
+            for content, finish_reason in replies
+        ]
+    )
+
+
+def test_generate_quote_picks_the_best_of_several_candidates():
+    history = [
+        "Talk is cheap. Show me the code.",
+        "Any fool can write code that a computer can understand.",
+    ]
+    with patch("content_generator.get_client") as mock_get_client, patch(
+        "content_generator.get_recent_quotes", return_value=[]
+    ), patch(
+        "content_generator.get_quote_index",
+        return_value=QuoteIndex.from_quotes(history),
+    ), patch(
+        "content_generator.insert_quote", return_value=True
+    ) as mock_insert_quote:
+        create = mock_get_client.return_value.chat.completions.create
+        create.return_value = choices_response(
+            ('"Talk is cheap, show me the code!" - Linus Torvalds #Code', "stop"),
+            ('"The best way to predict the future is to inv', "length"),
+            ("No quotation marks here", "stop"),
+            ('"Programs must be written for people to read." - Abelson #Code', "stop"),
+            ('"Data really powers everything that we do." - Jeff Weiner #Data', "stop"),
+        )
+
+        quote, quote_text = ContentGenerator({"QUOTE_CANDIDATES": "5"}).generate_quote()
+
+    # The software development candidate is valid too, but that domain is
+    # already all over the history.
+    assert quote_text == "Data really powers everything that we do."
+    assert create.call_count == 1
+    assert create.call_args.kwargs["n"] == 5
+    mock_insert_quote.assert_called_once_with(quote_text, history_size=50, domain=None)
+
+
+def test_generate_post_falls_back_to_the_next_candidate_already_archived():
+    def post(quote):
+        return json.dumps(
+            {
+                "quote": quote,
+                "author": "Author",
+                "hashtags": ["#AI"],
+                "image_description": "A description.",
+            }
+        )
+
+    with patch("content_generator.get_client") as mock_get_client, patch(
+        "content_generator.get_recent_quotes", return_value=[]
+    ), patch("content_generator.get_quote_index", return_value=QuoteIndex()), patch(
+        "content_generator.insert_quote", side_effect=[False, True]
+    ):
+        create = mock_get_client.return_value.chat.completions.create
+        create.return_value = choices_response(
+            (post("An archived quote."), "stop"),
+            (post("A fresh quote."), "stop"),
+        )
+
+        result = ContentGenerator({"QUOTE_CANDIDATES": "2"}).generate_post()
+
+    assert result["quote_text"] == "A fresh quote."
+    assert "truncated" not in result
+    assert create.call_count == 1
+
+
+def stream_chunks(*pieces, finish_reason="stop"):
+    chunks = [
+        MagicMock(
+            choices=[MagicMock(delta=MagicMock(content=piece), finish_reason=None)]
+        )
+        for piece in pieces
+    ]
+    chunks.append(
+        MagicMock(
+            choices=[
+                MagicMock(delta=MagicMock(content=None), finish_reason=finish_reason)
+            ]
+        )
+    )
+    stream = MagicMock()
+    stream.__iter__.return_value = iter(chunks)
+    return stream
+
+
+def test_stream_completion_stops_once_complete():
+    stream = stream_chunks('{"quote": ', '"Talk is cheap."}', "\nThis post ", "means")
+    with patch("content_generator.get_client") as mock_get_client:
+        mock_get_client.return_value.chat.completions.create.return_value = stream
+        seen = []
+
+        response = content_generator.stream_completion(
+            "post",
+            complete=content_generator.json_object,
+            on_text=seen.append,
+            model="gpt-4-1106-preview",
+        )
+
+    assert response.choices[0].message.content == '{"quote": "Talk is cheap."}'
+    assert response.choices[0].finish_reason == "stop"
+    assert len(seen) == 2
+    stream.response.close.assert_called_once()
+    assert mock_get_client.return_value.chat.completions.create.call_args.kwargs[
+        "stream"
+    ]
+
+
+def test_stream_completion_reports_truncation():
+    with patch("content_generator.get_client") as mock_get_client:
+        mock_get_client.return_value.chat.completions.create.return_value = (
+            stream_chunks('"Talk is', finish_reason="length")
+        )
+
+        response = content_generator.stream_completion("quote")
+
+    assert response.choices[0].message.content == '"Talk is'
+    assert response.choices[0].finish_reason == "length"
+
+
+def test_json_object_waits_for_the_closing_brace():
+    assert content_generator.json_object('{"quote": "A {b}') is None
+    assert content_generator.json_object('{"quote": "}"') is None
+    assert content_generator.json_object(' {"quote": "A"}') == '{"quote": "A"}'
+
+
+def test_caption_end_waits_for_the_hashtag_line():
+    assert content_generator.caption_end('"Talk is cheap."\n- Linus') is None
+    assert content_generator.caption_end('"Talk is cheap."\n- Linus\n#Code') is None
+    assert (
+        content_generator.caption_end('"Talk is cheap."\n- Linus\n#Code\nThis')
+        == '"Talk is cheap."\n- Linus\n#Code'
+    )
+    assert (
+        content_generator.caption_end('"Talk is cheap." - Linus #Code\n')
+        == '"Talk is cheap." - Linus #Code'
+    )
+    # A hashtag inside the quoted text does not end the caption.
+    assert content_generator.caption_end('"Use #define."\n- K&R\n') is None
+
+
+def test_generate_quote_stops_streaming_after_the_caption():
+    stream = stream_chunks(
+        '"Talk is cheap."', "\n- Linus ", "#Code\nThis quote ", "means", " a lot"
+    )
+    chunks = stream.__iter__.return_value
+    with patch("content_generator.get_client") as mock_get_client, patch(
+        "content_generator.get_recent_quotes", return_value=[]
+    ), patch("content_generator.get_quote_index", return_value=QuoteIndex()), patch(
+        "content_generator.insert_quote", return_value=True
+    ):
+        mock_get_client.return_value.chat.completions.create.return_value = stream
+
+        quote, quote_text = ContentGenerator(
+            {"STREAM_COMPLETIONS": "true"}
+        ).generate_quote()
+
+    assert quote == '"Talk is cheap."\n- Linus #Code'
+    assert quote_text == "Talk is cheap."
+    # The explanation after the caption was never read.
+    assert len(list(chunks)) == 3
+    stream.response.close.assert_called_once()
+
+
+def test_streamed_quote_is_reported_before_the_caption_ends():
+    reported = []
+    stream = stream_chunks('"Simplicity is ', 'prerequisite." - Dijkstra', " #Code")
+    original_iter = stream.__iter__.return_value
+
+    def chunks():
+        for chunk in original_iter:
+            yield chunk
+            reported.append(("chunk", None))
+
+    stream.__iter__.return_value = chunks()
+    with patch("content_generator.get_client") as mock_get_client, patch(
+        "content_generator.get_recent_quotes", return_value=[]
+    ), patch("content_generator.get_quote_index", return_value=QuoteIndex()), patch(
+        "content_generator.insert_quote", return_value=True
+    ):
+        mock_get_client.return_value.chat.completions.create.return_value = stream
+
+        quote, quote_text = ContentGenerator(
+            {"STREAM_COMPLETIONS": "true"}
+        ).generate_quote(lambda text: reported.append(("quote", text)))
+
+    assert quote == '"Simplicity is prerequisite." - Dijkstra #Code'
+    assert quote_text == "Simplicity is prerequisite."
+    # Reported on the second chunk, before the hashtags arrived.
+    assert reported.index(("quote", "Simplicity is prerequisite.")) == 1
+
+
+def test_streamed_quote_matches_the_non_streamed_one():
+    reply = '"Talk is cheap. Show me the code."\n- Linus Torvalds 💻\n#Code #OpenSource'
+    config = {"STREAM_COMPLETIONS": "true"}
+    with patch("content_generator.get_client") as mock_get_client, patch(
+        "content_generator.get_recent_quotes", return_value=[]
+    ), patch("content_generator.get_quote_index", return_value=QuoteIndex()), patch(
+        "content_generator.insert_quote", return_value=True
+    ):
+        create = mock_get_client.return_value.chat.completions.create
+        create.return_value = stream_chunks(*reply.partition("\n"))
+        streamed = ContentGenerator(config).generate_quote()
+        create.return_value = choices_response((reply, "stop"))
+        generated = ContentGenerator(
+            dict(config, QUOTE_CANDIDATES="2")
+        ).generate_quote()
+
+    # The author and hashtags on the lines after the quote are kept.
+    assert streamed == generated == (reply, "Talk is cheap. Show me the code.")
+
+
+def test_domain_weighting_steers_the_prompt():
+    stats = {"cybersecurity": {"posts": 5, "engagements": 50}}
+    with patch("content_generator.get_client") as mock_get_client, patch(
+        "content_generator.get_recent_quotes", return_value=[]
+    ), patch("content_generator.get_quote_index", return_value=QuoteIndex()), patch(
+        "content_generator.insert_quote"
+    ) as mock_insert_quote, patch(
+        "content_generator.get_domain_stats", return_value=stats
+    ) as get_domain_stats, patch(
+        "content_generator.random.choices", return_value=["cybersecurity"]
+    ) as choices:
+        create = mock_get_client.return_value.chat.completions.create
+        create.return_value = chat_response('"Trust, but verify." - Anonymous')
+
+        ContentGenerator({"DOMAIN_WEIGHTING": "true"}).generate_quote()
+
+    get_domain_stats.assert_called_once_with()
+    assert choices.call_args.kwargs["weights"]
+    prompt = create.call_args.kwargs["messages"][-1]["content"]
+    assert "pick a quote about cybersecurity" in prompt
+    # The quote is archived with the domain it was steered towards, although
+    # none of its keywords appear in it.
+    assert mock_insert_quote.call_args.kwargs["domain"] == "cybersecurity"
+
+
+def test_domain_weighting_is_off_by_default():
+    with patch("content_generator.get_domain_stats") as get_domain_stats:
+        assert ContentGenerator(test_config).choose_domain() is None
+    with patch("content_generator.get_domain_stats", return_value={}):
+        assert ContentGenerator({"DOMAIN_WEIGHTING": "true"}).choose_domain() is None
+
+    get_domain_stats.assert_not_called()
@@ -0,0 +1,157 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+import pytest
+from benchmarks.fake_servers import FakeServer
+from benchmarks.run_benchmark import offline_environment
+from engagement import aggregate_engagement, collect_engagement, fetch_metrics
+from mongo_manager import (
+    account_scope,
+    get_archive_collection,
+    get_domain_stats,
+    insert_quote,
+    iter_archived_quotes,
+    record_publication,
+)
+from quote_bot import QuoteBot
+
+
+@pytest.fixture
+def server():
+    with FakeServer(seed=1) as server, offline_environment(server):
+        yield server
+
+
+def publish(quote, domain, twitter_id, instagram_id):
+    insert_quote(quote, domain=domain)
+    record_publication(quote, {"twitter": twitter_id, "instagram": instagram_id})
+
+
+def test_published_posts_are_recorded_with_the_archived_quote(server):
+    quote_bot = QuoteBot(server.config())
+
+    quote_bot.generate_and_post()
+
+    (archived,) = get_archive_collection().find()
+    assert set(archived["posts"]) == {"twitter", "instagram"}
+    assert archived["published_at"] is not None
+
+
+def test_collect_engagement_aggregates_metrics_per_domain(server):
+    publish("Data beats opinions.", "data science", "t1", "i1")
+    publish("Machines take me by surprise.", "artificial intelligence", "t2", "i2")
+    publish("Talk is cheap, show me the code.", None, "t3", "i3")
+    metrics = {"likes": 10, "replies": 2, "shares": 3, "impressions": 500}
+    for post_id in ("t1", "i1", "t2", "i2", "t3", "i3"):
+        server.engagement[post_id] = metrics
+
+    summary = collect_engagement(server.config())
+
+    assert summary == {"default": 3}
+    assert server.requests["twitter.tweet_lookup"] == 1
+    assert server.requests["graph.insights"] == 1
+    stats = get_domain_stats()
+    # Instagram saves count as engagements, its shares are not reported.
+    assert stats["data science"]["posts"] == 1
+    assert stats["data science"]["engagements"] == 15 + 15
+    assert stats["data science"]["impressions"] == 1000
+    # A quote recorded without a domain is classified from its text.
+    assert stats["software development"]["posts"] == 1
+    archived = get_archive_collection().find_one({"text": "Data beats opinions."})
+    assert archived["metrics"]["twitter"] == metrics
+    assert archived["metrics_updated_at"] is not None
+
+
+def test_collect_engagement_only_refreshes_the_window(server):
+    publish("Data beats opinions.", "data science", "t1", "i1")
+    get_archive_collection().update_many(
+        {}, {"$set": {"published_at": datetime.now(timezone.utc) - timedelta(30)}}
+    )
+
+    summary = collect_engagement(server.config())
+
+    assert summary == {"default": 0}
+    assert server.requests["twitter.tweet_lookup"] == 0
+    assert get_domain_stats() == {}
+
+
+def test_collect_engagement_keeps_accounts_apart(server):
+    accounts = [{"id": "ai", "interval": 3600, "config": {}}]
+    with account_scope("ai"):
+        publish("Machines take me by surprise.", "artificial intelligence", "t", "i")
+
+    collect_engagement(server.config(), accounts)
+
+    assert get_domain_stats() == {}
+    with account_scope("ai"):
+        assert set(get_domain_stats()) == {"artificial intelligence"}
+
+
+def test_fetch_metrics_skips_a_failing_platform():
+    quotes = [{"_id": 1, "posts": {"twitter": "t1", "instagram": "i1"}}]
+    fetchers = {
+        "twitter": lambda ids: {"t1": {"likes": 1}},
+        "instagram": lambda ids: (_ for _ in ()).throw(Exception("Graph API down")),
+    }
+
+    with patch("builtins.print") as mock_print:
+        metrics = fetch_metrics(quotes, fetchers)
+
+    assert metrics == {1: {"twitter": {"likes": 1}}}
+    mock_print.assert_called_once()
+
+
+def test_aggregate_engagement_ignores_unmeasured_quotes():
+    quotes = [
+        {"text": "Data beats opinions.", "domain": "data science"},
+        {"text": "Stay hungry.", "metrics": {"twitter": {"likes": 5}}},
+    ]
+
+    assert aggregate_engagement(quotes) == {}
+
+
+def test_collect_engagement_recomputes_the_aggregates(server):
+    def set_metrics(likes, impressions):
+        for post_id in ("t1", "i1"):
+            server.engagement[post_id] = {
+                "likes": likes,
+                "replies": 0,
+                "shares": 0,
+                "impressions": impressions,
+            }
+
+    publish("Data beats opinions.", "data science", "t1", "i1")
+    set_metrics(10, 500)
+    # The metrics were saved, but the run died before the aggregates.
+    with patch("engagement.save_domain_stats", side_effect=Exception("crash")):
+        with pytest.raises(Exception, match="crash"):
+            collect_engagement(server.config())
+    set_metrics(12, 700)
+
+    collect_engagement(server.config())
+    collect_engagement(server.config())
+
+    stats = get_domain_stats()["data science"]
+    # Neither the crash nor the repeated run skewed the totals.
+    assert stats["posts"] == 1
+    assert stats["engagements"] == 12 + 12
+    assert stats["impressions"] == 700 + 700
+
+
+def test_domain_stats_only_cover_their_window(server):
+    publish("Data beats opinions.", "data science", "t1", "i1")
+    collect_engagement(server.config())
+    assert set(get_domain_stats()) == {"data science"}
+    get_archive_collection().update_many(
+        {}, {"$set": {"published_at": datetime.now(timezone.utc) - timedelta(100)}}
+    )
+
+    with patch(
+        "engagement.iter_archived_quotes", wraps=iter_archived_quotes
+    ) as mock_iter:
+        collect_engagement(server.config())
+
+    # The aggregates only read the posts of the last 90 days.
+    assert mock_iter.call_args.kwargs["published_since"] > datetime.now(
+        timezone.utc
+    ) - timedelta(days=91)
+    assert get_domain_stats() == {}
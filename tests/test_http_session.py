@@ -0,0 +1,51 @@
+from unittest.mock import patch
+import http_session
+from http_session import (
+    DEFAULT_TIMEOUT,
+    close_sessions,
+    get_oauth1_session,
+    get_session,
+)
+
+
+def test_get_session_is_shared_and_pooled():
+    session = get_session()
+
+    assert get_session() is session
+    adapter = session.get_adapter("https://graph.facebook.com/v18.0/")
+    assert adapter._pool_maxsize == http_session.POOL_MAXSIZE
+    assert session.get_adapter("http://localhost") is adapter
+
+
+def test_default_timeout_is_applied():
+    with patch("requests.Session.request") as mock_request:
+        get_session().get("https://example.com/image.png")
+        get_session().get("https://example.com/image.png", timeout=3)
+
+    assert mock_request.call_args_list[0].kwargs["timeout"] == DEFAULT_TIMEOUT
+    assert mock_request.call_args_list[1].kwargs["timeout"] == 3
+
+
+def test_oauth1_sessions_are_cached_per_credentials():
+    session = get_oauth1_session("key", "secret", "token", "token_secret")
+
+    assert get_oauth1_session("key", "secret", "token", "token_secret") is session
+    assert get_oauth1_session("key2", "secret", "token", "token_secret") is not session
+    assert session.auth.client.client_key == "key"
+
+
+def test_close_sessions_drops_cached_sessions():
+    session = get_session()
+
+    close_sessions()
+
+    assert get_session() is not session
+
+
+def test_sessions_share_one_connection_pool():
+    first = get_oauth1_session("key", "secret", "token", "token_secret")
+    second = get_oauth1_session("key2", "secret2", "token2", "token_secret2")
+
+    url = "https://api.twitter.com/2/tweets"
+    assert first.get_adapter(url) is second.get_adapter(url)
+    assert get_session().get_adapter(url) is first.get_adapter(url)
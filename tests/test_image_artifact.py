@@ -0,0 +1,34 @@
+import io
+from unittest.mock import patch, MagicMock
+from PIL import Image
+from image_artifact import ImageArtifact
+
+
+def make_png(size=(8, 8)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, "blue").save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def test_image_artifact_decodes_metadata():
+    image = ImageArtifact(make_png((16, 8)), url="http://test_image_url.com")
+
+    assert image.format == "PNG"
+    assert (image.width, image.height) == (16, 8)
+    assert image.content_type == "image/png"
+    assert image.extension == "png"
+    assert image.open().read() == image.data
+
+
+@patch("image_artifact.get_session")
+def test_from_url_downloads_once(mock_get_session):
+    mock_get = mock_get_session.return_value.get
+    mock_get.return_value = MagicMock(
+        content=make_png(), headers={"Content-Type": "image/png"}
+    )
+
+    image = ImageArtifact.from_url("http://test_image_url.com")
+
+    mock_get.assert_called_once_with("http://test_image_url.com", timeout=60)
+    assert image.url == "http://test_image_url.com"
+    assert image.size == len(mock_get.return_value.content)
@@ -0,0 +1,83 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from PIL import Image
+import image_processing
+from image_artifact import ImageArtifact
+from image_processing import ImageVariants, encode_variant, encode_variants
+
+
+def make_image(width=1024, height=1024, fmt="PNG"):
+    buffer = io.BytesIO()
+    Image.effect_noise((width, height), 32).convert("RGB").save(buffer, fmt)
+    return ImageArtifact(buffer.getvalue())
+
+
+def test_variants_decode_once_and_share_encodings():
+    image = make_image()
+    variants = ImageVariants(image)
+
+    with patch("image_processing.decode", wraps=image_processing.decode) as decode:
+        instagram = variants.get("instagram")
+        threads = variants.get("threads")
+        twitter = variants.get("twitter")
+
+    decode.assert_called_once()
+    assert twitter is image
+    assert threads is instagram
+    assert instagram.format == "JPEG"
+    assert instagram.content_type == "image/jpeg"
+    with Image.open(instagram.open()) as img:
+        assert img.info.get("progressive")
+    assert variants.get("unknown") is image
+
+
+def test_jpeg_source_within_limits_is_not_reencoded():
+    image = make_image(fmt="JPEG")
+
+    with patch("image_processing.decode") as decode:
+        assert ImageVariants(image).get("instagram") is image
+    decode.assert_not_called()
+
+
+def test_variant_is_cropped_and_scaled_to_platform_limits():
+    image = make_image(3000, 1000)
+
+    instagram = ImageVariants(image).get("instagram")
+
+    assert max(instagram.width, instagram.height) == 1440
+    assert abs(instagram.width / instagram.height - 1.91) < 0.01
+
+
+def test_variant_quality_is_lowered_to_fit_max_bytes():
+    img = Image.effect_noise((512, 512), 64).convert("RGB")
+    spec = {"format": "JPEG", "quality": 95, "min_quality": 30, "max_bytes": 120_000}
+
+    data, content_type = encode_variant(img, spec)
+
+    assert content_type == "image/jpeg"
+    assert len(data) <= 120_000
+    assert len(data) > len(encode_variant(img, dict(spec, quality=30))[0])
+
+
+def test_oversized_png_falls_back_to_jpeg():
+    img = Image.effect_noise((512, 512), 64).convert("RGB")
+
+    data, content_type = encode_variant(img, {"format": "PNG", "max_bytes": 200_000})
+
+    assert content_type == "image/jpeg"
+    assert data[:2] == b"\xff\xd8"
+
+
+def test_variants_from_executor_match_in_process_encoding():
+    image = make_image()
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        variants = ImageVariants(image, executor=executor)
+        instagram = variants.get("instagram")
+        assert variants.get("twitter") is image
+
+    assert instagram.format == "JPEG"
+    assert encode_variants(image.data, {"instagram": variants.specs["instagram"]})[
+        "instagram"
+    ] == (instagram.data, "image/jpeg")
@@ -0,0 +1,194 @@
+import io
+import os
+import tempfile
+import tracemalloc
+import pytest
+from unittest.mock import patch, MagicMock
+from PIL import Image
+import instrumentation
+import storage_manager
+from image_artifact import ImageArtifact
+from instagram_manager import InstagramManager
+from instrumentation import span
+
+# The least memory the streaming path must save on the 1024x1024 test image,
+# whose JPEG is about 540 KB.
+MEMORY_SAVED_MARGIN = 256 * 1024
+
+config = {
+    "FACEBOOK_ACCESS_TOKEN": "test_token",
+    "INSTAGRAM_USER_ID": "test_user_id",
+}
+
+
+def make_image():
+    buffer = io.BytesIO()
+    Image.effect_noise((1024, 1024), 64).convert("RGB").save(buffer, "PNG")
+    return ImageArtifact(buffer.getvalue(), url="http://test_image_url.com")
+
+
+class FakeBlob:
+    def __init__(self):
+        self.uploaded = b""
+        self.deleted = False
+
+    def upload_from_string(self, data, content_type=None):
+        self.uploaded = data
+
+    def upload_from_filename(self, filename):
+        with open(filename, "rb") as f:
+            self.uploaded = f.read()
+
+    def delete(self):
+        self.deleted = True
+
+
+def legacy_temp_file_path(image, blob):
+    """The pre-streaming path: JPEG written to a temp file and re-read for upload."""
+    with span("image.encode_jpeg"):
+        with Image.open(image.open()) as img:
+            with tempfile.NamedTemporaryFile(suffix=".jpeg", delete=False) as temp_file:
+                img.convert("RGB").save(temp_file, "JPEG")
+                temp_filename = temp_file.name
+    with span("gcs.upload"):
+        blob.upload_from_filename(temp_filename)
+
+    tmp_bytes = os.path.getsize(temp_filename)
+    os.remove(temp_filename)
+    return tmp_bytes
+
+
+def measure(name, run):
+    """
+    Run a path under tracemalloc and instrumentation.
+
+    Returns:
+        A tuple of its result, its peak traced memory and the duration of each
+        of its stages in milliseconds, keyed by span name.
+    """
+    tracemalloc.start()
+    try:
+        with instrumentation.run(name) as record:
+            result = run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    stages = {}
+    for recorded in record.spans:
+        stages[recorded.name] = stages.get(recorded.name, 0) + recorded.duration * 1000
+    return result, peak, stages
+
+
+@patch("storage_manager.get_bucket")
+def test_post_on_instagram_uses_no_temp_files(mock_get_bucket):
+    blob = FakeBlob()
+    mock_get_bucket.return_value.blob.return_value = blob
+    manager = InstagramManager(config)
+    manager.publish_to_instagram = MagicMock(return_value={"id": "test_media"})
+
+    with patch("tempfile.NamedTemporaryFile") as mock_temp_file:
+        media = manager.post_on_instagram("test_quote", make_image())
+
+    mock_temp_file.assert_not_called()
+    assert media == {"id": "test_media"}
+    storage_manager.wait_for_pending_deletes()
+    assert blob.uploaded[:2] == b"\xff\xd8"
+    assert blob.deleted
+    gcs_url = manager.publish_to_instagram.call_args.args[0]
+    assert gcs_url.startswith(
+        "https://storage.googleapis.com/devwisdomdaily-image/staging/"
+    )
+    assert gcs_url.endswith(".jpeg")
+
+
+@patch("storage_manager.get_bucket")
+def test_streaming_path_versus_temp_file_path(mock_get_bucket):
+    image = make_image()
+    manager = InstagramManager(config)
+    manager.publish_to_instagram = MagicMock(return_value={"id": "test_media"})
+    mock_get_bucket.return_value.blob.side_effect = lambda name: FakeBlob()
+
+    tmp_bytes, legacy_peak, legacy_stages = measure(
+        "instagram.temp_file", lambda: legacy_temp_file_path(image, FakeBlob())
+    )
+    media, streaming_peak, streaming_stages = measure(
+        "instagram.streaming", lambda: manager.post_on_instagram("quote", image)
+    )
+    storage_manager.wait_for_pending_deletes()
+
+    assert media == {"id": "test_media"}
+    # /tmp is RAM-backed on Cloud Functions, so the temp file counts as memory.
+    assert streaming_peak < legacy_peak + tmp_bytes - MEMORY_SAVED_MARGIN
+    # Both paths go through the same stages, whose times are reported by the
+    # run summaries rather than asserted.
+    stages = {"image.encode_jpeg", "gcs.upload"}
+    assert set(legacy_stages) == set(streaming_stages) == stages
+    for stage in sorted(streaming_stages):
+        print(
+            f"{stage}: {legacy_stages[stage]:.1f} ms with a temp file, "
+            f"{streaming_stages[stage]:.1f} ms streamed"
+        )
+
+
+def status_response(status_code):
+    response = MagicMock(ok=True, text=status_code)
+    response.json.return_value = {"id": "test_container", "status_code": status_code}
+    return response
+
+
+@patch("instagram_manager.time.sleep")
+@patch("instagram_manager.get_session")
+def test_publish_waits_for_finished_container(mock_get_session, mock_sleep):
+    session = mock_get_session.return_value
+    session.post.return_value.ok = True
+    session.post.return_value.json.return_value = {"id": "test_container"}
+    session.get.side_effect = [
+        status_response("IN_PROGRESS"),
+        status_response("IN_PROGRESS"),
+        status_response("FINISHED"),
+    ]
+    manager = InstagramManager(config)
+    manager.publish = MagicMock(return_value={"id": "test_media"})
+
+    media = manager.publish_to_instagram("http://image.url", "test_caption")
+
+    assert media == {"id": "test_media"}
+    manager.publish.assert_called_once_with("test_container")
+    assert session.get.call_args.args[0].endswith("test_container")
+    assert session.get.call_args.kwargs["params"]["fields"] == "status_code,status"
+    first, second = [c.args[0] for c in mock_sleep.call_args_list]
+    assert 0.25 <= first <= 0.5
+    assert 0.5 <= second <= 1
+    assert manager.container_wait is not None
+
+
+@patch("instagram_manager.time.sleep")
+@patch("instagram_manager.get_session")
+def test_publish_skipped_when_container_errors(mock_get_session, mock_sleep):
+    session = mock_get_session.return_value
+    session.post.return_value.ok = True
+    session.post.return_value.json.return_value = {"id": "test_container"}
+    session.get.return_value = status_response("ERROR")
+    manager = InstagramManager(config)
+    manager.publish = MagicMock()
+
+    assert manager.publish_to_instagram("http://image.url", "test_caption") is None
+    manager.publish.assert_not_called()
+    mock_sleep.assert_not_called()
+
+
+@patch("instagram_manager.time.monotonic")
+@patch("instagram_manager.time.sleep")
+@patch("instagram_manager.get_session")
+def test_container_polling_stops_at_deadline(
+    mock_get_session, mock_sleep, mock_monotonic
+):
+    clock = [0.0]
+    mock_monotonic.side_effect = lambda: clock[0]
+    mock_sleep.side_effect = lambda seconds: clock.__setitem__(0, clock[0] + seconds)
+    mock_get_session.return_value.get.return_value = status_response("IN_PROGRESS")
+    manager = InstagramManager(dict(config, INSTAGRAM_POLL_DEADLINE="10"))
+
+    assert not manager.wait_for_container("test_container")
+    assert manager.container_wait == pytest.approx(10)
+    assert all(c.args[0] <= 5 for c in mock_sleep.call_args_list)
@@ -0,0 +1,70 @@
+import json
+import time
+import pytest
+from unittest.mock import MagicMock
+import instrumentation
+from instrumentation import span
+from publisher import publish_all
+
+
+def last_record(capsys):
+    return json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+
+
+def test_run_emits_one_structured_record(capsys):
+    with instrumentation.run("trigger_tweet", run_id="event-1"):
+        with span("openai.chat", stage="quote") as s:
+            s.record_usage(MagicMock(prompt_tokens=120, completion_tokens=40))
+        with span("graph.media") as s:
+            s.record_response(MagicMock(status_code=200, content=b"{}"))
+
+    record = last_record(capsys)
+    assert record["run"] == "trigger_tweet"
+    assert record["run_id"] == "event-1"
+    assert record["severity"] == "INFO"
+    assert record["usage"]["prompt_tokens"] == 120
+    assert record["usage"]["completion_tokens"] == 40
+    assert [s["name"] for s in record["spans"]] == ["openai.chat", "graph.media"]
+    assert record["spans"][0]["stage"] == "quote"
+    assert record["spans"][1]["status"] == 200
+    assert record["spans"][1]["bytes"] == 2
+
+
+def test_run_records_errors(capsys):
+    with pytest.raises(ValueError):
+        with instrumentation.run("trigger_tweet"):
+            with span("stage.quote"):
+                raise ValueError("unparsable reply")
+
+    record = last_record(capsys)
+    assert record["severity"] == "ERROR"
+    assert record["error"] == "ValueError: unparsable reply"
+    assert record["spans"][0]["error"] == "ValueError: unparsable reply"
+
+
+def test_spans_from_publisher_threads_join_the_run(capsys):
+    def publisher():
+        with span("twitter.tweet"):
+            return {"id": "tweet_id"}
+
+    with instrumentation.run("trigger_tweet"):
+        publish_all({"twitter": publisher, "instagram": publisher})
+
+    names = {s["name"] for s in last_record(capsys)["spans"]}
+    assert names == {"publish.twitter", "publish.instagram", "twitter.tweet"}
+
+
+def test_disabled_instrumentation_is_a_no_op(capsys):
+    with instrumentation.run("trigger_tweet", enabled=False) as record:
+        assert record is None
+        with span("openai.chat") as s:
+            s.set(model="gpt-4")
+            s.record_usage(MagicMock(prompt_tokens=1))
+
+    assert capsys.readouterr().out == ""
+
+    started = time.perf_counter()
+    for _ in range(10000):
+        with span("mongo.get_recent_quotes"):
+            pass
+    assert (time.perf_counter() - started) / 10000 < 0.0001
@@ -31,3 +31,71 @@ def test_main():
         mock_get_config.assert_called_once()
         mock_quote_bot.assert_called_once_with({})
         mock_instance.generate_and_post.assert_called_once()
+
+
+def test_trigger_tweet_publishes_from_queue():
+    with patch("main.get_config") as mock_get_config, patch(
+        "main.QuoteBot"
+    ) as mock_quote_bot:
+        mock_get_config.return_value = {"POST_QUEUE_ENABLED": "true"}
+        mock_instance = mock_quote_bot.return_value
+
+        main.trigger_tweet(None, None)
+
+        mock_instance.publish_next.assert_called_once()
+        mock_instance.top_up_queue.assert_called_once()
+        mock_instance.generate_and_post.assert_not_called()
+
+
+def test_fill_queue():
+    with patch("main.get_config") as mock_get_config, patch(
+        "main.QuoteBot"
+    ) as mock_quote_bot:
+        mock_get_config.return_value = {}
+
+        main.fill_queue(None, None)
+
+        mock_quote_bot.return_value.fill_queue.assert_called_once()
+
+
+def test_trigger_tweet_uses_event_id_as_run_id():
+    with patch("main.get_config") as mock_get_config, patch(
+        "main.QuoteBot"
+    ) as mock_quote_bot:
+        mock_get_config.return_value = {}
+
+        main.trigger_tweet({}, MagicMock(event_id="event-1"))
+
+        mock_quote_bot.return_value.generate_and_post.assert_called_once_with("event-1")
+
+
+def test_trigger_accounts_raises_when_an_account_fails():
+    with patch("main.get_config") as mock_get_config, patch(
+        "main.load_accounts"
+    ) as mock_load_accounts, patch("main.AccountScheduler") as mock_scheduler:
+        mock_get_config.return_value = {}
+        mock_scheduler.return_value.run.return_value = {
+            "first": {"ok": True, "error": None, "results": {}},
+            "second": {"ok": False, "error": "boom", "results": None},
+        }
+
+        with pytest.raises(Exception, match="Accounts failed: second"):
+            main.trigger_accounts({}, MagicMock(event_id="event-1"))
+
+        mock_scheduler.assert_called_once_with({}, mock_load_accounts.return_value)
+        mock_scheduler.return_value.run.assert_called_once_with("event-1")
+
+
+def test_trigger_tweet_waits_for_pending_deletes_when_it_fails():
+    with patch("main.get_config") as mock_get_config, patch(
+        "main.QuoteBot"
+    ) as mock_quote_bot, patch(
+        "main.storage_manager.wait_for_pending_deletes"
+    ) as mock_wait_for_pending_deletes:
+        mock_get_config.return_value = {}
+        mock_quote_bot.return_value.generate_and_post.side_effect = Exception("boom")
+
+        with pytest.raises(Exception, match="boom"):
+            main.trigger_tweet({}, MagicMock(event_id="event-1"))
+
+        mock_wait_for_pending_deletes.assert_called_once_with()
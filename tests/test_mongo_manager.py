@@ -1,7 +1,40 @@
-import pytest
+from datetime import datetime, timedelta, timezone
 from mongomock import MongoClient
 from unittest.mock import patch
-from mongo_manager import insert_quote, get_last_50_quotes
+import mongo_manager
+from mongo_manager import (
+    insert_quote,
+    get_last_50_quotes,
+    get_recent_quotes,
+    get_quote_index,
+    enqueue_post,
+    pop_ready_post,
+    release_post,
+    count_ready_posts,
+    mark_post_published,
+    archive_history,
+    migrate_legacy_quotes,
+    iter_archived_quotes,
+)
+
+
+class CountingCollection:
+    """Wraps a collection and counts the operations sent to it."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.calls = []
+
+    def __getattr__(self, name):
+        attribute = getattr(self.collection, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            self.calls.append(name)
+            return attribute(*args, **kwargs)
+
+        return call
 
 
 @patch("mongo_manager.MongoClient")
@@ -11,15 +44,12 @@ def test_insert_quote(mock_mongo_client):
     for i in range(51):
         insert_quote(f"quote{i}")
 
-    assert (
-        mock_mongo_client.return_value.devwisdomdaily.quotes.count_documents({}) == 50
-    )
-    assert (
-        mock_mongo_client.return_value.devwisdomdaily.quotes.find_one(
-            sort=[("quote", 1)]
-        )["quote"]
-        == "quote1"
+    history = mock_mongo_client.return_value.devwisdomdaily.quote_history.find_one(
+        {"_id": "recent"}
     )
+    assert len(history["quotes"]) == 50
+    assert history["quotes"][0] == "quote1"
+    assert history["quotes"][-1] == "quote50"
 
 
 @patch("mongo_manager.MongoClient")
@@ -34,3 +64,242 @@ def test_get_last_50_quotes(mock_mongo_client):
     assert len(last_50_quotes) == 50
     assert last_50_quotes[0] == "quote59"
     assert last_50_quotes[-1] == "quote10"
+
+
+@patch("mongo_manager.MongoClient")
+def test_get_recent_quotes_without_history(mock_mongo_client):
+    mock_mongo_client.return_value = MongoClient()
+
+    assert get_recent_quotes() == []
+
+
+@patch("mongo_manager.MongoClient")
+def test_history_size_is_configurable(mock_mongo_client):
+    mock_mongo_client.return_value = MongoClient()
+
+    for i in range(8):
+        insert_quote(f"quote{i}", history_size=5)
+
+    assert get_recent_quotes(history_size=5) == [
+        "quote7",
+        "quote6",
+        "quote5",
+        "quote4",
+        "quote3",
+    ]
+    assert get_recent_quotes(2, history_size=5) == ["quote7", "quote6"]
+
+
+def test_two_writes_per_insert_and_one_read():
+    database = MongoClient().devwisdomdaily
+    collection = CountingCollection(database.quote_history)
+    archive = CountingCollection(database.quote_archive)
+    client = {"devwisdomdaily": {"quote_archive": archive}}
+
+    with patch("mongo_manager.get_client", return_value=client), patch(
+        "mongo_manager.get_history_collection", return_value=collection
+    ):
+        for i in range(60):
+            insert_quote(f"quote{i}")
+        # The archive indexes are created once, then every insert archives
+        # the quote and pushes it onto the history window.
+        assert archive.calls == ["create_index"] * 3 + ["insert_one"] * 60
+        assert collection.calls == ["update_one"] * 60
+
+        archive.calls.clear()
+        collection.calls.clear()
+        get_last_50_quotes()
+        assert archive.calls == []
+        assert collection.calls == ["find_one"]
+
+
+@patch("mongo_manager.MongoClient")
+def test_archive_keeps_every_quote_and_rejects_exact_repeats(mock_mongo_client):
+    mock_mongo_client.return_value = MongoClient()
+
+    for i in range(60):
+        assert insert_quote(f"quote{i}")
+    assert not insert_quote("Quote12!")
+
+    archive = mock_mongo_client.return_value.devwisdomdaily.quote_archive
+    assert archive.count_documents({}) == 60
+    assert get_recent_quotes()[-1] == "quote10"
+    assert get_recent_quotes(55)[-1] == "quote5"
+    with mongo_manager.account_scope("ai"):
+        assert insert_quote("quote12")
+
+
+@patch("mongo_manager.MongoClient", new=lambda *args, **kwargs: MongoClient())
+def test_recent_window_is_read_once_and_updated_on_insert():
+    collection = CountingCollection(MongoClient().devwisdomdaily.quote_history)
+
+    with patch("mongo_manager.get_history_collection", return_value=collection):
+        insert_quote("quote0")
+        assert get_recent_quotes() == ["quote0"]
+        insert_quote("quote1")
+        assert get_recent_quotes() == ["quote1", "quote0"]
+        assert get_last_50_quotes() == ["quote1", "quote0"]
+
+    assert collection.calls == ["update_one", "find_one", "update_one"]
+
+
+@patch("mongo_manager.MongoClient")
+def test_archive_is_paginated_by_keyset(mock_mongo_client):
+    mock_mongo_client.return_value = MongoClient()
+    for i in range(7):
+        insert_quote(f"quote{i}")
+    with mongo_manager.account_scope("ai"):
+        insert_quote("an AI quote")
+
+    quotes = list(iter_archived_quotes(batch_size=3))
+    assert [quote["text"] for quote in quotes] == [f"quote{i}" for i in range(7)]
+
+    last = quotes[3]
+    resumed = iter_archived_quotes(
+        batch_size=3, after=(last["created_at"], last["_id"])
+    )
+    assert [quote["text"] for quote in resumed] == ["quote4", "quote5", "quote6"]
+
+
+@patch("mongo_manager.MongoClient")
+def test_archive_history_copies_existing_windows(mock_mongo_client):
+    mock_mongo_client.return_value = MongoClient()
+    history = mock_mongo_client.return_value.devwisdomdaily.quote_history
+    history.insert_one({"_id": "recent", "quotes": ["old0", "old1"]})
+    history.insert_one({"_id": "ai:recent", "quotes": ["ai0"]})
+
+    assert archive_history() == 3
+    assert archive_history() == 0
+
+    assert [quote["text"] for quote in iter_archived_quotes()] == ["old0", "old1"]
+    with mongo_manager.account_scope("ai"):
+        assert [quote["text"] for quote in iter_archived_quotes()] == ["ai0"]
+        assert not insert_quote("ai0")
+
+
+@patch("mongo_manager.MongoClient")
+def test_legacy_quotes_are_migrated(mock_mongo_client):
+    mock_mongo_client.return_value = MongoClient()
+    legacy = mock_mongo_client.return_value.devwisdomdaily.quotes
+    legacy.insert_many([{"quote": f"legacy{i}"} for i in range(4)])
+
+    assert migrate_legacy_quotes(history_size=3) == 3
+    assert migrate_legacy_quotes(history_size=3) == 0
+    assert archive_history() == 4
+
+    assert get_recent_quotes() == ["legacy3", "legacy2", "legacy1"]
+    assert [quote["text"] for quote in iter_archived_quotes()] == [
+        "legacy0",
+        "legacy1",
+        "legacy2",
+        "legacy3",
+    ]
+    assert not insert_quote("legacy0")
+
+
+@patch("mongo_manager.MongoClient")
+def test_client_is_created_lazily_and_reused(mock_mongo_client):
+    mock_mongo_client.return_value = MongoClient()
+    mock_mongo_client.assert_not_called()
+
+    insert_quote("quote")
+    get_last_50_quotes()
+
+    mock_mongo_client.assert_called_once()
+
+
+@patch("mongo_manager.MongoClient")
+def test_quote_index_is_built_from_history_and_updated_on_insert(mock_mongo_client):
+    mock_mongo_client.return_value = MongoClient()
+    insert_quote("Talk is cheap. Show me the code.")
+
+    quote_index = get_quote_index()
+    assert len(quote_index) == 1
+
+    insert_quote("Simplicity is prerequisite for reliability.")
+    assert get_quote_index() is quote_index
+    assert len(quote_index) == 2
+    assert quote_index.is_duplicate("Simplicity is a prerequisite for reliability")
+
+
+@patch("mongo_manager.MongoClient")
+def test_quote_index_covers_quotes_older_than_the_history(mock_mongo_client):
+    mock_mongo_client.return_value = MongoClient()
+    insert_quote("Simplicity is prerequisite for reliability.", history_size=1)
+    insert_quote("Talk is cheap. Show me the code.", history_size=1)
+    mongo_manager._recent_windows.clear()
+
+    quote_index = get_quote_index()
+
+    assert len(quote_index) == 2
+    assert quote_index.is_duplicate("Simplicity is a prerequisite for reliability")
+
+
+@patch("mongo_manager.MongoClient")
+def test_post_queue_is_first_in_first_out(mock_mongo_client):
+    mock_mongo_client.return_value = MongoClient()
+
+    first_id = enqueue_post({"quote": "first"})
+    enqueue_post({"quote": "second"})
+    assert count_ready_posts() == 2
+
+    post = pop_ready_post()
+    assert post["_id"] == first_id
+    assert post["status"] == "claimed"
+    assert count_ready_posts() == 1
+
+    mark_post_published(post["_id"], {"twitter": {"ok": True, "error": None}})
+    published = mock_mongo_client.return_value.devwisdomdaily.post_queue.find_one(
+        {"_id": first_id}
+    )
+    assert published["status"] == "published"
+    assert published["results"] == {"twitter": {"ok": True, "error": None}}
+
+    assert pop_ready_post()["quote"] == "second"
+    assert pop_ready_post() is None
+
+
+@patch("mongo_manager.MongoClient")
+def test_claimed_post_is_claimable_again_once_its_lease_expires(mock_mongo_client):
+    mock_mongo_client.return_value = MongoClient()
+    post_id = enqueue_post({"quote": "first"})
+
+    assert pop_ready_post(lease=60)["_id"] == post_id
+    assert pop_ready_post(lease=60) is None
+
+    mock_mongo_client.return_value.devwisdomdaily.post_queue.update_one(
+        {"_id": post_id},
+        {"$set": {"lease_expires_at": datetime.now(timezone.utc) - timedelta(1)}},
+    )
+    assert count_ready_posts() == 1
+    assert pop_ready_post(lease=60)["_id"] == post_id
+
+
+@patch("mongo_manager.MongoClient")
+def test_released_post_is_ready_again(mock_mongo_client):
+    mock_mongo_client.return_value = MongoClient()
+    post_id = enqueue_post({"quote": "first"})
+    pop_ready_post()
+
+    release_post(post_id)
+
+    assert count_ready_posts() == 1
+    assert pop_ready_post()["_id"] == post_id
+
+
+@patch("mongo_manager.MongoClient", new=lambda *args, **kwargs: MongoClient())
+def test_account_scope_separates_accounts():
+    enqueue_post({"quote": "default"})
+    with mongo_manager.account_scope("ai"):
+        insert_quote("an AI quote")
+        enqueue_post({"quote": "ai"})
+        mongo_manager.save_checkpoint("event-1", {"quote": "ai"})
+        assert get_recent_quotes() == ["an AI quote"]
+        assert count_ready_posts() == 1
+        assert pop_ready_post()["quote"] == "ai"
+        assert "an AI quote" in get_quote_index()
+
+    assert get_recent_quotes() == []
+    assert "an AI quote" not in get_quote_index()
+    assert mongo_manager.get_checkpoint("event-1") == {}
+    assert pop_ready_post()["quote"] == "default"
@@ -0,0 +1,104 @@
+import threading
+import time
+from publisher import PlatformUnavailable, publish_all
+
+
+def test_publish_all_runs_publishers_concurrently():
+    # Each publisher only returns once the other one is running too.
+    both_running = threading.Barrier(2, timeout=5)
+
+    def slow_publisher():
+        both_running.wait()
+        return {"id": "slow"}
+
+    results = publish_all(
+        {"instagram": slow_publisher, "twitter": slow_publisher}, max_workers=2
+    )
+
+    assert results["instagram"]["ok"]
+    assert results["twitter"]["result"] == {"id": "slow"}
+
+
+def test_publish_all_isolates_failures():
+    def failing_publisher():
+        raise Exception("Request returned an error: 500")
+
+    results = publish_all(
+        {
+            "instagram": lambda: None,
+            "twitter": failing_publisher,
+            "threads": lambda: "thread",
+        }
+    )
+
+    assert results["instagram"]["ok"] is False
+    assert results["instagram"]["error"] == "Publisher returned no result"
+    assert results["twitter"]["ok"] is False
+    assert "500" in results["twitter"]["error"]
+    assert results["threads"]["ok"] is True
+
+
+def test_publish_all_times_out_slow_publisher():
+    release = threading.Event()
+
+    def stuck_publisher():
+        release.wait(5)
+        return "late"
+
+    results = publish_all(
+        {"instagram": stuck_publisher, "twitter": lambda: "tweet"},
+        timeout=5,
+        timeouts={"instagram": 0.1},
+    )
+
+    # publish_all returned while the stuck publisher was still running.
+    assert not results["instagram"]["future"].done()
+    release.set()
+    assert results["instagram"]["ok"] is False
+    assert "Timed out" in results["instagram"]["error"]
+    assert results["twitter"]["ok"] is True
+    late = results["instagram"]["future"].result(timeout=5)
+    assert late["ok"] is True
+    assert late["result"] == "late"
+
+
+def test_publish_all_skips_unavailable_platforms():
+    def unavailable_publisher():
+        raise PlatformUnavailable("Threads was not set up correctly.")
+
+    results = publish_all({"threads": unavailable_publisher})
+
+    assert results["threads"]["ok"] is False
+    assert results["threads"]["skipped"] is True
+    assert results["threads"]["error"] == "Threads was not set up correctly."
+
+
+def test_publish_all_respects_platform_limits():
+    limit = threading.BoundedSemaphore(1)
+    running = []
+    peak = []
+    results = []
+
+    def publish():
+        running.append(1)
+        peak.append(len(running))
+        time.sleep(0.05)
+        running.pop()
+        return "ok"
+
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(
+                publish_all({"twitter": publish}, limits={"twitter": limit})
+            )
+        )
+        for _ in range(3)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 3
+    assert all(result["twitter"]["ok"] for result in results)
+    assert max(peak) == 1
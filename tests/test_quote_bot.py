@@ -1,13 +1,49 @@
+import threading
+import mongomock
 import pytest
 from unittest.mock import MagicMock, patch
+from mongo_manager import (
+    count_ready_posts,
+    enqueue_post,
+    get_checkpoint,
+    get_post_queue_collection,
+)
 from quote_bot import QuoteBot
 
 
+class SourceVariants:
+    """Hands every platform the source image."""
+
+    def __init__(self, image, **kwargs):
+        self.image = image
+
+    def get(self, platform):
+        return self.image
+
+
+@pytest.fixture(autouse=True)
+def source_variants():
+    with patch("quote_bot.ImageVariants", SourceVariants):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def no_throttling():
+    with patch("quote_bot.throttled_platforms", return_value={}) as mock_throttled:
+        yield mock_throttled
+
+
 @patch("quote_bot.TwitterManager")
+@patch("quote_bot.InstagramManager")
 @patch("quote_bot.ThreadsManager")
 @patch("quote_bot.ContentGenerator")
+@patch("quote_bot.ImageArtifact")
 def test_generate_and_post(
-    mock_content_generator, mock_threads_manager, mock_twitter_manager
+    mock_image_artifact,
+    mock_content_generator,
+    mock_threads_manager,
+    mock_instagram_manager,
+    mock_twitter_manager,
 ):
     config = {
         "TWITTER_API_KEY": "test_key",
@@ -15,6 +51,9 @@ def test_generate_and_post(
         "TWITTER_ACCESS_TOKEN": "test_token",
         "TWITTER_ACCESS_TOKEN_SECRET": "test_token_secret",
         "TWITTER_BEARER_TOKEN": "test_bearer_token",
+        "INSTAGRAM_USERNAME": "test_username",
+        "INSTAGRAM_PASSWORD": "test_password",
+        "THREADS_ENABLED": "true",
     }
 
     quote_bot = QuoteBot(config)
@@ -31,8 +70,9 @@ def test_generate_and_post(
         detailed_description
     )
     mock_content_generator.return_value.generate_image.return_value = image_url
+    image = mock_image_artifact.from_url.return_value
 
-    quote_bot.generate_and_post()
+    results = quote_bot.generate_and_post()
 
     mock_content_generator.return_value.generate_quote.assert_called_once()
     mock_content_generator.return_value.generate_detailed_description.assert_called_once_with(
@@ -41,9 +81,509 @@ def test_generate_and_post(
     mock_content_generator.return_value.generate_image.assert_called_once_with(
         detailed_description
     )
+    mock_image_artifact.from_url.assert_called_once_with(image_url)
+    mock_instagram_manager.return_value.post_on_instagram.assert_called_once_with(
+        quote, image
+    )
     mock_twitter_manager.return_value.tweet_quote_and_image.assert_called_once_with(
-        quote, image_url
+        quote, image
     )
     mock_threads_manager.return_value.thread_quote_and_image.assert_called_once_with(
-        quote_text, image_url
+        quote_text, image
+    )
+    assert set(results) == {"instagram", "twitter", "threads"}
+
+
+@patch("quote_bot.TwitterManager")
+@patch("quote_bot.InstagramManager")
+@patch("quote_bot.ThreadsManager")
+@patch("quote_bot.ContentGenerator")
+def test_publish_continues_when_a_platform_fails(
+    mock_content_generator,
+    mock_threads_manager,
+    mock_instagram_manager,
+    mock_twitter_manager,
+):
+    quote_bot = QuoteBot({})
+    mock_instagram_manager.return_value.post_on_instagram.side_effect = Exception(
+        "Graph API down"
+    )
+    mock_twitter_manager.return_value.tweet_quote_and_image.return_value = (
+        "quote",
+        "http://test_image_url.com",
+    )
+
+    results = quote_bot.publish("quote", "quote", MagicMock())
+
+    mock_threads_manager.assert_not_called()
+    assert results["instagram"]["ok"] is False
+    assert results["instagram"]["error"] == "Graph API down"
+    assert results["twitter"]["ok"] is True
+
+
+@patch("quote_bot.TwitterManager")
+@patch("quote_bot.InstagramManager")
+@patch("quote_bot.ContentGenerator")
+def test_publish_skips_throttled_platforms(
+    mock_content_generator, mock_instagram_manager, mock_twitter_manager, no_throttling
+):
+    no_throttling.return_value = {"twitter": 1900000000.0}
+    mock_instagram_manager.return_value.post_on_instagram.return_value = {"id": "1"}
+
+    results = QuoteBot({}).publish("quote", "quote", MagicMock())
+
+    mock_twitter_manager.return_value.tweet_quote_and_image.assert_not_called()
+    assert results["twitter"]["ok"] is False
+    assert results["twitter"]["error"].startswith("rate limited until 2030-")
+    assert results["instagram"]["ok"] is True
+
+
+@patch("quote_bot.TwitterManager")
+@patch("quote_bot.InstagramManager")
+@patch("quote_bot.ThreadsManager")
+@patch("quote_bot.ContentGenerator")
+@patch("quote_bot.ImageArtifact")
+def test_generate_and_post_structured(
+    mock_image_artifact,
+    mock_content_generator,
+    mock_threads_manager,
+    mock_instagram_manager,
+    mock_twitter_manager,
+):
+    quote_bot = QuoteBot({"STRUCTURED_GENERATION": "true"})
+    mock_content_generator.return_value.generate_post.return_value = {
+        "quote": '"test_quote" - Author #test',
+        "quote_text": "test_quote",
+        "image_description": "test_description",
+    }
+
+    quote_bot.generate_and_post()
+
+    mock_content_generator.return_value.generate_quote.assert_not_called()
+    mock_content_generator.return_value.generate_detailed_description.assert_not_called()
+    mock_content_generator.return_value.generate_image.assert_called_once_with(
+        "test_description"
+    )
+    mock_twitter_manager.return_value.tweet_quote_and_image.assert_called_once_with(
+        '"test_quote" - Author #test', mock_image_artifact.from_url.return_value
+    )
+
+
+@patch("quote_bot.TwitterManager")
+@patch("quote_bot.InstagramManager")
+@patch("quote_bot.ContentGenerator")
+@patch("quote_bot.ImageArtifact")
+@patch("quote_bot.upload_image")
+@patch("quote_bot.enqueue_post")
+@patch("quote_bot.count_ready_posts")
+def test_fill_queue(
+    mock_count_ready_posts,
+    mock_enqueue_post,
+    mock_upload_image,
+    mock_image_artifact,
+    mock_content_generator,
+    mock_instagram_manager,
+    mock_twitter_manager,
+):
+    quote_bot = QuoteBot({"POST_QUEUE_SIZE": "5"})
+    mock_count_ready_posts.return_value = 3
+    mock_content_generator.return_value.generate_quote.return_value = (
+        '"quote" #test',
+        "quote",
+    )
+    mock_image_artifact.from_url.return_value.extension = "png"
+    mock_upload_image.return_value = "https://storage.googleapis.com/bucket/queue.png"
+
+    assert quote_bot.fill_queue() == 2
+
+    assert mock_enqueue_post.call_count == 2
+    queued_post = mock_enqueue_post.call_args.args[0]
+    assert queued_post["image_url"] == mock_upload_image.return_value
+    assert mock_upload_image.call_args.args[1].startswith("queue/")
+    mock_twitter_manager.return_value.tweet_quote_and_image.assert_not_called()
+
+
+@patch("quote_bot.TwitterManager")
+@patch("quote_bot.InstagramManager")
+@patch("quote_bot.ContentGenerator")
+@patch("quote_bot.count_ready_posts", return_value=0)
+def test_top_up_queue_failure_is_not_raised(
+    mock_count_ready_posts, mock_content_generator, *_
+):
+    mock_content_generator.return_value.generate_quote.side_effect = Exception(
+        "OpenAI is down"
+    )
+
+    assert QuoteBot({}).top_up_queue() == 0
+
+
+@patch("quote_bot.TwitterManager")
+@patch("quote_bot.InstagramManager")
+@patch("quote_bot.ContentGenerator")
+@patch("quote_bot.ImageArtifact")
+@patch("quote_bot.delete_image_later")
+@patch("quote_bot.mark_post_published")
+@patch("quote_bot.pop_ready_post")
+def test_publish_next_uses_queued_post(
+    mock_pop_ready_post,
+    mock_mark_post_published,
+    mock_delete_image,
+    mock_image_artifact,
+    mock_content_generator,
+    mock_instagram_manager,
+    mock_twitter_manager,
+):
+    quote_bot = QuoteBot({})
+    mock_pop_ready_post.return_value = {
+        "_id": "post_id",
+        "quote": '"quote" #test',
+        "quote_text": "quote",
+        "image_description": "description",
+        "image_url": "https://storage.googleapis.com/bucket/queue.png",
+    }
+
+    results = quote_bot.publish_next()
+
+    mock_content_generator.return_value.generate_quote.assert_not_called()
+    mock_content_generator.return_value.generate_image.assert_not_called()
+    mock_image_artifact.from_url.assert_called_once_with(
+        "https://storage.googleapis.com/bucket/queue.png"
+    )
+    mock_twitter_manager.return_value.tweet_quote_and_image.assert_called_once_with(
+        '"quote" #test', mock_image_artifact.from_url.return_value
+    )
+    mock_mark_post_published.assert_called_once_with("post_id", results)
+    mock_delete_image.assert_called_once_with(
+        "https://storage.googleapis.com/bucket/queue.png"
+    )
+
+
+@patch("quote_bot.TwitterManager")
+@patch("quote_bot.InstagramManager")
+@patch("quote_bot.ContentGenerator")
+@patch("quote_bot.ImageArtifact")
+@patch("quote_bot.delete_image_later")
+@patch("quote_bot.release_post")
+@patch("quote_bot.mark_post_published")
+@patch("quote_bot.pop_ready_post")
+def test_publish_next_returns_an_unpublished_post_to_the_queue(
+    mock_pop_ready_post,
+    mock_mark_post_published,
+    mock_release_post,
+    mock_delete_image,
+    mock_image_artifact,
+    mock_content_generator,
+    mock_instagram_manager,
+    mock_twitter_manager,
+):
+    quote_bot = QuoteBot({"POST_QUEUE_LEASE": "60"})
+    mock_pop_ready_post.return_value = {
+        "_id": "post_id",
+        "quote": '"quote" #test',
+        "quote_text": "quote",
+        "image_description": "description",
+        "image_url": "https://storage.googleapis.com/bucket/queue.png",
+    }
+    mock_twitter_manager.return_value.tweet_quote_and_image.side_effect = Exception(
+        "Twitter is down"
+    )
+    mock_instagram_manager.return_value.post_on_instagram.side_effect = Exception(
+        "Instagram is down"
+    )
+
+    quote_bot.publish_next()
+
+    mock_pop_ready_post.assert_called_once_with(60)
+    mock_mark_post_published.assert_not_called()
+    mock_delete_image.assert_not_called()
+    mock_release_post.assert_called_once_with("post_id")
+
+
+@patch("quote_bot.TwitterManager")
+@patch("quote_bot.InstagramManager")
+@patch("quote_bot.ContentGenerator")
+@patch("quote_bot.pop_ready_post", return_value=None)
+def test_publish_next_falls_back_to_inline_generation(
+    mock_pop_ready_post,
+    mock_content_generator,
+    mock_instagram_manager,
+    mock_twitter_manager,
+):
+    quote_bot = QuoteBot({})
+    quote_bot.generate_and_post = MagicMock()
+
+    quote_bot.publish_next()
+
+    quote_bot.generate_and_post.assert_called_once()
+
+
+@patch("mongo_manager.MongoClient", new=lambda *args, **kwargs: mongomock.MongoClient())
+@patch("mongo_manager._client", new=None)
+@patch("quote_bot.TwitterManager")
+@patch("quote_bot.InstagramManager")
+@patch("quote_bot.ContentGenerator")
+@patch("quote_bot.ImageArtifact")
+@patch("quote_bot.upload_image")
+@patch("quote_bot.delete_image_later")
+def test_redelivered_run_resumes_from_checkpoint(
+    mock_delete_image_later,
+    mock_upload_image,
+    mock_image_artifact,
+    mock_content_generator,
+    mock_instagram_manager,
+    mock_twitter_manager,
+):
+    quote_bot = QuoteBot({})
+    content_generator = mock_content_generator.return_value
+    content_generator.generate_quote.return_value = ('"quote" #test', "quote")
+    content_generator.generate_detailed_description.return_value = "description"
+    content_generator.generate_image.return_value = "https://dalle/image.png"
+    mock_image_artifact.from_url.return_value.extension = "png"
+    mock_upload_image.return_value = "https://storage.googleapis.com/bucket/run.png"
+    mock_instagram_manager.return_value.post_on_instagram.return_value = {
+        "id": "ig_media_id"
+    }
+    tweet = mock_twitter_manager.return_value.tweet_quote_and_image
+    tweet.side_effect = Exception("Request returned an error: 503")
+
+    with pytest.raises(Exception, match="twitter"):
+        quote_bot.generate_and_post("event-1")
+
+    assert mock_upload_image.call_args.args[1] == "runs/event-1.png"
+    tweet.side_effect = None
+    tweet.return_value = {"id": "tweet_id"}
+
+    results = quote_bot.generate_and_post("event-1")
+
+    assert list(results) == ["twitter"]
+    content_generator.generate_quote.assert_called_once()
+    content_generator.generate_detailed_description.assert_called_once()
+    content_generator.generate_image.assert_called_once()
+    mock_instagram_manager.return_value.post_on_instagram.assert_called_once()
+    mock_image_artifact.from_url.assert_called_with(
+        "https://storage.googleapis.com/bucket/run.png"
+    )
+    assert tweet.call_count == 2
+
+    checkpoint = get_checkpoint("event-1")
+    assert checkpoint["posts"] == {
+        "instagram": {"id": "ig_media_id"},
+        "twitter": {"id": "tweet_id"},
+    }
+    assert checkpoint["completed_at"]
+    mock_delete_image_later.assert_called_once_with(
+        "https://storage.googleapis.com/bucket/run.png"
+    )
+
+    assert quote_bot.generate_and_post("event-1") == {}
+    assert tweet.call_count == 2
+
+
+@patch("mongo_manager.MongoClient", new=lambda *args, **kwargs: mongomock.MongoClient())
+@patch("mongo_manager._client", new=None)
+@patch("quote_bot.TwitterManager")
+@patch("quote_bot.InstagramManager")
+@patch("quote_bot.ContentGenerator")
+@patch("quote_bot.ImageArtifact")
+@patch("quote_bot.upload_image")
+@patch("quote_bot.delete_image_later")
+def test_redelivered_inline_run_does_not_claim_a_queued_post(
+    mock_delete_image_later,
+    mock_upload_image,
+    mock_image_artifact,
+    mock_content_generator,
+    mock_instagram_manager,
+    mock_twitter_manager,
+):
+    quote_bot = QuoteBot({})
+    content_generator = mock_content_generator.return_value
+    content_generator.generate_quote.return_value = ('"inline" #test', "inline")
+    content_generator.generate_detailed_description.return_value = "description"
+    content_generator.generate_image.return_value = "https://dalle/image.png"
+    mock_image_artifact.from_url.return_value.extension = "png"
+    mock_upload_image.return_value = "https://storage.googleapis.com/bucket/run.png"
+    post_on_instagram = mock_instagram_manager.return_value.post_on_instagram
+    post_on_instagram.return_value = {"id": "ig_media_id"}
+    tweet = mock_twitter_manager.return_value.tweet_quote_and_image
+    tweet.side_effect = Exception("Request returned an error: 503")
+
+    # The queue is empty, so the first attempt generates the post inline.
+    with pytest.raises(Exception, match="twitter"):
+        quote_bot.publish_next("event-1")
+
+    queued_id = enqueue_post(
+        {
+            "quote": '"queued" #test',
+            "quote_text": "queued",
+            "image_description": "description",
+            "image_url": "https://storage.googleapis.com/bucket/queue.png",
+        }
+    )
+    tweet.side_effect = None
+    tweet.return_value = {"id": "tweet_id"}
+    quote_bot.publish_next("event-1")
+
+    # The retry finished the inline post and left the queued one alone.
+    post_on_instagram.assert_called_once()
+    assert [c.args[0] for c in tweet.call_args_list] == ['"inline" #test'] * 2
+    assert get_post_queue_collection().find_one({"_id": queued_id})["status"] == (
+        "ready"
+    )
+    assert get_checkpoint("event-1")["completed_at"]
+    mock_delete_image_later.assert_called_once_with(
+        "https://storage.googleapis.com/bucket/run.png"
+    )
+
+
+@patch("mongo_manager.MongoClient", new=lambda *args, **kwargs: mongomock.MongoClient())
+@patch("mongo_manager._client", new=None)
+@patch("quote_bot.TwitterManager")
+@patch("quote_bot.InstagramManager")
+@patch("quote_bot.ContentGenerator")
+@patch("quote_bot.ImageArtifact")
+@patch("quote_bot.delete_image_later")
+def test_checkpointed_queued_post_is_held_for_its_run(
+    mock_delete_image_later,
+    mock_image_artifact,
+    mock_content_generator,
+    mock_instagram_manager,
+    mock_twitter_manager,
+):
+    quote_bot = QuoteBot({})
+    post_id = enqueue_post(
+        {
+            "quote": '"quote" #test',
+            "quote_text": "quote",
+            "image_description": "description",
+            "image_url": "https://storage.googleapis.com/bucket/queue.png",
+        }
+    )
+    tweet = mock_twitter_manager.return_value.tweet_quote_and_image
+    tweet.side_effect = Exception("Request returned an error: 503")
+
+    with pytest.raises(Exception, match="twitter"):
+        quote_bot.publish_next("event-1")
+
+    queued = get_post_queue_collection().find_one({"_id": post_id})
+    assert queued["status"] == "claimed"
+    assert "lease_expires_at" not in queued
+    assert count_ready_posts() == 0
+
+    tweet.side_effect = None
+    tweet.return_value = {"id": "tweet_id"}
+    quote_bot.publish_next("event-1")
+
+    assert get_post_queue_collection().find_one({"_id": post_id})["status"] == (
+        "published"
+    )
+
+
+@pytest.fixture
+def publishing_bot():
+    with patch(
+        "mongo_manager.MongoClient", new=lambda *args, **kwargs: mongomock.MongoClient()
+    ), patch("mongo_manager._client", new=None), patch(
+        "quote_bot.TwitterManager"
+    ) as mock_twitter_manager, patch(
+        "quote_bot.InstagramManager"
+    ) as mock_instagram_manager, patch(
+        "quote_bot.ContentGenerator"
+    ):
+        mock_instagram_manager.return_value.post_on_instagram.return_value = {
+            "id": "ig_media_id"
+        }
+        yield mock_twitter_manager.return_value.tweet_quote_and_image
+
+
+def publish_run(quote_bot, run_id):
+    post = dict(get_checkpoint(run_id), quote='"quote" #test', quote_text="quote")
+    return quote_bot.publish_post(post, MagicMock(), run_id)
+
+
+def test_publish_gives_up_after_the_attempt_cap(publishing_bot):
+    quote_bot = QuoteBot({"PUBLISH_MAX_ATTEMPTS": "2"})
+    publishing_bot.side_effect = Exception("Request returned an error: 503")
+
+    with pytest.raises(Exception, match="twitter"):
+        publish_run(quote_bot, "event-1")
+    results = publish_run(quote_bot, "event-1")
+
+    assert results["twitter"]["ok"] is False
+    assert publishing_bot.call_count == 2
+    checkpoint = get_checkpoint("event-1")
+    assert checkpoint["publish_attempts"] == 2
+    assert checkpoint["completed_at"]
+
+
+def test_throttled_platforms_are_skipped_not_failed(publishing_bot, no_throttling):
+    no_throttling.return_value = {"twitter": 1700000000}
+
+    results = publish_run(QuoteBot({}), "event-1")
+
+    assert results["twitter"]["skipped"] is True
+    publishing_bot.assert_not_called()
+    assert get_checkpoint("event-1")["completed_at"]
+
+
+def test_late_post_is_recorded_before_the_platform_is_retried(publishing_bot):
+    quote_bot = QuoteBot({"PUBLISH_TIMEOUT": "0.1"})
+    release = threading.Event()
+
+    def slow_tweet(*args):
+        release.wait(5)
+        return {"id": "late_tweet_id"}
+
+    publishing_bot.side_effect = slow_tweet
+
+    with pytest.raises(Exception, match="twitter"):
+        publish_run(quote_bot, "event-1")
+    release.set()
+    results = publish_run(quote_bot, "event-1")
+
+    assert results == {}
+    publishing_bot.assert_called_once()
+    checkpoint = get_checkpoint("event-1")
+    assert checkpoint["posts"]["twitter"] == {"id": "late_tweet_id"}
+    assert checkpoint["completed_at"]
+
+
+@patch("quote_bot.TwitterManager")
+@patch("quote_bot.InstagramManager")
+@patch("quote_bot.ContentGenerator")
+@patch("quote_bot.ImageArtifact")
+def test_streamed_quote_starts_the_description_early(
+    mock_image_artifact, mock_content_generator, *_
+):
+    content_generator = mock_content_generator.return_value
+    release = threading.Event()
+
+    def generate_detailed_description(quote_text):
+        if quote_text == "rejected quote":
+            release.wait(5)
+        return f"description of {quote_text}"
+
+    content_generator.generate_detailed_description.side_effect = (
+        generate_detailed_description
+    )
+    streamed = []
+
+    def generate_quote(on_quote_text):
+        # A first quote is rejected after its description was started.
+        on_quote_text("rejected quote")
+        on_quote_text("accepted quote")
+        streamed.append(content_generator.generate_detailed_description.call_count)
+        return '"accepted quote" - Author', "accepted quote"
+
+    content_generator.generate_quote.side_effect = generate_quote
+
+    post = QuoteBot({"STREAM_COMPLETIONS": "true"}).create_post()
+
+    # The description of the rejected quote was not waited for.
+    assert not release.is_set()
+    release.set()
+    assert post["image_description"] == "description of accepted quote"
+    # The descriptions were requested while the quote was still streaming.
+    assert streamed[0] >= 1
+    content_generator.generate_image.assert_called_once_with(
+        "description of accepted quote"
     )
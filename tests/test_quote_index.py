@@ -0,0 +1,72 @@
+import zlib
+from unittest.mock import patch
+from quote_index import QuoteIndex, normalize_quote, quote_hash
+
+
+def test_normalize_quote():
+    assert normalize_quote("  Talk is CHEAP. Show me the code!  ") == (
+        "talk is cheap show me the code"
+    )
+    assert quote_hash("Café, s'il vous plaît") == quote_hash("cafe s il vous plait")
+
+
+def test_exact_duplicates_are_rejected():
+    index = QuoteIndex()
+
+    assert index.add("Talk is cheap. Show me the code.")
+    assert not index.add("talk is cheap, show me the code")
+    assert len(index) == 1
+    assert "TALK IS CHEAP - SHOW ME THE CODE" in index
+
+
+def test_near_duplicates_are_detected():
+    index = QuoteIndex.from_quotes(
+        [
+            "Talk is cheap. Show me the code.",
+            "Premature optimization is the root of all evil.",
+        ]
+    )
+
+    quote, score = index.most_similar("Talk is cheap, show me your code!")
+
+    assert quote == "Talk is cheap. Show me the code."
+    assert score >= index.threshold
+    assert index.is_duplicate("Premature optimisation is the root of all evil")
+    assert not index.is_duplicate("Simplicity is prerequisite for reliability.")
+
+
+def test_signature_does_not_overflow():
+    index = QuoteIndex(num_perm=8)
+    shingles = {"talk", "alk ", "lk i"}
+
+    expected = [
+        min(
+            (int(a) * (zlib.crc32(shingle.encode("utf-8")) % (2**31 - 1)) + int(b))
+            % (2**31 - 1)
+            for shingle in shingles
+        )
+        for a, b in zip(index._a[:, 0], index._b[:, 0])
+    ]
+
+    assert index.signature("talk i").tolist() == expected
+
+
+def test_empty_index():
+    index = QuoteIndex()
+
+    assert index.most_similar("Any quote") == (None, 0.0)
+    assert not index.is_duplicate("Any quote")
+
+
+def test_index_scales_to_an_archive():
+    index = QuoteIndex.from_quotes(
+        f"Quote number {i} about shipping software {i * 7919}" for i in range(3000)
+    )
+
+    # One signature for the candidate, compared against the whole archive in
+    # a single vectorized pass rather than quote by quote.
+    with patch.object(index, "signature", wraps=index.signature) as signature:
+        assert not index.is_duplicate("Programs must be written for people to read.")
+
+    assert len(index) == 3000
+    assert signature.call_count == 1
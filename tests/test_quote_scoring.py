@@ -0,0 +1,127 @@
+import numpy as np
+import pytest
+from quote_index import QuoteIndex
+from quote_scoring import (
+    DOMAIN_KEYWORDS,
+    classify_domain,
+    domain_shares,
+    domain_weights,
+    ranked_candidates,
+    score_candidates,
+)
+
+
+def candidate(quote_text, caption=None, truncated=False):
+    return {
+        "quote": caption or f'"{quote_text}" - Author',
+        "quote_text": quote_text,
+        "truncated": truncated,
+    }
+
+
+def test_classify_domain():
+    assert classify_domain("Machine learning is the new electricity #AI") == (
+        "artificial intelligence"
+    )
+    assert classify_domain("Talk is cheap. Show me the code.") == (
+        "software development"
+    )
+    assert classify_domain("Stay hungry, stay foolish.") is None
+
+
+def test_domain_shares():
+    shares = domain_shares(["The code is the design.", "Data beats opinions.", "Hm."])
+
+    assert shares == {"software development": 0.5, "data science": 0.5}
+
+
+def test_max_similarities_matches_one_by_one_scores():
+    index = QuoteIndex.from_quotes(
+        [
+            "Talk is cheap. Show me the code.",
+            "Simplicity is prerequisite for reliability.",
+        ]
+    )
+    texts = [
+        "Talk is cheap, show me your code!",
+        "Stay hungry.",
+        "talk is cheap show me the code",
+    ]
+
+    scores = index.max_similarities(texts)
+
+    assert scores[0] == index.most_similar(texts[0])[1]
+    assert scores[1] == index.most_similar(texts[1])[1]
+    assert scores[2] == 1.0
+    assert len(QuoteIndex().max_similarities(texts)) == 3
+
+
+def test_infeasible_candidates_are_ranked_out():
+    index = QuoteIndex.from_quotes(["Talk is cheap. Show me the code."])
+    candidates = [
+        None,
+        candidate("Talk is cheap, show me the code!"),
+        candidate("Cut off", truncated=True),
+        candidate("Too long", caption="x" * 281),
+        candidate("Simplicity is prerequisite for reliability."),
+    ]
+
+    scores = score_candidates(candidates, index)
+
+    assert np.isinf(scores[:4]).all()
+    assert ranked_candidates(candidates, scores) == [candidates[4]]
+
+
+def test_underrepresented_domains_are_preferred():
+    index = QuoteIndex()
+    candidates = [
+        candidate("Code is like humor."),
+        candidate(
+            "Privacy is not a crime.", caption="Privacy is not a crime. #Security"
+        ),
+    ]
+
+    scores = score_candidates(
+        candidates,
+        index,
+        recent_quotes=[
+            "Code never lies.",
+            "Debugging is twice as hard as writing code.",
+        ],
+    )
+
+    assert ranked_candidates(candidates, scores)[0] is candidates[1]
+    assert (
+        ranked_candidates(
+            candidates, score_candidates(candidates, index, balance_weight=0)
+        )[0]
+        is candidates[0]
+    )
+
+
+def test_domain_weights_favour_engaging_domains():
+    stats = {
+        "artificial intelligence": {"posts": 4, "engagements": 400},
+        "cybersecurity": {"posts": 4, "engagements": 40},
+        "data science": {"posts": 1, "engagements": 1000},
+    }
+
+    weights = domain_weights(stats)
+
+    assert set(weights) == set(DOMAIN_KEYWORDS)
+    assert sum(weights.values()) == pytest.approx(1)
+    assert weights["artificial intelligence"] > weights["cybersecurity"]
+    # Domains with too few posts are explored at the mean rate.
+    assert weights["data science"] == pytest.approx(weights["game development"])
+    assert weights["data science"] < weights["artificial intelligence"]
+
+
+def test_domain_weights_keep_a_floor_and_need_data():
+    stats = {
+        "artificial intelligence": {"posts": 10, "engagements": 1000},
+        "cybersecurity": {"posts": 10, "engagements": 0},
+    }
+
+    assert min(domain_weights(stats).values()) > 0.03
+    assert domain_weights({}) == {}
+    assert domain_weights({"cybersecurity": {"posts": 1, "engagements": 5}}) == {}
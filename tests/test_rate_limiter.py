@@ -0,0 +1,169 @@
+import pytest
+import requests
+from unittest.mock import MagicMock, patch
+from mongo_manager import get_rate_limits, save_rate_limit
+from rate_limiter import (
+    RateLimiter,
+    parse_rate_limit,
+    retry_delay,
+    throttled_platforms,
+)
+
+
+def make_response(status_code, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    return response
+
+
+def test_parse_twitter_rate_limit_headers():
+    response = make_response(
+        200,
+        {
+            "x-rate-limit-limit": "300",
+            "x-rate-limit-remaining": "299",
+            "x-rate-limit-reset": "1700000900",
+        },
+    )
+
+    assert parse_rate_limit(response) == {
+        "remaining": 299,
+        "limit": 300,
+        "reset_at": 1700000900.0,
+    }
+
+
+def test_parse_graph_app_usage_header():
+    response = make_response(
+        200,
+        {"X-App-Usage": '{"call_count": 100, "total_time": 25, "total_cputime": 9}'},
+    )
+
+    assert parse_rate_limit(response, now=1000) == {
+        "remaining": 0,
+        "limit": 100,
+        "reset_at": 4600,
+    }
+    assert parse_rate_limit(make_response(200)) is None
+    assert parse_rate_limit(make_response(200, {"X-App-Usage": "{}"})) is None
+
+
+def test_retry_delay_waits_for_reset_on_429():
+    response = make_response(
+        429, {"x-rate-limit-remaining": "0", "x-rate-limit-reset": "1012"}
+    )
+
+    assert retry_delay(response, 0, 1, now=1000) == 12
+    assert retry_delay(make_response(503, {"Retry-After": "7"}), 0, 1) == 7
+    assert 1 <= retry_delay(make_response(503), 1, 1) <= 2
+
+
+@patch("rate_limiter.time.sleep")
+def test_request_retries_transient_errors_and_persists_quota(mock_sleep):
+    session = MagicMock()
+    session.get.side_effect = [
+        make_response(503),
+        make_response(200, {"x-rate-limit-remaining": "41"}),
+    ]
+    limiter = RateLimiter({"RATE_LIMIT_BACKOFF": "0.5"})
+
+    response = limiter.request(
+        session, "get", "http://api", "twitter.upload_status", params={}
+    )
+
+    assert response.status_code == 200
+    assert session.get.call_count == 2
+    assert session.get.call_args.kwargs == {"params": {}}
+    assert 0.25 <= mock_sleep.call_args.args[0] <= 0.5
+    assert (
+        get_rate_limits(["twitter.upload_status"])["twitter.upload_status"]["remaining"]
+        == 41
+    )
+
+
+@patch("rate_limiter.time.sleep")
+def test_post_is_only_retried_when_rate_limited(mock_sleep):
+    session = MagicMock()
+    session.post.side_effect = [make_response(503)]
+    limiter = RateLimiter({"RATE_LIMIT_BACKOFF": "0.5"})
+
+    response = limiter.request(session, "post", "http://api", "twitter.tweet", json={})
+
+    assert response.status_code == 503
+    session.post.assert_called_once()
+
+    session.post.side_effect = [make_response(429), make_response(201)]
+    response = limiter.request(session, "post", "http://api", "twitter.tweet", json={})
+
+    assert response.status_code == 201
+    assert session.post.call_count == 3
+
+
+@patch("rate_limiter.time.sleep")
+def test_idempotent_requests_are_retried_when_the_connection_fails(mock_sleep):
+    session = MagicMock()
+    session.post.side_effect = [
+        requests.ConnectionError("connection reset"),
+        make_response(204),
+    ]
+    limiter = RateLimiter({})
+
+    response = limiter.request(
+        session, "post", "http://api", "twitter.upload", idempotent=True
+    )
+
+    assert response.status_code == 204
+    assert session.post.call_count == 2
+
+    session.post.side_effect = [requests.ConnectionError("connection reset")]
+    with pytest.raises(requests.ConnectionError):
+        limiter.request(session, "post", "http://api", "twitter.tweet")
+    assert session.post.call_count == 3
+
+
+@patch("rate_limiter.save_rate_limit")
+def test_quota_is_only_persisted_when_it_matters(mock_save_rate_limit):
+    session = MagicMock()
+    session.get.side_effect = [
+        make_response(200, {"x-app-usage": '{"call_count": 10}'}),
+        make_response(200, {"x-app-usage": '{"call_count": 10}'}),
+        make_response(200, {"x-app-usage": '{"call_count": 40}'}),
+        make_response(200, {"x-app-usage": '{"call_count": 95}'}),
+        make_response(200, {"x-app-usage": '{"call_count": 96}'}),
+    ]
+    limiter = RateLimiter({})
+
+    for _ in range(5):
+        limiter.request(session, "get", "http://api", "graph.container_status")
+
+    # The first quota, then every change once below 10% of the limit.
+    assert [
+        call.args[1]["remaining"] for call in mock_save_rate_limit.call_args_list
+    ] == [90, 5, 4]
+
+
+@patch("rate_limiter.time.sleep")
+def test_request_gives_up_when_reset_is_too_far(mock_sleep):
+    session = MagicMock()
+    session.post.return_value = make_response(
+        429, {"x-rate-limit-remaining": "0", "x-rate-limit-reset": "9999999999"}
+    )
+
+    response = RateLimiter({}).request(session, "post", "http://api", "twitter.tweet")
+
+    assert response.status_code == 429
+    session.post.assert_called_once()
+    mock_sleep.assert_not_called()
+    assert throttled_platforms(["twitter", "instagram", "threads"]) == {
+        "twitter": 9999999999.0
+    }
+
+
+def test_throttled_platforms_ignores_expired_resets():
+    save_rate_limit("graph.media", {"remaining": 0, "limit": 100, "reset_at": 500})
+    save_rate_limit("twitter.upload", {"remaining": 3, "limit": 5, "reset_at": 2000})
+
+    assert throttled_platforms(["twitter", "instagram"], now=1000) == {}
+    assert throttled_platforms(["instagram"], now=100) == {"instagram": 500}
+    assert throttled_platforms(["threads"]) == {}
@@ -0,0 +1,118 @@
+import json
+import threading
+import time
+from unittest.mock import patch
+import mongo_manager
+from mongo_manager import (
+    current_account,
+    get_accounts_collection,
+    get_recent_quotes,
+    insert_quote,
+)
+from scheduler import AccountScheduler, load_accounts, parse_limits
+
+ACCOUNTS = [
+    {"id": "ai", "interval_minutes": 60, "config": {"QUOTE_PROMPT": "AI quotes"}},
+    {"id": "gamedev", "config": {"QUOTE_PROMPT": "Game development quotes"}},
+    {"id": "retired", "enabled": False},
+]
+
+
+def test_load_accounts_from_file(tmp_path):
+    path = tmp_path / "accounts.json"
+    path.write_text(json.dumps(ACCOUNTS))
+
+    accounts = load_accounts({"ACCOUNTS_FILE": str(path)})
+
+    assert [account["id"] for account in accounts] == ["ai", "gamedev"]
+    assert accounts[0]["interval"] == 3600
+    assert accounts[1]["interval"] == 86400
+    assert accounts[1]["config"] == {"QUOTE_PROMPT": "Game development quotes"}
+
+
+def test_load_accounts_from_mongo():
+    get_accounts_collection().insert_many(
+        [dict(account, _id=account.pop("id")) for account in map(dict, ACCOUNTS)]
+    )
+
+    accounts = load_accounts({"ACCOUNTS_SOURCE": "mongo"})
+
+    assert sorted(account["id"] for account in accounts) == ["ai", "gamedev"]
+
+
+def test_parse_limits():
+    assert parse_limits("twitter=2, instagram=1") == {"twitter": 2, "instagram": 1}
+    assert parse_limits(None) == {}
+
+
+@patch("scheduler.QuoteBot")
+def test_runs_each_due_account_once_in_its_own_scope(mock_quote_bot):
+    seen = []
+
+    def generate_and_post(run_id):
+        seen.append((current_account(), run_id))
+        insert_quote(f"quote for {current_account()}")
+        return {"twitter": {"ok": True}}
+
+    mock_quote_bot.return_value.generate_and_post.side_effect = generate_and_post
+    scheduler = AccountScheduler(
+        {"PLATFORM_CONCURRENCY": "twitter=1"}, load_accounts_list()
+    )
+
+    results = scheduler.run("event-1")
+
+    assert sorted(seen) == [("ai", "event-1"), ("gamedev", "event-1")]
+    assert all(result["ok"] for result in results.values())
+    configs = sorted(c.args[0]["QUOTE_PROMPT"] for c in mock_quote_bot.call_args_list)
+    assert configs == ["AI quotes", "Game development quotes"]
+    limits = mock_quote_bot.call_args.kwargs["platform_limits"]
+    assert set(limits) == {"twitter"}
+    assert get_recent_quotes() == []
+    with mongo_manager.account_scope("ai"):
+        assert get_recent_quotes() == ["quote for ai"]
+
+    # Neither account is due again before its interval has passed.
+    assert scheduler.run("event-2") == {}
+
+
+@patch("scheduler.QuoteBot")
+def test_failed_account_is_released_for_the_retry(mock_quote_bot):
+    mock_quote_bot.return_value.generate_and_post.side_effect = Exception("boom")
+    scheduler = AccountScheduler({}, load_accounts_list()[:1])
+
+    assert scheduler.run("event-1") == {
+        "ai": {"ok": False, "error": "boom", "results": None}
+    }
+    assert "ai" in scheduler.run("event-1")
+
+
+@patch("scheduler.QuoteBot")
+def test_account_pool_is_bounded(mock_quote_bot):
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def generate_and_post(run_id):
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.pop()
+        return {}
+
+    mock_quote_bot.return_value.generate_and_post.side_effect = generate_and_post
+    accounts = [{"id": f"account-{i}", "interval": 60, "config": {}} for i in range(6)]
+
+    results = AccountScheduler({"ACCOUNT_MAX_WORKERS": "2"}, accounts).run()
+
+    assert len(results) == 6
+    assert max(peak) == 2
+
+
+def load_accounts_list():
+    return [
+        {"id": account["id"], "interval": 3600, "config": account.get("config", {})}
+        for account in ACCOUNTS
+        if account.get("enabled", True)
+    ]
@@ -0,0 +1,52 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imports main with the OpenAI and MongoDB clients stubbed out and sockets
+# disabled, then reports how long the import took and which clients were built.
+IMPORT_BENCHMARK = """
+import socket
+import time
+import openai
+import pymongo.mongo_client
+
+created = []
+
+
+class StubClient:
+    def __init__(self, *args, **kwargs):
+        created.append(type(self).__name__)
+
+
+def no_network(*args, **kwargs):
+    raise AssertionError("network I/O during import")
+
+
+openai.OpenAI = type("OpenAI", (StubClient,), {})
+pymongo.mongo_client.MongoClient = type("MongoClient", (StubClient,), {})
+socket.socket.connect = no_network
+socket.getaddrinfo = no_network
+
+started = time.perf_counter()
+import main
+elapsed = time.perf_counter() - started
+print(f"{elapsed:.6f}")
+print(",".join(created))
+"""
+
+
+def test_import_main_does_no_client_setup():
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_BENCHMARK],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+
+    assert result.returncode == 0, result.stderr
+    elapsed, created = result.stdout.splitlines()[-2:]
+    print(f"\nimport main: {float(elapsed) * 1000:.1f} ms")
+    assert created == ""
@@ -0,0 +1,95 @@
+import threading
+from unittest.mock import call, patch
+import storage_manager
+from storage_manager import (
+    delete_image_later,
+    ensure_staging_lifecycle_rule,
+    get_bucket,
+    get_storage_client,
+    staging_name,
+    upload_image,
+    wait_for_pending_deletes,
+)
+
+
+@patch("storage_manager.storage.Client")
+def test_client_and_bucket_are_created_once(mock_storage_client):
+    assert get_storage_client() is get_storage_client()
+    assert get_bucket() is get_bucket()
+
+    mock_storage_client.assert_called_once_with()
+    mock_storage_client.return_value.bucket.assert_called_once_with(
+        "devwisdomdaily-image"
+    )
+
+
+@patch("storage_manager.storage.Client")
+def test_upload_image_uses_a_single_request(mock_storage_client):
+    blob = mock_storage_client.return_value.bucket.return_value.blob.return_value
+
+    url = upload_image(b"jpeg", "staging/image.jpeg", "image/jpeg")
+
+    blob.upload_from_string.assert_called_once_with(b"jpeg", content_type="image/jpeg")
+    assert url == (
+        "https://storage.googleapis.com/devwisdomdaily-image/staging/image.jpeg"
+    )
+
+
+def test_staging_names_are_unique():
+    names = {staging_name("jpeg") for _ in range(100)}
+
+    assert len(names) == 100
+    assert all(name.startswith("staging/") for name in names)
+
+
+@patch("storage_manager.storage.Client")
+def test_delete_image_later_runs_off_the_calling_thread(mock_storage_client):
+    blob = mock_storage_client.return_value.bucket.return_value.blob
+    release = threading.Event()
+    blob.return_value.delete.side_effect = lambda: release.wait(1)
+
+    future = delete_image_later(
+        "https://storage.googleapis.com/devwisdomdaily-image/staging/image.jpeg"
+    )
+    assert not future.done()
+
+    release.set()
+    wait_for_pending_deletes()
+    assert future.done()
+    blob.assert_called_once_with("staging/image.jpeg")
+
+
+@patch("storage_manager.storage.Client")
+def test_failed_background_delete_is_reported(mock_storage_client, capsys):
+    blob = mock_storage_client.return_value.bucket.return_value.blob.return_value
+    blob.delete.side_effect = Exception("404 Not Found")
+
+    delete_image_later("https://storage.googleapis.com/devwisdomdaily-image/x.jpeg")
+    wait_for_pending_deletes()
+
+    assert "404 Not Found" in capsys.readouterr().out
+
+
+@patch("storage_manager.storage.Client")
+def test_ensure_staging_lifecycle_rule_is_idempotent(mock_storage_client):
+    bucket = mock_storage_client.return_value.get_bucket.return_value
+    bucket.lifecycle_rules = []
+
+    assert ensure_staging_lifecycle_rule() is True
+    bucket.add_lifecycle_delete_rule.assert_has_calls(
+        [
+            call(age=1, matches_prefix=["staging/"]),
+            call(age=7, matches_prefix=["runs/"]),
+            call(age=30, matches_prefix=["queue/"]),
+        ]
+    )
+    bucket.patch.assert_called_once()
+
+    bucket.lifecycle_rules = [
+        {
+            "action": {"type": "Delete"},
+            "condition": {"age": age, "matchesPrefix": [prefix]},
+        }
+        for prefix, age in storage_manager.LIFECYCLE_AGE_DAYS.items()
+    ]
+    assert ensure_staging_lifecycle_rule() is False
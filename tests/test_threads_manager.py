@@ -1,51 +1,174 @@
+import json
 import unittest
 from unittest.mock import patch, MagicMock
+import pytest
+from cryptography.fernet import Fernet
+import mongo_manager
+import threads_manager as threads_module
+from publisher import PlatformUnavailable
 from threads_manager import ThreadsManager
 
+SESSION_KEY = Fernet.generate_key().decode()
+CONFIG = {
+    "INSTAGRAM_USERNAME": "test_username",
+    "INSTAGRAM_PASSWORD": "test_password",
+    "THREADS_SESSION_KEY": SESSION_KEY,
+}
+
+
+class FakePrivateApi:
+    def __init__(self):
+        self.user_id = None
+        self.authentication_token = None
+        self.cookies = None
+        self.captions = []
+        self.error = None
+
+    def create_thread(self, caption, image_file):
+        if self.error:
+            raise self.error
+        self.captions.append(caption)
+        return {"id": len(self.captions)}
+
+
+class FakeThreads:
+    """A stand-in for the threads client that logs in when given a login."""
+
+    logins = 0
+
+    def __init__(self, username=None, password=None):
+        self.private_api = FakePrivateApi()
+        if username is not None:
+            FakeThreads.logins += 1
+            self.private_api.user_id = "42"
+            self.private_api.authentication_token = f"token-{FakeThreads.logins}"
+            self.private_api.cookies = {"sessionid": "abc"}
+
+
+@pytest.fixture(autouse=True)
+def reset_logins():
+    FakeThreads.logins = 0
+
 
 class TestThreadsManager(unittest.TestCase):
-    @patch("requests.get")
     @patch("tempfile.NamedTemporaryFile")
-    @patch("os.remove")
     @patch("threads_manager.Threads")
-    def test_thread_quote_and_image(
-        self, mock_Threads, mock_remove, mock_NamedTemporaryFile, mock_get
-    ):
+    def test_thread_quote_and_image(self, mock_Threads, mock_NamedTemporaryFile):
         config = {
             "INSTAGRAM_USERNAME": "test_username",
             "INSTAGRAM_PASSWORD": "test_password",
         }
-        image_url = "test_url"
+        image = MagicMock()
+        image_file = image.open.return_value.__enter__.return_value
         quote_without_hashtags = "test_quote"
 
-        # Mock successful response from requests.get
-        mock_response = MagicMock()
-        mock_response.iter_content.return_value = [b"test"]
-        mock_get.return_value = mock_response
-
-        # Mock successful temp file creation
-        temp_file_mock = MagicMock()
-        mock_NamedTemporaryFile.return_value.__enter__.return_value = temp_file_mock
-
         # Mock successful thread creation
         threads_instance_mock = MagicMock()
         mock_Threads.return_value = threads_instance_mock
 
         threads_manager = ThreadsManager(config)
-        threads_manager.thread_quote_and_image(quote_without_hashtags, image_url)
+        created_thread = threads_manager.thread_quote_and_image(
+            quote_without_hashtags, image
+        )
 
-        # Verify the calls were made correctly
-        mock_get.assert_called_once_with(image_url, stream=True)
-        mock_NamedTemporaryFile.assert_called_once_with(suffix=".png", delete=False)
-        temp_file_mock.write.assert_called_once_with(b"test")
-        threads_instance_mock.private_api.create_thread.assert_called_once()
+        # Verify the in-memory image was handed over without a temp file
+        mock_NamedTemporaryFile.assert_not_called()
+        threads_instance_mock.private_api.create_thread.assert_called_once_with(
+            caption=quote_without_hashtags,
+            image_file=image_file,
+        )
+        self.assertEqual(
+            created_thread,
+            threads_instance_mock.private_api.create_thread.return_value,
+        )
 
         # Test when Threads raises an exception
+        threads_module._clients.clear()
         mock_Threads.side_effect = Exception("Test Exception")
 
         threads_manager = ThreadsManager(config)
+        with self.assertRaises(PlatformUnavailable):
+            threads_manager.thread_quote_and_image(quote_without_hashtags, image)
         self.assertIsNone(threads_manager.threads)
 
 
+@pytest.fixture
+def mongo():
+    with patch("threads_manager.Threads", FakeThreads):
+        yield mongo_manager.get_sessions_collection()
+
+
+def test_login_is_lazy_and_once_per_process(mongo):
+    threads_manager = ThreadsManager(dict(CONFIG, THREADS_SESSION_KEY=None))
+    assert FakeThreads.logins == 0
+
+    threads_manager.thread_quote_and_image("first", MagicMock())
+    ThreadsManager(CONFIG).thread_quote_and_image("second", MagicMock())
+
+    assert FakeThreads.logins == 1
+    assert threads_manager.threads.private_api.captions == ["first", "second"]
+    assert mongo.count_documents({}) == 0
+
+
+def test_session_is_stored_encrypted_and_restored(mongo):
+    ThreadsManager(CONFIG).thread_quote_and_image("first", MagicMock())
+    stored = mongo.find_one({"_id": "threads:test_username"})
+    assert b"test_password" not in stored["data"]
+    assert b"test_username" not in stored["data"]
+
+    # Only the login state is stored, not the client.
+    stored = json.loads(Fernet(SESSION_KEY).decrypt(stored["data"]))
+    assert stored == {
+        "user_id": "42",
+        "token": "token-1",
+        "cookies": {"sessionid": "abc"},
+    }
+
+    # A cold start restores the stored session instead of logging in.
+    threads_module._clients.clear()
+    threads_manager = ThreadsManager(CONFIG)
+    assert threads_manager.thread_quote_and_image("second", MagicMock()) == {"id": 1}
+    assert FakeThreads.logins == 1
+    assert threads_manager.threads.private_api.authentication_token == "token-1"
+
+
+def test_expired_session_logs_in_again(mongo):
+    ThreadsManager(CONFIG).thread_quote_and_image("first", MagicMock())
+    session = threads_module._clients["threads:test_username"].private_api
+    session.error = Exception("login_required")
+
+    created = ThreadsManager(CONFIG).thread_quote_and_image("second", MagicMock())
+
+    assert created == {"id": 1}
+    assert FakeThreads.logins == 2
+    stored = json.loads(
+        Fernet(SESSION_KEY).decrypt(
+            mongo.find_one({"_id": "threads:test_username"})["data"]
+        )
+    )
+    assert stored["token"] == "token-2"
+
+
+def test_other_failures_of_a_restored_session_are_not_reposted(mongo):
+    ThreadsManager(CONFIG).thread_quote_and_image("first", MagicMock())
+    session = threads_module._clients["threads:test_username"].private_api
+    session.error = Exception("Read timed out")
+
+    created = ThreadsManager(CONFIG).thread_quote_and_image("second", MagicMock())
+
+    # The post may have been made, so it is neither retried nor logged in again.
+    assert created is None
+    assert FakeThreads.logins == 1
+    assert mongo.count_documents({}) == 1
+
+
+def test_unreadable_session_falls_back_to_login(mongo):
+    mongo.insert_one({"_id": "threads:test_username", "data": b"garbage"})
+
+    ThreadsManager(CONFIG).thread_quote_and_image("first", MagicMock())
+
+    assert FakeThreads.logins == 1
+
+
 if __name__ == "__main__":
     unittest.main()
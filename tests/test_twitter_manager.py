@@ -1,50 +1,242 @@
+import io
 import pytest
+import requests
 from unittest.mock import patch, MagicMock
 from twitter_manager import TwitterManager
 
+config = {
+    "TWITTER_API_KEY": "test_key",
+    "TWITTER_API_SECRET": "test_secret",
+    "TWITTER_ACCESS_TOKEN": "test_token",
+    "TWITTER_ACCESS_TOKEN_SECRET": "test_token_secret",
+    "TWITTER_BEARER_TOKEN": "test_bearer_token",
+}
 
-@patch("requests.get")
-@patch("requests_oauthlib.OAuth1Session")
-def test_upload_media(mock_oauth, mock_get):
-    config = {
-        "TWITTER_API_KEY": "test_key",
-        "TWITTER_API_SECRET": "test_secret",
-        "TWITTER_ACCESS_TOKEN": "test_token",
-        "TWITTER_ACCESS_TOKEN_SECRET": "test_token_secret",
-        "TWITTER_BEARER_TOKEN": "test_bearer_token",
-    }
+
+@patch("twitter_manager.get_oauth1_session")
+def test_upload_media(mock_oauth):
     tm = TwitterManager(config)
-    mock_get.return_value.content = b"test_data"
     mock_response = MagicMock()
     mock_response.json.return_value = {"media_id_string": "test_media_id"}
     mock_response.status_code = 200
     mock_oauth.return_value.post.return_value = mock_response
 
-    image_url = "http://test_image_url.com"
-    assert tm.upload_media(image_url) == "test_media_id"
-    mock_get.assert_called_once_with(image_url)
+    image = MagicMock(
+        data=b"test_data",
+        url="http://test_image_url.com",
+        size=9,
+        content_type="image/png",
+    )
+    assert tm.upload_media(image) == "test_media_id"
     mock_oauth.return_value.post.assert_called_once()
+    assert mock_oauth.return_value.post.call_args.kwargs["files"] == {
+        "media": b"test_data"
+    }
 
 
-@patch("requests.get")
-@patch("requests_oauthlib.OAuth1Session")
-def test_tweet_quote_and_image(mock_oauth, mock_get):
-    config = {
-        "TWITTER_API_KEY": "test_key",
-        "TWITTER_API_SECRET": "test_secret",
-        "TWITTER_ACCESS_TOKEN": "test_token",
-        "TWITTER_ACCESS_TOKEN_SECRET": "test_token_secret",
-        "TWITTER_BEARER_TOKEN": "test_bearer_token",
-    }
+@patch("twitter_manager.get_oauth1_session")
+def test_tweet_quote_and_image(mock_oauth):
     tm = TwitterManager(config)
-    mock_get.return_value.content = b"test_data"
     mock_upload_response = MagicMock()
     mock_upload_response.json.return_value = {"media_id_string": "test_media_id"}
     mock_upload_response.status_code = 200
-    mock_oauth.return_value.post.side_effect = [mock_upload_response, MagicMock()]
-    mock_oauth.return_value.post.return_value.status_code = 201
+    mock_tweet_response = MagicMock(status_code=201)
+    mock_tweet_response.json.return_value = {
+        "data": {"id": "test_tweet_id", "text": "#test_quote"}
+    }
+    mock_oauth.return_value.post.side_effect = [
+        mock_upload_response,
+        mock_tweet_response,
+    ]
 
     quote = "#test_quote"
-    image_url = "http://test_image_url.com"
-    assert tm.tweet_quote_and_image(quote, image_url) == ("test_quote", image_url)
+    image = MagicMock(
+        data=b"test_data",
+        url="http://test_image_url.com",
+        size=9,
+        content_type="image/png",
+    )
+    assert tm.tweet_quote_and_image(quote, image) == {
+        "id": "test_tweet_id",
+        "text": "#test_quote",
+    }
     assert mock_oauth.return_value.post.call_count == 2
+
+
+def upload_response(status_code, payload=None):
+    response = MagicMock(status_code=status_code)
+    response.json.return_value = payload or {}
+    return response
+
+
+class RecordingStream(io.BytesIO):
+    def __init__(self, data):
+        super().__init__(data)
+        self.reads = []
+
+    def read(self, size=-1):
+        self.reads.append(size)
+        return super().read(size)
+
+
+@patch("twitter_manager.get_oauth1_session")
+def test_large_media_uses_chunked_upload(mock_oauth):
+    tm = TwitterManager(dict(config, TWITTER_CHUNKED_UPLOAD_THRESHOLD="4"))
+    tm.upload_media_chunked = MagicMock(return_value="chunked_media_id")
+    image = MagicMock(data=b"test_data", size=9, content_type="image/png")
+
+    assert tm.upload_media(image) == "chunked_media_id"
+    tm.upload_media_chunked.assert_called_once_with(
+        image.open.return_value, 9, "image/png"
+    )
+    mock_oauth.return_value.post.assert_not_called()
+
+
+@patch("twitter_manager.get_oauth1_session")
+def test_chunked_upload_streams_bounded_segments(mock_oauth):
+    tm = TwitterManager(dict(config, TWITTER_CHUNK_SIZE="4"))
+    post = mock_oauth.return_value.post
+    post.side_effect = [
+        upload_response(202, {"media_id_string": "test_media_id"}),
+        upload_response(204),
+        upload_response(204),
+        upload_response(204),
+        upload_response(201, {"media_id_string": "test_media_id"}),
+    ]
+    stream = RecordingStream(b"0123456789")
+
+    assert tm.upload_media_chunked(stream, 10, "image/png") == "test_media_id"
+
+    commands = [c.kwargs["data"]["command"] for c in post.call_args_list]
+    assert commands == ["INIT", "APPEND", "APPEND", "APPEND", "FINALIZE"]
+    assert post.call_args_list[0].kwargs["data"]["media_category"] == "tweet_image"
+    segments = [c.kwargs["files"]["media"] for c in post.call_args_list[1:4]]
+    assert segments == [b"0123", b"4567", b"89"]
+    assert set(stream.reads) == {4}
+
+
+@patch("rate_limiter.time.sleep")
+@patch("twitter_manager.get_oauth1_session")
+def test_failed_append_is_retried_without_restarting(mock_oauth, mock_sleep):
+    tm = TwitterManager(dict(config, TWITTER_CHUNK_SIZE="5"))
+    post = mock_oauth.return_value.post
+    post.side_effect = [
+        upload_response(202, {"media_id_string": "test_media_id"}),
+        upload_response(204),
+        requests.ConnectionError("connection reset"),
+        upload_response(503),
+        upload_response(204),
+        upload_response(201, {"media_id_string": "test_media_id"}),
+    ]
+
+    assert tm.upload_media_chunked(io.BytesIO(b"0123456789"), 10, "image/png")
+
+    appends = [
+        c.kwargs["data"]["segment_index"]
+        for c in post.call_args_list
+        if c.kwargs["data"]["command"] == "APPEND"
+    ]
+    assert appends == [0, 1, 1, 1]
+    assert mock_sleep.call_count == 2
+    assert post.call_args_list[0].kwargs["data"]["command"] == "INIT"
+    assert sum(c.kwargs["data"]["command"] == "INIT" for c in post.call_args_list) == 1
+
+
+@patch("rate_limiter.time.sleep")
+@patch("twitter_manager.get_oauth1_session")
+def test_failed_append_gives_up_after_the_rate_limiter_attempts(mock_oauth, mock_sleep):
+    tm = TwitterManager(dict(config, TWITTER_CHUNK_SIZE="5"))
+    post = mock_oauth.return_value.post
+    post.side_effect = [
+        upload_response(202, {"media_id_string": "test_media_id"}),
+        upload_response(503),
+        upload_response(503),
+        upload_response(503),
+    ]
+
+    with pytest.raises(Exception, match="APPEND failed with status code 503"):
+        tm.upload_media_chunked(io.BytesIO(b"0123456789"), 10, "image/png")
+
+    assert post.call_count == 4
+
+
+@patch("twitter_manager.time.sleep")
+@patch("twitter_manager.get_oauth1_session")
+def test_chunked_video_upload_waits_for_processing(mock_oauth, mock_sleep):
+    tm = TwitterManager(config)
+    mock_oauth.return_value.post.side_effect = [
+        upload_response(202, {"media_id_string": "test_media_id"}),
+        upload_response(204),
+        upload_response(
+            201, {"processing_info": {"state": "pending", "check_after_secs": 2}}
+        ),
+    ]
+    mock_oauth.return_value.get.side_effect = [
+        upload_response(
+            200, {"processing_info": {"state": "in_progress", "check_after_secs": 3}}
+        ),
+        upload_response(200, {"processing_info": {"state": "succeeded"}}),
+    ]
+
+    assert tm.upload_media_chunked(io.BytesIO(b"video"), 5, "video/mp4")
+
+    init = mock_oauth.return_value.post.call_args_list[0].kwargs["data"]
+    assert init["media_category"] == "tweet_video"
+    assert [c.args[0] for c in mock_sleep.call_args_list] == [2, 3]
+    assert mock_oauth.return_value.get.call_args.kwargs["params"] == {
+        "command": "STATUS",
+        "media_id": "test_media_id",
+    }
+
+
+@patch("twitter_manager.time.sleep")
+@patch("twitter_manager.get_oauth1_session")
+def test_chunked_upload_raises_when_processing_fails(mock_oauth, mock_sleep):
+    tm = TwitterManager(config)
+    mock_oauth.return_value.post.side_effect = [
+        upload_response(202, {"media_id_string": "test_media_id"}),
+        upload_response(204),
+        upload_response(201, {"processing_info": {"state": "pending"}}),
+    ]
+    mock_oauth.return_value.get.return_value = upload_response(
+        200, {"processing_info": {"state": "failed", "error": {"name": "InvalidMedia"}}}
+    )
+
+    with pytest.raises(Exception, match="Media processing failed"):
+        tm.upload_media_chunked(io.BytesIO(b"gif"), 3, "image/gif")
+
+
+@patch("twitter_manager.get_oauth1_session")
+def test_get_tweet_metrics_looks_up_100_tweets_per_request(mock_oauth):
+    tm = TwitterManager(config)
+
+    def lookup(url, params):
+        ids = params["ids"].split(",")
+        response = MagicMock(status_code=200)
+        response.json.return_value = {
+            "data": [
+                {
+                    "id": tweet_id,
+                    "public_metrics": {
+                        "like_count": 3,
+                        "reply_count": 1,
+                        "retweet_count": 2,
+                        "quote_count": 1,
+                        "impression_count": 90,
+                    },
+                }
+                for tweet_id in ids[1:]
+            ],
+            "errors": [{"resource_id": ids[0], "title": "Not Found Error"}],
+        }
+        return response
+
+    mock_oauth.return_value.get.side_effect = lookup
+
+    metrics = tm.get_tweet_metrics([str(i) for i in range(250)])
+
+    calls = mock_oauth.return_value.get.call_args_list
+    assert [len(c.kwargs["params"]["ids"].split(",")) for c in calls] == [100, 100, 50]
+    assert calls[0].kwargs["params"]["tweet.fields"] == "public_metrics"
+    assert len(metrics) == 247
+    assert metrics["1"] == {"likes": 3, "replies": 1, "shares": 3, "impressions": 90}
@@ -0,0 +1,136 @@
+import asyncio
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from unittest.mock import patch
+import pytest
+from worker import Worker, next_slot, parse_slots
+
+
+def at(hour, minute=0, day=1):
+    return datetime(2024, 1, day, hour, minute, tzinfo=timezone.utc)
+
+
+def test_next_slot_from_daily_times():
+    slots = parse_slots("17:30, 09:00")
+
+    assert next_slot(at(8), slots) == at(9)
+    assert next_slot(at(9), slots) == at(17, 30)
+    assert next_slot(at(18), slots) == at(9, day=2)
+
+
+def test_next_slot_from_an_interval():
+    assert next_slot(at(8, 10), interval=30 * 60) == at(8, 30)
+    assert next_slot(at(8, 30), interval=30 * 60) == at(9)
+
+
+async def get_health(worker):
+    port = worker.server.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(b"GET /healthz HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(body)
+
+
+def run_worker(worker, until):
+    """
+    Serve the worker until until() returns a result, then stop it.
+    """
+
+    async def main():
+        task = asyncio.create_task(worker.serve(port=0))
+        while worker.server is None or not worker.server.sockets:
+            await asyncio.sleep(0.01)
+        result = await until()
+        worker.stop()
+        await asyncio.wait_for(task, 5)
+        return result
+
+    return asyncio.run(main())
+
+
+@pytest.fixture(autouse=True)
+def no_cleanup():
+    with patch("worker.storage_manager.wait_for_pending_deletes"), patch(
+        "worker.http_session.close_sessions"
+    ):
+        yield
+
+
+def test_worker_runs_every_slot_and_reports_health():
+    worker = Worker({"WORKER_INTERVAL_MINUTES": str(0.2 / 60)})
+    run_ids = []
+
+    async def until():
+        while len(run_ids) < 2:
+            await asyncio.sleep(0.01)
+        return await get_health(worker)
+
+    with patch.object(Worker, "run_slot", lambda self, run_id: run_ids.append(run_id)):
+        status, health = run_worker(worker, until)
+
+    assert status == 200
+    assert health["status"] == "ok"
+    assert health["last_run"]["ok"]
+    assert run_ids[0] != run_ids[1]
+    assert run_ids[0].startswith("slot-")
+
+
+def test_worker_keeps_one_quote_bot_across_slots():
+    worker = Worker({})
+    with patch("worker.QuoteBot") as mock_quote_bot:
+        worker.run_slot("slot-1")
+        worker.run_slot("slot-2")
+
+    mock_quote_bot.assert_called_once_with({})
+    assert mock_quote_bot.return_value.generate_and_post.call_count == 2
+
+
+def test_sigterm_drains_the_running_slot():
+    worker = Worker({"WORKER_INTERVAL_MINUTES": str(0.05 / 60)})
+    started = threading.Event()
+    finished = []
+
+    def run_slot(self, run_id):
+        started.set()
+        time.sleep(0.3)
+        finished.append(run_id)
+
+    async def until():
+        while not started.is_set():
+            await asyncio.sleep(0.01)
+        worker.stop()
+        return await get_health(worker)
+
+    with patch.object(Worker, "run_slot", run_slot):
+        status, health = run_worker(worker, until)
+
+    assert status == 503
+    assert health["status"] == "draining"
+    assert health["running"]
+    assert len(finished) == 1
+    assert worker.last_run["ok"]
+
+
+def test_failed_slots_are_retried_with_the_same_run_id():
+    worker = Worker(
+        {"WORKER_INTERVAL_MINUTES": str(0.1 / 60), "WORKER_RETRY_DELAY": "0"}
+    )
+    run_ids = []
+
+    def run_slot(self, run_id):
+        run_ids.append(run_id)
+        if len(run_ids) == 1:
+            raise Exception("Publishing failed")
+
+    async def until():
+        while len(run_ids) < 2:
+            await asyncio.sleep(0.01)
+
+    with patch.object(Worker, "run_slot", run_slot):
+        run_worker(worker, until)
+
+    assert run_ids[0] == run_ids[1]
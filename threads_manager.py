@@ -1,44 +1,195 @@
-import os
-import tempfile
-import requests
-from threads import Threads
+import json
+import threading
+from instrumentation import span
+from publisher import PlatformUnavailable
+from mongo_manager import (
+    delete_platform_session,
+    get_platform_session,
+    save_platform_session,
+)
+
+try:
+    from threads import Threads
+except ImportError:
+    Threads = None
+
+try:
+    from cryptography.fernet import Fernet
+except ImportError:
+    Fernet = None
+
+_clients = {}
+_locks = {}
+_lock = threading.Lock()
+
+# Responses Threads rejects a request with before anything is published when
+# the session is no longer logged in.
+AUTH_ERROR_STATUSES = (401, 403)
 
 
 class ThreadsManager:
+    """
+    Publishes to Threads with a logged-in client that is created lazily, on
+    the first post, and reused rather than logging in on every run.
+
+    The client is cached per login for the life of the process. With
+    THREADS_SESSION_KEY set, it is also stored encrypted in MongoDB, so a
+    cold start restores it instead of logging in again. Only the login state,
+    the user ID, token and cookies, is stored. A restored session that is
+    rejected as logged out is dropped and the post is retried after a fresh
+    login; any other failure is not retried, as the post may have been made.
+    """
+
     def __init__(self, config):
         self.config = config
+        self.username = config.get("INSTAGRAM_USERNAME")
+        self.session_id = f"threads:{self.username}"
         self.threads = None
+
+    def thread_quote_and_image(self, quote_without_hashtags, image):
+        threads, restored = self.get_threads()
+        if threads is None:
+            raise PlatformUnavailable("Threads was not set up correctly.")
+
         try:
-            self.threads = Threads(
-                username=config["INSTAGRAM_USERNAME"],
-                password=config["INSTAGRAM_PASSWORD"],
+            return self.create_thread(threads, quote_without_hashtags, image)
+        except Exception as e:
+            if not (restored and is_auth_error(e)):
+                print("An error occurred while interacting with Threads: ", e)
+                return None
+            print(f"The Threads session has expired, logging in again: {e}")
+
+        self.forget_session()
+        threads, _ = self.get_threads()
+        if threads is None:
+            raise PlatformUnavailable("Threads was not set up correctly.")
+        try:
+            return self.create_thread(threads, quote_without_hashtags, image)
+        except Exception as e:
+            print("An error occurred while interacting with Threads: ", e)
+
+    def create_thread(self, threads, caption, image):
+        with span("threads.create_thread"), image.open() as image_file:
+            created_thread = threads.private_api.create_thread(
+                caption=caption,
+                image_file=image_file,
             )
+        print(f"Posted to Threads: {created_thread}")
+        return created_thread
+
+    def get_threads(self):
+        """
+        Return the logged-in client, from the process cache, the stored
+        session or a fresh login, in that order.
+
+        Returns:
+            A tuple of the client, or None if Threads cannot be set up, and
+            whether it was reused rather than freshly logged in.
+        """
+        if self.threads is not None:
+            return self.threads, True
+        if Threads is None:
+            print("The threads package is not installed, Threads is disabled.")
+            return None, False
+
+        with _lock:
+            login_lock = _locks.setdefault(self.session_id, threading.Lock())
+        with login_lock:
+            restored = True
+            threads = _clients.get(self.session_id) or self.restore_session()
+            if threads is None:
+                restored = False
+                threads = self.login()
+                if threads is None:
+                    return None, False
+            _clients[self.session_id] = threads
+
+        self.threads = threads
+        return threads, restored
+
+    def login(self):
+        try:
+            with span("threads.login"):
+                threads = Threads(
+                    username=self.config["INSTAGRAM_USERNAME"],
+                    password=self.config["INSTAGRAM_PASSWORD"],
+                )
         except Exception as e:
             print("An error occurred while setting up Threads: ", e)
+            return None
+
+        fernet = self.get_fernet()
+        if fernet is not None:
+            try:
+                state = json.dumps(export_session(threads)).encode()
+                save_platform_session(self.session_id, fernet.encrypt(state))
+            except Exception as e:
+                print(f"Could not store the Threads session: {e}")
+        return threads
+
+    def restore_session(self):
+        fernet = self.get_fernet()
+        if fernet is None:
+            return None
+        try:
+            with span("threads.restore_session"):
+                data = get_platform_session(self.session_id)
+                if data is None:
+                    return None
+                return import_session(json.loads(fernet.decrypt(data)))
+        except Exception as e:
+            print(f"Could not restore the Threads session: {e}")
+            return None
 
-    def thread_quote_and_image(self, quote_without_hashtags, image_url):
-        if self.threads:
+    def forget_session(self):
+        self.threads = None
+        _clients.pop(self.session_id, None)
+        if self.get_fernet() is not None:
             try:
-                response = requests.get(image_url, stream=True)
-                with tempfile.NamedTemporaryFile(
-                    suffix=".png", delete=False
-                ) as temp_file:
-                    for chunk in response.iter_content(1024):
-                        temp_file.write(chunk)
-                    temp_filename = temp_file.name
+                delete_platform_session(self.session_id)
+            except Exception as e:
+                print(f"Could not delete the Threads session: {e}")
 
-                print(f"Temp file name: {temp_filename}")
+    def get_fernet(self):
+        key = self.config.get("THREADS_SESSION_KEY")
+        if not key:
+            return None
+        if Fernet is None:
+            print("The cryptography package is not installed, sessions are not stored.")
+            return None
+        return Fernet(key)
 
-                with open(temp_filename, "rb") as image_file:
-                    created_thread = self.threads.private_api.create_thread(
-                        caption=quote_without_hashtags,
-                        image_file=image_file,
-                    )
-                print(f"Posted to Threads: {created_thread}")
 
-                os.remove(temp_filename)
+def export_session(threads):
+    """
+    Return the login state of a client: its user ID, token and cookies.
+    """
+    api = threads.private_api
+    return {
+        "user_id": api.user_id,
+        "token": api.authentication_token,
+        "cookies": dict(api.cookies or {}),
+    }
 
-            except Exception as e:
-                print("An error occurred while interacting with Threads: ", e)
-        else:
-            print("Threads was not set up correctly.")
+
+def import_session(state):
+    """
+    Create a client from a stored login state, without logging in.
+    """
+    threads = Threads()
+    api = threads.private_api
+    api.user_id = state["user_id"]
+    api.authentication_token = state["token"]
+    api.cookies = state["cookies"]
+    return threads
+
+
+def is_auth_error(error):
+    """
+    Whether Threads refused the request because the session is logged out,
+    in which case nothing was published.
+    """
+    response = getattr(error, "response", None)
+    if getattr(response, "status_code", None) in AUTH_ERROR_STATUSES:
+        return True
+    return "login_required" in str(error)
@@ -1,22 +1,52 @@
-import requests
-import re
 import base64
-from requests_oauthlib import OAuth1Session
+import time
+from config import get_float, get_int
+from http_session import get_oauth1_session
+from instrumentation import span
+from rate_limiter import RateLimiter
+
+# The simple upload endpoint rejects images larger than 5 MB.
+SIMPLE_UPLOAD_MAX_BYTES = 5 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+# The tweet lookup endpoint accepts up to 100 IDs per request.
+TWEET_LOOKUP_MAX_IDS = 100
 
 
 class TwitterManager:
     def __init__(self, config):
         self.config = config
-        self.oauth_v1 = OAuth1Session(
+        self.oauth_v1 = get_oauth1_session(
             config["TWITTER_API_KEY"],
             config["TWITTER_API_SECRET"],
-            resource_owner_key=config["TWITTER_ACCESS_TOKEN"],
-            resource_owner_secret=config["TWITTER_ACCESS_TOKEN_SECRET"],
+            config["TWITTER_ACCESS_TOKEN"],
+            config["TWITTER_ACCESS_TOKEN_SECRET"],
+        )
+        self.rate_limiter = RateLimiter(config)
+        self.api_url = config.get("TWITTER_API_URL") or "https://api.twitter.com"
+        self.upload_url = (
+            config.get("TWITTER_UPLOAD_URL") or "https://upload.twitter.com"
         )
 
-    def upload_media(self, image_url):
-        response = requests.get(image_url)
-        image_data = response.content
+    def upload_media(self, image):
+        """
+        Upload an image, using the chunked upload for media larger than
+        TWITTER_CHUNKED_UPLOAD_THRESHOLD bytes and for animated GIFs.
+
+        Returns:
+            The media ID string.
+        """
+        threshold = get_int(
+            self.config, "TWITTER_CHUNKED_UPLOAD_THRESHOLD", SIMPLE_UPLOAD_MAX_BYTES
+        )
+        if (
+            image.size > threshold
+            or media_category(image.content_type) != "tweet_image"
+        ):
+            return self.upload_media_chunked(
+                image.open(), image.size, image.content_type
+            )
+
+        image_data = image.data
 
         headers = {
             "Authorization": f"Bearer {self.config['TWITTER_BEARER_TOKEN']}",
@@ -25,11 +55,16 @@ class TwitterManager:
             "media": image_data,
         }
 
-        upload_response = self.oauth_v1.post(
-            "https://upload.twitter.com/1.1/media/upload.json",
-            headers=headers,
-            files=files,
-        )
+        with span("twitter.upload") as s:
+            upload_response = self.rate_limiter.request(
+                self.oauth_v1,
+                "post",
+                f"{self.upload_url}/1.1/media/upload.json",
+                "twitter.upload",
+                headers=headers,
+                files=files,
+            )
+            s.set(status=upload_response.status_code, bytes=len(image_data))
 
         if upload_response.status_code != 200:
             raise Exception(
@@ -38,15 +73,119 @@ class TwitterManager:
 
         return upload_response.json().get("media_id_string")
 
-    def tweet_quote_and_image(self, quote, image_url):
-        media_id = self.upload_media(image_url)
-        print(f"Uploaded media ID: {media_id}")
+    def upload_media_chunked(self, stream, total_bytes, media_type):
+        """
+        Upload media with the INIT/APPEND/FINALIZE flow, reading it from a
+        binary stream one chunk at a time, so each request carries at most
+        TWITTER_CHUNK_SIZE bytes rather than the whole media. The image
+        artifact is already in memory, so this bounds the request bodies, not
+        the memory of the process.
+
+        A failed APPEND is retried on its own by the rate limiter, without
+        restarting the upload. For GIFs and videos, the processing status is
+        polled until the media is ready.
+
+        Returns:
+            The media ID string.
+        """
+        chunk_size = get_int(self.config, "TWITTER_CHUNK_SIZE", CHUNK_SIZE)
+
+        with span("twitter.upload", bytes=total_bytes, chunked=True) as s:
+            response = self.upload_command(
+                "INIT",
+                data={
+                    "command": "INIT",
+                    "total_bytes": total_bytes,
+                    "media_type": media_type,
+                    "media_category": media_category(media_type),
+                },
+            )
+            media_id = response.json()["media_id_string"]
+
+            segment_index = 0
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                # Appending the same segment again replaces it, so the
+                # request is safe to retry.
+                self.upload_command(
+                    "APPEND",
+                    idempotent=True,
+                    data={
+                        "command": "APPEND",
+                        "media_id": media_id,
+                        "segment_index": segment_index,
+                    },
+                    files={"media": chunk},
+                )
+                segment_index += 1
+            s.set(segments=segment_index)
+
+            response = self.upload_command(
+                "FINALIZE", data={"command": "FINALIZE", "media_id": media_id}
+            )
+            self.wait_for_processing(
+                media_id, response.json().get("processing_info"), s
+            )
 
-        quote_without_hashtags = re.sub(r"#\S+", "", quote)
+        return media_id
+
+    def wait_for_processing(self, media_id, processing_info, upload_span):
+        deadline = time.monotonic() + get_float(
+            self.config, "TWITTER_PROCESSING_DEADLINE", 120
+        )
+        while processing_info and processing_info.get("state") in (
+            "pending",
+            "in_progress",
+        ):
+            if time.monotonic() >= deadline:
+                raise Exception(f"Media {media_id} is still processing")
+            time.sleep(processing_info.get("check_after_secs", 1))
+            response = self.upload_command(
+                "STATUS",
+                method="get",
+                params={"command": "STATUS", "media_id": media_id},
+            )
+            processing_info = response.json().get("processing_info")
+
+        if processing_info:
+            upload_span.set(processing_state=processing_info.get("state"))
+            if processing_info.get("state") == "failed":
+                raise Exception(
+                    f"Media processing failed: {processing_info.get('error')}"
+                )
+
+    def upload_command(self, command, method="post", idempotent=None, **kwargs):
+        response = self.rate_limiter.request(
+            self.oauth_v1,
+            method,
+            f"{self.upload_url}/1.1/media/upload.json",
+            "twitter.upload",
+            idempotent=idempotent,
+            **kwargs,
+        )
+        if not 200 <= response.status_code < 300:
+            raise Exception(
+                f"Media upload {command} failed with status code {response.status_code}, response {response.text}"
+            )
+        return response
+
+    def tweet_quote_and_image(self, quote, image):
+        media_id = self.upload_media(image)
+        print(f"Uploaded media ID: {media_id}")
 
         payload = {"text": quote, "media": {"media_ids": [media_id]}}
 
-        response = self.oauth_v1.post("https://api.twitter.com/2/tweets", json=payload)
+        with span("twitter.tweet") as s:
+            response = self.rate_limiter.request(
+                self.oauth_v1,
+                "post",
+                f"{self.api_url}/2/tweets",
+                "twitter.tweet",
+                json=payload,
+            )
+            s.set(status=response.status_code)
 
         if response.status_code != 201:
             raise Exception(
@@ -55,4 +194,50 @@ class TwitterManager:
 
         print(f"Tweeted: {quote}")
 
-        return quote_without_hashtags, image_url
+        return response.json().get("data", {})
+
+    def get_tweet_metrics(self, tweet_ids):
+        """
+        Look up the public metrics of tweets, TWEET_LOOKUP_MAX_IDS per request.
+
+        Returns:
+            A dictionary mapping each tweet ID found to its "likes", "replies",
+            "shares" and "impressions".
+        """
+        metrics = {}
+        for start in range(0, len(tweet_ids), TWEET_LOOKUP_MAX_IDS):
+            ids = tweet_ids[start : start + TWEET_LOOKUP_MAX_IDS]
+            with span("twitter.tweet_lookup", tweets=len(ids)) as s:
+                response = self.rate_limiter.request(
+                    self.oauth_v1,
+                    "get",
+                    f"{self.api_url}/2/tweets",
+                    "twitter.tweet_lookup",
+                    params={"ids": ",".join(ids), "tweet.fields": "public_metrics"},
+                )
+                s.set(status=response.status_code)
+
+            if response.status_code != 200:
+                raise Exception(
+                    f"Tweet lookup failed with status code {response.status_code}, response {response.text}"
+                )
+
+            # Deleted tweets are reported under "errors" and left out.
+            for tweet in response.json().get("data", []):
+                public_metrics = tweet.get("public_metrics", {})
+                metrics[tweet["id"]] = {
+                    "likes": public_metrics.get("like_count", 0),
+                    "replies": public_metrics.get("reply_count", 0),
+                    "shares": public_metrics.get("retweet_count", 0)
+                    + public_metrics.get("quote_count", 0),
+                    "impressions": public_metrics.get("impression_count", 0),
+                }
+        return metrics
+
+
+def media_category(media_type):
+    if media_type == "image/gif":
+        return "tweet_gif"
+    if media_type and media_type.startswith("video/"):
+        return "tweet_video"
+    return "tweet_image"
@@ -0,0 +1,245 @@
+"""
+Long-running worker mode.
+
+Runs the bot as a persistent process (a Cloud Run service with a minimum of
+one instance, or a local daemon) instead of one Cloud Function execution per
+post. Post slots are scheduled in-process with asyncio, so the OpenAI,
+MongoDB, storage and HTTP clients, the Threads session and the quote caches
+stay warm between posts. GET /healthz reports the worker's state, and SIGTERM
+stops scheduling new slots and waits for a running one to finish.
+
+Run a single worker replica: slots are not claimed across processes.
+
+Usage:
+    python -m worker
+"""
+
+import asyncio
+import json
+import math
+import signal
+from datetime import datetime, time, timedelta, timezone
+import http_session
+import instrumentation
+import storage_manager
+from config import get_bool, get_config, get_float, get_int
+from quote_bot import QuoteBot
+from scheduler import AccountScheduler, load_accounts
+
+
+def parse_slots(value):
+    """
+    Parse a "HH:MM,HH:MM" setting of daily UTC post times.
+    """
+    slots = []
+    for item in (value or "").split(","):
+        if item.strip():
+            hour, _, minute = item.strip().partition(":")
+            slots.append(time(int(hour), int(minute or 0), tzinfo=timezone.utc))
+    return sorted(slots)
+
+
+def next_slot(now, slots=(), interval=24 * 60 * 60):
+    """
+    Return the first post time after now: the next of the daily slots, or
+    else the next multiple of interval seconds since the epoch, so a
+    restarted worker keeps the same schedule.
+    """
+    if slots:
+        for days in range(2):
+            day = (now + timedelta(days=days)).date()
+            for slot in slots:
+                at = datetime.combine(day, slot)
+                if at > now:
+                    return at
+    timestamp = now.timestamp()
+    return datetime.fromtimestamp(
+        (math.floor(timestamp / interval) + 1) * interval, timezone.utc
+    )
+
+
+class Worker:
+    """
+    Publishes a post at every slot with one long-lived QuoteBot, or runs the
+    due accounts with WORKER_ACCOUNTS, and serves a health endpoint.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.slots = parse_slots(config.get("WORKER_SLOTS"))
+        self.interval = 60 * get_float(config, "WORKER_INTERVAL_MINUTES", 24 * 60)
+        self.retry_attempts = get_int(config, "WORKER_RETRY_ATTEMPTS", 3)
+        self.retry_delay = get_float(config, "WORKER_RETRY_DELAY", 60)
+        self.drain_timeout = get_float(config, "WORKER_DRAIN_TIMEOUT", 60)
+        self.quote_bot = None
+        self.scheduler = None
+        self.server = None
+        self.stopping = None
+        self.running = None
+        self.next_run = None
+        self.last_run = None
+
+    def run_slot(self, run_id):
+        """
+        Publish the post of one slot. The slot time is the run ID, so a retry
+        or a restarted worker resumes the slot from its checkpoints.
+        """
+        with instrumentation.run(
+            "worker",
+            enabled=get_bool(self.config, "INSTRUMENTATION_ENABLED"),
+            run_id=run_id,
+        ):
+            if get_bool(self.config, "WORKER_ACCOUNTS"):
+                if self.scheduler is None:
+                    self.scheduler = AccountScheduler(
+                        self.config, load_accounts(self.config)
+                    )
+                results = self.scheduler.run(run_id)
+                failed = [a for a, result in results.items() if not result["ok"]]
+                if failed:
+                    raise Exception(f"Accounts failed: {', '.join(failed)}")
+                return results
+
+            if self.quote_bot is None:
+                self.quote_bot = QuoteBot(self.config)
+            if get_bool(self.config, "POST_QUEUE_ENABLED"):
+                results = self.quote_bot.publish_next(run_id)
+                self.quote_bot.top_up_queue()
+            else:
+                results = self.quote_bot.generate_and_post(run_id)
+            return results
+
+    async def serve(self, port=None):
+        """
+        Run the scheduler and the health endpoint until SIGTERM or SIGINT,
+        then drain.
+        """
+        loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(signum, self.stop)
+            except (NotImplementedError, RuntimeError):
+                # Not on the main thread, or not supported by the platform.
+                pass
+
+        self.server = await asyncio.start_server(
+            self.handle_health,
+            "0.0.0.0",
+            get_int(self.config, "PORT", 8080) if port is None else port,
+        )
+        try:
+            await self.schedule()
+        finally:
+            self.server.close()
+            await self.server.wait_closed()
+            if self.running is None or self.running.done():
+                await asyncio.to_thread(storage_manager.wait_for_pending_deletes)
+                http_session.close_sessions()
+
+    def stop(self):
+        if not self.stopping.is_set():
+            print("Stopping the worker after the running slot.")
+            self.stopping.set()
+
+    async def schedule(self):
+        while not self.stopping.is_set():
+            self.next_run = next_slot(
+                datetime.now(timezone.utc), self.slots, self.interval
+            )
+            delay = (self.next_run - datetime.now(timezone.utc)).total_seconds()
+            if await self.wait_for_stop(delay):
+                return
+
+            self.running = asyncio.create_task(self.run_with_retries(self.next_run))
+            stop = asyncio.create_task(self.stopping.wait())
+            await asyncio.wait(
+                {self.running, stop}, return_when=asyncio.FIRST_COMPLETED
+            )
+            stop.cancel()
+            if not self.running.done():
+                await self.drain()
+                return
+            self.running = None
+
+    async def drain(self):
+        """
+        Give the running slot WORKER_DRAIN_TIMEOUT seconds to finish. Past
+        that, the process still exits once the slot's thread returns, unless
+        the platform kills it first; a slot cut short resumes from its
+        checkpoints on the next start.
+        """
+        try:
+            await asyncio.wait_for(asyncio.shield(self.running), self.drain_timeout)
+        except asyncio.TimeoutError:
+            print(f"The running slot did not finish in {self.drain_timeout}s.")
+
+    async def wait_for_stop(self, delay):
+        """
+        Sleep for delay seconds, returning True early if the worker is stopping.
+        """
+        try:
+            await asyncio.wait_for(self.stopping.wait(), max(0, delay))
+            return True
+        except asyncio.TimeoutError:
+            return self.stopping.is_set()
+
+    async def run_with_retries(self, slot):
+        run_id = f"slot-{slot.isoformat()}"
+        for attempt in range(1, self.retry_attempts + 1):
+            try:
+                await asyncio.to_thread(self.run_slot, run_id)
+                self.last_run = {"slot": slot, "ok": True, "error": None}
+                return
+            except Exception as e:
+                print(f"Slot {slot.isoformat()} failed (attempt {attempt}): {e}")
+                self.last_run = {"slot": slot, "ok": False, "error": str(e)}
+            if attempt < self.retry_attempts and await self.wait_for_stop(
+                self.retry_delay * attempt
+            ):
+                return
+
+    def health(self):
+        """
+        Returns:
+            The HTTP status and body of the health endpoint: 503 while
+            draining so no new traffic is routed here, 200 otherwise.
+        """
+        draining = self.stopping is not None and self.stopping.is_set()
+        body = {
+            "status": "draining" if draining else "ok",
+            "running": self.running is not None and not self.running.done(),
+            "next_run": self.next_run,
+            "last_run": self.last_run,
+        }
+        return (503 if draining else 200), body
+
+    async def handle_health(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()).strip():
+                pass
+            path = request_line.split()[1].decode() if request_line.split() else ""
+            if path.split("?")[0] in ("/healthz", "/"):
+                status, body = self.health()
+            else:
+                status, body = 404, {"error": "not found"}
+            payload = json.dumps(body, default=str).encode("utf-8")
+            reason = {200: "OK", 404: "Not Found", 503: "Service Unavailable"}
+            writer.write(
+                f"HTTP/1.1 {status} {reason[status]}\r\n"
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                "Connection: close\r\n\r\n".encode() + payload
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+
+def main():
+    asyncio.run(Worker(get_config()).serve())
+
+
+if __name__ == "__main__":
+    main()